@@ -0,0 +1,555 @@
+import json
+import math
+import os
+
+from sims   import characterize             # Los g y p de logical effort de la tecnologia
+
+# =============================================================================
+# Descripción declarativa de una ruta
+#
+# Una ruta es una lista de compuertas (clases de tech: Inversor, Nand, Nor)
+# en orden topológico. Cada compuerta tiene:
+#   name    - Su nombre, también es el nombre de su salida
+#   type    - La clase en tech
+#   inputs  - Sus entradas, cada una puede ser:
+#               'in'            - la entrada de la ruta
+#               'vdd' / 'gnd'   - un valor fijo
+#               una compuerta anterior
+#               una entrada lateral (side_inputs), con su propia fuente
+#   group   - Las compuertas del mismo grupo tienen el mismo ancho (un ancho
+#             de get_widths por grupo). Por defecto cada compuerta tiene su
+#             propio grupo.
+#   width   - Un ancho fijo (en W_MIN) en lugar de un grupo: la compuerta no
+#             se dimensiona (e.g. una rama fuera de la ruta)
+#
+# Además:
+#   output      - La compuerta de la salida de la ruta (maneja la carga)
+#   side_inputs - Las entradas laterales y su valor lógico (0 / 1), el que
+#                 deja que la entrada de la ruta cambie la salida
+#   branches    - Cargas fuera de la ruta: nodo: carga en W_MIN (un inversor)
+#   load        - La carga por defecto de la salida (en W_MIN)
+#
+# La ruta principal (la del Tp) va desde 'in' hasta output: desde output
+# seguimos hacia atrás la primera entrada que depende de 'in'. Las demás
+# compuertas que manejan los nodos de la ruta son ramas.
+#
+# En un archivo JSON (ver load_spec_file) es un dict con estas llaves, e.g.:
+#   {"name": "nand_inv_branch",
+#    "gates": [{"name": "0", "type": "Nand", "inputs": ["in", "B0"]},
+#              {"name": "1", "type": "Inversor", "inputs": ["0"]},
+#              {"name": "2", "type": "Inversor", "inputs": ["0"], "width": 4}],
+#    "output": "1",
+#    "side_inputs": {"B0": 1},
+#    "branches": {"1": 2.0},
+#    "load": 32.0}
+#
+# Logical effort con ramas (ver logical_effort_notes.txt):
+#   b = (Con_path + Coff_path) / Con_path, B = Πb y F = G·B·H
+# Cuando b no depende de los anchos el óptimo es f = F^(1/N) en cada etapa,
+# pero una rama fija (una carga o una compuerta de ancho fijo) cambia eso,
+# así get_logical_effort_optimal_widths minimiza el retardo directamente
+# (ver el comentario allí).
+# =============================================================================
+
+# Las entradas que no son compuertas ni entradas laterales
+PATH_INPUT  = 'in'
+CONSTANTS   = {'vdd': True, 'gnd': False}
+
+# El número de entradas de cada compuerta. Las que no están en inputs van al
+# valor que no controla la salida (NOT_CONTROLLING)
+GATE_INPUTS     = {'Inversor': 1, 'Nand': 2, 'Nor': 2}
+NOT_CONTROLLING = {'Nand': 'vdd', 'Nor': 'gnd'}
+
+# La carga por defecto de la salida (en W_MIN)
+DEFAULT_LOAD = 32.0
+
+# La minimización de get_logical_effort_optimal_widths: el máximo de
+# pasadas y el cambio relativo de los anchos para parar
+_MAX_SWEEPS = 200
+_TOLERANCE  = 1e-9
+
+""" PathSpec:
+        La descripción de una ruta (ver el comentario al comienzo).
+        Comprueba la descripción y lanza ValueError si no es válida.
+
+        argumentos:
+            name        - El nombre de la ruta (e.g. "nand_chain_5")
+            gates       - Una lista de dicts: name, type, inputs y opcionales
+                          group o width
+            output      - La compuerta de la salida
+            side_inputs - Un dict de entrada lateral: valor (0 / 1)
+            branches    - Un dict de nodo: carga en W_MIN
+            load        - La carga por defecto de la salida (en W_MIN)
+"""
+
+class PathSpec:
+
+    def __init__(self, name, gates, output, side_inputs=None, branches=None, load=DEFAULT_LOAD):
+        self.__name         = name
+        self.__gates        = []
+        self.__output       = output
+        self.__sideInputs   = dict((key, bool(value)) for (key, value) in (side_inputs or {}).items())
+        self.__branches     = dict((key, float(value)) for (key, value) in (branches or {}).items())
+        self.__load         = float(load)
+        self.__groups       = []        # Los grupos en orden, uno por ancho
+        self.__groupTypes   = {}
+        self.__byName       = {}
+        self.__fanouts      = {}        # nodo: compuertas que maneja (una vez por entrada)
+        self.__stages       = {}        # (tech, carga): etapas de logical effort (ver __get_stages)
+
+        for gate in gates:
+            self.__add_gate(gate)
+
+        if (output not in self.__byName):
+            raise ValueError("Path %s: output %s is not a gate" % (name, output))
+        for node in self.__branches:
+            if (node not in self.__byName):
+                raise ValueError("Path %s: branch node %s is not a gate" % (name, node))
+
+        self.__mainPath = self.__find_main_path()
+        if ('group' not in self.__byName[self.__mainPath[0]]):
+            raise ValueError("Path %s: the first gate of the path can't have a fixed width" % name)
+
+        outputs = (self.evaluate(False)[output], self.evaluate(True)[output])
+        if (outputs[0] == outputs[1]):
+            raise ValueError("Path %s: the input doesn't propagate to the output" % name)
+        self.__inverts = outputs[1] == False
+
+    def __add_gate(self, gate):
+        name = str(gate['name'])
+        gateType = gate['type']
+        inputs = [str(inName) for inName in gate['inputs']]
+
+        if ((name in self.__byName) or (name in CONSTANTS) or (name == PATH_INPUT) or (name in self.__sideInputs)):
+            raise ValueError("Path %s: gate name %s is already used" % (self.__name, name))
+        if (gateType not in characterize.GATES):
+            raise ValueError("Path %s: gate %s has unknown type %s" % (self.__name, name, gateType))
+        if ((len(inputs) == 0) or (len(inputs) > GATE_INPUTS[gateType])):
+            raise ValueError("Path %s: gate %s (%s) has %d inputs" % (self.__name, name, gateType, len(inputs)))
+        for inName in inputs:
+            if ((inName not in self.__byName) and (inName not in CONSTANTS) and (inName != PATH_INPUT) and
+                (inName not in self.__sideInputs)):
+                raise ValueError("Path %s: input %s of gate %s is not defined before it" % (self.__name, inName, name))
+
+        entry = {'name': name, 'type': gateType, 'inputs': inputs}
+        if (gate.get('width') != None):
+            if ('group' in gate):
+                raise ValueError("Path %s: gate %s has a group and a fixed width" % (self.__name, name))
+            entry['width'] = float(gate['width'])
+        else:
+            group = str(gate.get('group', name))
+            if (group not in self.__groupTypes):
+                self.__groups.append(group)
+                self.__groupTypes[group] = gateType
+            elif (self.__groupTypes[group] != gateType):
+                raise ValueError("Path %s: group %s mixes %s and %s" % (self.__name, group,
+                                                                       self.__groupTypes[group], gateType))
+            entry['group'] = group
+
+        self.__gates.append(entry)
+        self.__byName[name] = entry
+        for inName in inputs:
+            self.__fanouts.setdefault(inName, []).append(entry)
+
+    # Desde output hacia atrás, la primera entrada que depende de 'in'
+    def __find_main_path(self):
+        depends = {PATH_INPUT: True}
+        for gate in self.__gates:
+            depends[gate['name']] = any(depends.get(inName, False) for inName in gate['inputs'])
+
+        path = []
+        node = self.__output
+        while (node != PATH_INPUT):
+            if (not depends[node]):
+                raise ValueError("Path %s: the output doesn't depend on the input" % self.__name)
+            path.append(node)
+            node = next(inName for inName in self.__byName[node]['inputs'] if (depends.get(inName, False)))
+        path.reverse()
+        return path
+
+    def get_name(self):
+        return self.__name
+
+    # Los dicts de las compuertas en orden (no los cambies)
+    def get_gates(self):
+        return self.__gates
+
+    def get_gate(self, name):
+        return self.__byName[name]
+
+    def get_output(self):
+        return self.__output
+
+    # Las entradas laterales en orden: una lista de (nombre, valor)
+    def get_side_inputs(self):
+        return list(self.__sideInputs.items())
+
+    def get_branches(self):
+        return self.__branches
+
+    def get_load(self):
+        return self.__load
+
+    # Los grupos (uno por ancho) en orden
+    def get_groups(self):
+        return self.__groups
+
+    # La clase de las compuertas de cada grupo, en el orden de get_groups
+    def get_group_types(self):
+        return [self.__groupTypes[group] for group in self.__groups]
+
+    # Las compuertas de la ruta principal, desde la entrada hasta output
+    def get_main_path(self):
+        return self.__mainPath
+
+    # Las compuertas que maneja un nodo (una vez por cada entrada conectada)
+    def get_fanouts(self, node):
+        return self.__fanouts.get(node, [])
+
+    # Un flanco ascendente en la entrada da un flanco descendente en la salida?
+    def inverts(self):
+        return self.__inverts
+
+    # Una cadena simple: cada compuerta es una etapa de la ruta principal con
+    # su propio grupo y no hay ramas (así sirve nldm.estimate_chain_delay)
+    def is_chain(self):
+        return ((len(self.__branches) == 0) and (len(self.__gates) == len(self.__mainPath)) and
+                (len(self.__groups) == len(self.__gates)) and
+                all(len(self.get_fanouts(name)) == 1 for name in self.__mainPath[:-1]) and
+                (len(self.get_fanouts(self.__output)) == 0))
+
+    # Los valores lógicos de todos los nodos con la entrada inValue
+    #   sideValues  - Los valores de las entradas laterales (en el orden de
+    #                 get_side_inputs), None para sus valores por defecto
+    def evaluate(self, inValue, sideValues=None):
+        values = dict(CONSTANTS)
+        values[PATH_INPUT] = bool(inValue)
+        for (k, (name, value)) in enumerate(self.__sideInputs.items()):
+            values[name] = value if (sideValues == None) else bool(sideValues[k])
+
+        for gate in self.__gates:
+            inValues = [values[inName] for inName in gate['inputs']]
+            values[gate['name']] = _get_output_value(gate['type'], inValues)
+        return values
+
+    # =================
+    # Logical effort
+    # =================
+
+    # El ancho de cada compuerta (dict) con los anchos de los grupos widths
+    def get_gate_widths(self, tech, widths):
+        groupWidths = dict(zip(self.__groups, widths))
+        return dict((gate['name'], groupWidths[gate['group']] if ('group' in gate) else gate['width'] * tech.W_MIN)
+                    for gate in self.__gates)
+
+    # Las etapas de la ruta principal para logical effort, cada una:
+    #   driver  - El índice del grupo de la compuerta (None si es fija)
+    #   width   - El ancho fijo (si driver es None)
+    #   p       - Su retardo parásito
+    #   loads   - [(coef, índice del grupo), ...]: la capacitancia de las
+    #             compuertas dimensionables que maneja (g·w, ramas incluidas)
+    #   fixed   - La capacitancia fija que maneja: compuertas de ancho fijo,
+    #             ramas y la carga (en anchos de inversor)
+    #   onPath  - (coef, grupo) o capacitancia fija de la siguiente etapa
+    #             (None para la última, así onPath es la carga)
+    # Cada compuerta es g·h + p = Cout / w + p, con Cout = Σ coef·w + fixed.
+    # Se calculan una vez por tecnologia y carga.
+    def __get_stages(self, tech, load):
+        key = (tech.__name__, load)
+        if (key in self.__stages):
+            return self.__stages[key]
+
+        index = dict((group, idx) for (idx, group) in enumerate(self.__groups))
+        (gInv, pInv) = characterize.get_gate_parameters(tech, 'Inversor')
+
+        # La capacitancia de una entrada de gate: (coef, grupo) o fija
+        def get_input_load(gate):
+            g = characterize.get_gate_parameters(tech, gate['type'])[0]
+            if ('group' in gate):
+                return (g, index[gate['group']], 0.0)
+            return (0.0, None, g * gate['width'] * tech.W_MIN)
+
+        stages = []
+        for (k, name) in enumerate(self.__mainPath):
+            gate = self.__byName[name]
+            (g, p) = characterize.get_gate_parameters(tech, gate['type'])
+            fixed = gInv * self.__branches.get(name, 0.0) * tech.W_MIN
+            loads = []
+            for fanout in self.get_fanouts(name):
+                (coef, idx, cap) = get_input_load(fanout)
+                fixed += cap
+                if (idx != None):
+                    loads.append((coef, idx))
+
+            if (k + 1 < len(self.__mainPath)):
+                onPath = get_input_load(self.__byName[self.__mainPath[k + 1]])
+            else:
+                onPath = (0.0, None, gInv * load * tech.W_MIN)
+                fixed += onPath[2]
+
+            stages.append({'driver':    index.get(gate.get('group')),
+                           'width':     gate.get('width', 0.0) * tech.W_MIN,
+                           'p':         p,
+                           'loads':     loads,
+                           'fixed':     fixed,
+                           'onPath':    onPath})
+
+        self.__stages[key] = stages
+        return stages
+
+    # La capacitancia Cout de una etapa y el ancho de su compuerta
+    def __get_stage_load(self, stage, widths):
+        cOut = stage['fixed']
+        for (coef, idx) in stage['loads']:
+            cOut += coef * widths[idx]
+        w = stage['width'] if (stage['driver'] == None) else widths[stage['driver']]
+        return (cOut, w)
+
+    # El retardo de la ruta principal con los anchos widths según logical
+    # effort, en unidades de tau: d = Σ(g·h + p), con h = Cout / Cin y Cout
+    # incluye las ramas. Solo sirve para comparar anchos, no es el Tp.
+    def get_logical_effort_delay(self, tech, widths, load=None):
+        load = self.__load if (load == None) else load
+        d = 0.0
+        for stage in self.__get_stages(tech, load):
+            (cOut, w) = self.__get_stage_load(stage, widths)
+            d += cOut / w + stage['p']
+        return d
+
+    # Los anchos de la ruta principal (hacia atrás desde la carga) con el
+    # mismo esfuerzo f = g·h = Cout / w en todas las etapas
+    def __get_equal_effort_widths(self, tech, f, load):
+        widths = [tech.W_MIN] * len(self.__groups)
+        for stage in reversed(self.__get_stages(tech, load)):
+            (cOut, w) = self.__get_stage_load(stage, widths)
+            if (stage['driver'] != None):
+                widths[stage['driver']] = cOut / f
+        return widths
+
+    # El esfuerzo por etapa con que la primera compuerta de la ruta tiene ancho
+    # W_MIN (bisección en log f, el ancho de la primera baja cuando f sube)
+    def __get_stage_effort(self, tech, load):
+        first = self.__get_stages(tech, load)[0]['driver']
+        (lo, hi) = (math.log(1e-3), math.log(1e4))
+        for i in range(100):
+            mid = (lo + hi) / 2
+            if (self.__get_equal_effort_widths(tech, math.exp(mid), load)[first] > tech.W_MIN):
+                lo = mid
+            else:
+                hi = mid
+        return math.exp((lo + hi) / 2)
+
+    # Los anchos de una ruta donde cada etapa tiene su propio grupo y solo
+    # la siguiente etapa (y sus copias del mismo grupo) es dimensionable:
+    # Cout(i) = a(i)·w(i+1) + c(i). El óptimo tiene f(i+1) = a(i)·w(i+1) / w(i)
+    # (f(i+1) = f(i) / b(i)), así desde w(0) = W_MIN y un w(1) calculamos todos
+    # los anchos hacia adelante, y buscamos (bisección en log w(1)) el w(1)
+    # con que la última etapa maneja exactamente su carga.
+    # Devuelve None si la ruta no tiene esta forma.
+    def __get_shooting_widths(self, tech, stages):
+        drivers = [stage['driver'] for stage in stages]
+        if ((None in drivers) or (len(set(drivers)) < len(drivers))):
+            return None
+
+        (a, c) = ([], [])
+        for (k, stage) in enumerate(stages):
+            nextGroup = drivers[k + 1] if (k + 1 < len(stages)) else None
+            (coef, fixed) = (0.0, stage['fixed'])
+            for (cj, j) in stage['loads']:
+                if (j == nextGroup):
+                    coef += cj
+                elif (j in drivers):
+                    return None
+                else:
+                    fixed += cj * tech.W_MIN
+            a.append(coef)
+            c.append(fixed)
+
+        N = len(stages)
+        widths = [tech.W_MIN] * len(self.__groups)
+        if (N == 1):
+            return widths
+
+        # Devuelve los anchos y Cout - c de la última etapa (< 0 si w1 es chico)
+        def shoot(w1):
+            w = [tech.W_MIN, w1]
+            for i in range(1, N - 1):
+                f = a[i - 1] * w[i] / w[i - 1]
+                w.append((f * w[i] - c[i]) / a[i])
+                if (w[-1] <= 0):
+                    return (None, -1.0)
+            return (w, a[N - 2] * w[N - 1] * w[N - 1] / w[N - 2] - c[N - 1])
+
+        (lo, hi) = (math.log(tech.W_MIN * 1e-6), math.log(tech.W_MIN * 1e9))
+        if (shoot(math.exp(hi))[1] < 0):
+            return None
+        for i in range(200):
+            mid = (lo + hi) / 2
+            if (shoot(math.exp(mid))[1] < 0):
+                lo = mid
+            else:
+                hi = mid
+
+        (w, error) = shoot(math.exp(hi))
+        for (idx, width) in zip(drivers, w):
+            widths[idx] = width
+        return widths
+
+    # Los anchos (uno por grupo) que minimizan get_logical_effort_delay con
+    # la primera etapa en W_MIN y los demás anchos >= W_MIN.
+    #
+    # Con el mismo esfuerzo en todas las etapas, f = F^(1/N), es el óptimo
+    # cuando b no depende de los anchos (e.g. una cadena o un árbol de copias
+    # del mismo grupo). Con ramas fijas el óptimo tiene f(i+1) = f(i) / b(i)
+    # (ver __get_shooting_widths). Comenzamos con eso (o con el mismo esfuerzo
+    # si la ruta tiene otra forma) y después minimizamos un grupo a la vez:
+    # el retardo con los demás fijos es A / w + B·w + C, con mínimo en
+    # w = sqrt(A / B). Es una función convexa en log(w), así converge, pero
+    # en una ruta larga solo así converge muy lentamente.
+    def get_logical_effort_optimal_widths(self, tech, load=None):
+        load = self.__load if (load == None) else load
+        stages = self.__get_stages(tech, load)
+        first = stages[0]['driver']
+        widths = self.__get_shooting_widths(tech, stages)
+        if (widths == None):
+            widths = self.__get_equal_effort_widths(tech, self.__get_stage_effort(tech, load), load)
+        widths[first] = tech.W_MIN
+        widths = [max(w, tech.W_MIN) for w in widths]
+
+        # Las etapas donde aparece cada grupo (maneja o es carga)
+        related = [[] for w in widths]
+        for stage in stages:
+            for idx in set([stage['driver']] + [j for (c, j) in stage['loads']]):
+                if (idx != None):
+                    related[idx].append(stage)
+
+        for sweep in range(_MAX_SWEEPS):
+            change = 0.0
+            for idx in range(len(widths)):
+                if (idx == first):
+                    continue
+                (A, B) = (0.0, 0.0)
+                for stage in related[idx]:
+                    (cOut, w) = self.__get_stage_load(stage, widths)
+                    coef = sum(c for (c, j) in stage['loads'] if (j == idx))
+                    if (stage['driver'] == idx):
+                        A += cOut - coef * widths[idx]
+                    elif (coef > 0):
+                        B += coef / w
+                if ((A <= 0) or (B <= 0)):
+                    w = tech.W_MIN if (A <= 0) else widths[idx]
+                else:
+                    w = max(tech.W_MIN, math.sqrt(A / B))
+                change = max(change, abs(w / widths[idx] - 1.0))
+                widths[idx] = w
+            if (change < _TOLERANCE):
+                break
+        return widths
+
+    # G, B, H, F = G·B·H, N, f_opt = F^(1/N) y P de la ruta principal, con
+    # B en los anchos óptimos (con ramas fijas B depende de los anchos)
+    def get_path_effort(self, tech, load=None):
+        load = self.__load if (load == None) else load
+        widths = self.get_logical_effort_optimal_widths(tech, load)
+
+        (G, B, P) = (1.0, 1.0, 0.0)
+        for stage in self.__get_stages(tech, load):
+            (coef, idx, cap) = stage['onPath']
+            cOn = cap + (coef * widths[idx] if (idx != None) else 0.0)
+            (cOut, w) = self.__get_stage_load(stage, widths)
+            B *= cOut / cOn
+            P += stage['p']
+
+        for name in self.__mainPath:
+            G *= characterize.get_gate_parameters(tech, self.__byName[name]['type'])[0]
+        first = self.__byName[self.__mainPath[0]]
+        (gInv, pInv) = characterize.get_gate_parameters(tech, 'Inversor')
+        H = (gInv * load * tech.W_MIN) / (characterize.get_gate_parameters(tech, first['type'])[0] * tech.W_MIN)
+        N = len(self.__mainPath)
+        return {'G': G, 'B': B, 'H': H, 'F': G * B * H, 'N': N, 'f_opt': (G * B * H) ** (1.0 / N), 'P': P}
+
+    # ===============
+    # Serialización
+    # ===============
+
+    def to_dict(self):
+        return {'name':         self.__name,
+                'gates':        [dict(gate) for gate in self.__gates],
+                'output':       self.__output,
+                'side_inputs':  dict((key, int(value)) for (key, value) in self.__sideInputs.items()),
+                'branches':     dict(self.__branches),
+                'load':         self.__load}
+
+def from_dict(data):
+    for key in ('name', 'gates', 'output'):
+        if (key not in data):
+            raise ValueError("Path description is missing %s" % key)
+    return PathSpec(data['name'], data['gates'], data['output'], side_inputs=data.get('side_inputs'),
+                    branches=data.get('branches'), load=data.get('load', DEFAULT_LOAD))
+
+# El valor de la salida de una compuerta de tech (sin crear la compuerta)
+_GATE_FUNCTIONS = {'Inversor':  lambda inputs: not inputs[0],
+                   'Nand':      lambda inputs: not all(inputs),
+                   'Nor':       lambda inputs: not any(inputs)}
+
+def _get_output_value(gateType, inputs):
+    missing = GATE_INPUTS[gateType] - len(inputs)
+    if (missing > 0):
+        inputs = inputs + [CONSTANTS[NOT_CONTROLLING[gateType]]] * missing
+    return _GATE_FUNCTIONS[gateType](inputs)
+
+# =============================================================================
+# Las rutas de siempre
+# =============================================================================
+
+def inverter_chain_spec(num_inversores, load=DEFAULT_LOAD):
+    gates = [{'name': str(i), 'type': 'Inversor', 'inputs': [PATH_INPUT if (i == 0) else str(i - 1)]}
+             for i in range(num_inversores)]
+    return PathSpec("inversor_chain_" + str(num_inversores), gates, str(num_inversores - 1), load=load)
+
+# Las entradas B de cada NAND tienen su propia fuente (en 1), como antes
+def nand_chain_spec(num_gates, load=DEFAULT_LOAD):
+    gates = [{'name': str(i), 'type': 'Nand', 'inputs': [PATH_INPUT if (i == 0) else str(i - 1), "PathInB" + str(i)]}
+             for i in range(num_gates)]
+    sideInputs = dict(("PathInB" + str(i), 1) for i in range(num_gates))
+    return PathSpec("nand_chain_" + str(num_gates), gates, str(num_gates - 1), side_inputs=sideInputs, load=load)
+
+# =============================================================================
+# Los archivos de rutas
+# =============================================================================
+
+# La carpeta de las rutas que registra tsmc180_main.py
+SPEC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "specs")
+
+def load_spec_file(filename):
+    try:
+        with open(filename) as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ValueError("Failed to read path description %s: %s" % (filename, e))
+    if (not isinstance(data, dict)):
+        raise ValueError("Path description %s is not a JSON object" % filename)
+    return from_dict(data)
+
+# Todas las descripciones (*.json) de una carpeta: un dict de nombre: PathSpec
+#   errors  - None para lanzar ValueError con el primer archivo que no sirve,
+#             o una lista: añadimos el mensaje de cada archivo que no sirve y
+#             lo saltamos (así un archivo malo no rompe las demás rutas)
+def load_spec_dir(directory=SPEC_DIR, errors=None):
+    specs = {}
+    if (not os.path.isdir(directory)):
+        return specs
+    for filename in sorted(os.listdir(directory)):
+        if (not filename.endswith(".json")):
+            continue
+        try:
+            spec = load_spec_file(os.path.join(directory, filename))
+            if (spec.get_name() in specs):
+                raise ValueError("Path %s is defined twice in %s" % (spec.get_name(), directory))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            if (errors == None):
+                raise ValueError(str(e))
+            errors.append("%s: %s" % (filename, e))
+            continue
+        specs[spec.get_name()] = spec
+    return specs
@@ -0,0 +1,244 @@
+import matplotlib.pyplot as plt
+from PySpice.Probe.Plot import plot
+
+import importlib
+
+from paths  import path_spec                # La descripción de la ruta
+from sims   import sta                      # El grafo de tiempo de la ruta
+
+# Usado por __reduce__ para reconstruir la ruta en otro proceso. cls es la
+# clase de la ruta (SpecPath o una subclase como InversorChainPath), la
+# creamos sin __init__ porque las subclases tienen otros argumentos.
+def _rebuild(cls, tech_name, spec, load):
+    path = cls.__new__(cls)
+    SpecPath.__init__(path, importlib.import_module(tech_name), path_spec.from_dict(spec), load)
+    return path
+
+""" SpecPath:
+        Una ruta hecha de un path_spec.PathSpec. Tiene todo lo que necesitan
+        las simulaciones (TpSim, monte_carlo_sim, path_test, ...), así una
+        topología nueva solo necesita una descripción.
+
+        Hay un ancho por grupo de la descripción (get_widths / set_widths),
+        todas las compuertas del grupo tienen ese ancho. Todas comienzan con
+        el ancho mínimo, salvo las que tienen un ancho fijo.
+
+        argumentos:
+            tech    - La tecnologia
+            spec    - El PathSpec
+            load    - La carga, un inversor de tamaño load * tech.W_MIN
+                      (None para la de la descripción)
+"""
+
+class SpecPath:
+
+    def __init__(self, tech, spec, load=None):
+        super().__init__()
+
+        self.__tech         = tech
+        self.__spec         = spec
+        self.__load         = spec.get_load() if (load == None) else load
+        self.__cells        = dict((gateType, getattr(tech, gateType)()) for gateType in path_spec.GATE_INPUTS)
+        self.__instances    = {}    # grupo: [(tipo, instancia), ...]
+        self.__inputSources = []
+        self.__sideNames    = set(name for (name, value) in spec.get_side_inputs())
+
+    def name(self):
+        return self.__spec.get_name()
+
+    def get_spec(self):
+        return self.__spec
+
+    # Para mandar la ruta a otro proceso (multiprocessing)
+    # No se puede serializar el módulo tech, así mandamos su nombre.
+    # La ruta nueva no tiene netlist, hay que llamar add_to_circuit otra vez.
+    def __reduce__(self):
+        return (_rebuild, (type(self), self.__tech.__name__, self.__spec.to_dict(), self.__load))
+
+    # Las fuentes de las entradas laterales (en el orden de
+    # spec.get_side_inputs). Esto solo es para usar con pruebas de rutas:
+    # si cambias esos valores un flanco en la entrada tal vez no va a
+    # propagar a la salida
+    def get_input_sources(self):
+        return self.__inputSources
+
+    # inputs: la entrada de la ruta y las entradas laterales, en el orden de
+    # get_input_sources
+    def get_output_value(self, inputs):
+        return self.__spec.evaluate(inputs[0], inputs[1:])[self.__spec.get_output()]
+
+    # Un flanco ascendente en la entrada da un flanco descendente en la salida?
+    def inverts(self):
+        return self.__spec.inverts()
+
+    # El nodo del circuito de una entrada de una compuerta
+    def __get_node(self, circuit, name, VddNode, pathInNode, pathOutNode, prefix):
+        if (name == path_spec.PATH_INPUT):
+            return pathInNode
+        if (name == 'vdd'):
+            return VddNode
+        if (name == 'gnd'):
+            return circuit.gnd
+        if (name == self.__spec.get_output()):
+            return pathOutNode
+        if (name in self.__sideNames):
+            return prefix + name
+        return prefix + 'tmp' + name
+
+    # prefix  - Se añade a los nombres de los nodos internos, de las fuentes
+    #           y de las instancias, así podemos tener varias copias de la
+    #           ruta en el mismo circuito (con otros pathInNode / pathOutNode)
+    # add_source - Crea la fuente de la entrada lateral k:
+    #           add_source(circuit, k, node, value), value es la tensión del
+    #           valor por defecto. None para una fuente DC con ese valor (ver
+    #           logic_check, que usa fuentes PWL)
+    def add_to_circuit(self, circuit, VddNode, pathInNode, pathOutNode, prefix='', add_source=None):
+        gateTypes = set(gate['type'] for gate in self.__spec.get_gates())
+        for gateType in sorted(gateTypes | set(['Inversor'])):
+            circuit.subcircuit(self.__cells[gateType])
+
+        # Las entradas laterales, cada una con su propia fuente
+        self.__inputSources = []
+        for (k, (name, value)) in enumerate(self.__spec.get_side_inputs()):
+            node = prefix + name
+            voltage = self.__tech.VDD if value else 0
+            if (add_source == None):
+                self.__inputSources.append(circuit.V(node, node, circuit.gnd, voltage))
+            else:
+                self.__inputSources.append(add_source(circuit, k, node, voltage))
+
+        self.__instances = {}
+        for gate in self.__spec.get_gates():
+            inNodes = [self.__get_node(circuit, name, VddNode, pathInNode, pathOutNode, prefix)
+                       for name in gate['inputs']]
+            missing = path_spec.GATE_INPUTS[gate['type']] - len(inNodes)
+            if (missing > 0):
+                tied = self.__get_node(circuit, path_spec.NOT_CONTROLLING[gate['type']], VddNode, pathInNode,
+                                       pathOutNode, prefix)
+                inNodes += [tied] * missing
+
+            outNode = self.__get_node(circuit, gate['name'], VddNode, pathInNode, pathOutNode, prefix)
+            w = (gate['width'] if ('width' in gate) else 1.0) * self.__tech.W_MIN
+            instance = self.__cells[gate['type']].add_instance(circuit, prefix + gate['name'], VddNode, inNodes,
+                                                               outNode, w)
+            if ('group' in gate):
+                self.__instances.setdefault(gate['group'], []).append((gate['type'], instance))
+
+        # Las ramas y la carga - inversores que no cambian de ancho
+        for (node, load) in self.__spec.get_branches().items():
+            inNode = self.__get_node(circuit, node, VddNode, pathInNode, pathOutNode, prefix)
+            self.__cells['Inversor'].add_instance(circuit, prefix + "branch" + node, VddNode, [inNode],
+                                                  prefix + 'branchOut' + node, self.__tech.W_MIN * load)
+        self.__cells['Inversor'].add_instance(circuit, prefix + "load", VddNode, [pathOutNode], prefix + 'loadOut',
+                                              self.__tech.W_MIN * self.__load)
+
+    # Los nodos de la ruta principal en orden, desde la entrada hasta la
+    # salida. Sirve para elegir cuales nodos guardar en una simulación
+    # (probes), ver TpSim. prefix es el mismo de add_to_circuit.
+    def get_nodes(self, pathInNode, pathOutNode, prefix=''):
+        nodes = [pathInNode]
+        for name in self.__spec.get_main_path()[:-1]:
+            nodes.append(prefix + 'tmp' + name)
+        nodes.append(pathOutNode)
+        return nodes
+
+    # Los tipos (clases de tech) de las compuertas, uno por ancho (grupo).
+    # Para una cadena (is_chain) son las etapas en orden (ver
+    # nldm.estimate_chain_delay)
+    def get_gate_types(self):
+        return self.__spec.get_group_types()
+
+    def is_chain(self):
+        return self.__spec.is_chain()
+
+    def get_widths(self):
+        widths = []
+        for group in self.__spec.get_groups():
+            widths.append(self.__instances[group][0][1].parameters["w"])
+        return widths
+
+    def get_max_width(self):
+        # La carga es un inversor de ancho __load * tech.W_MIN, así elegimos un ancho máximo
+        # de un poco más grande. Puede ser más pequeño de la carga, pero quiero darle un
+        # poco más flexibilidad
+        return 1.25 * self.__load * self.__tech.W_MIN
+
+    # todos los anchos deberían estar entre tech.W_MIN y get_max_width()
+    def set_widths(self, widths):
+        for (group, w) in zip(self.__spec.get_groups(), widths):
+            for (gateType, instance) in self.__instances[group]:
+                instance.parameters["w"] = w
+
+    # Las alteraciones de ngspice para poner los anchos widths
+    # en un netlist que ya está cargado (ver Compuerta.get_alterations)
+    # Solo devuelve las de los grupos cuyo ancho cambia respecto a oldWidths
+    # (None para todos)
+    def get_alterations(self, widths, oldWidths=None):
+        alterations = []
+        for (idx, (group, w)) in enumerate(zip(self.__spec.get_groups(), widths)):
+            if ((oldWidths == None) or (oldWidths[idx] != w)):
+                for (gateType, instance) in self.__instances[group]:
+                    alterations += self.__cells[gateType].get_alterations(instance.name, w)
+        return alterations
+
+    # Ver PathSpec.get_logical_effort_optimal_widths
+    def get_logical_effort_optimal_widths(self):
+        return self.__spec.get_logical_effort_optimal_widths(self.__tech, self.__load)
+
+    # Ver PathSpec.get_logical_effort_delay
+    def get_logical_effort_delay(self, widths):
+        return self.__spec.get_logical_effort_delay(self.__tech, widths, self.__load)
+
+    # Ver PathSpec.get_path_effort
+    def get_path_effort(self):
+        return self.__spec.get_path_effort(self.__tech, self.__load)
+
+    # El sta.TimingGraph de la ruta con los anchos widths (uno por grupo):
+    # la entrada 'in' (solo el flanco ascendente, como TpSim), las
+    # compuertas, las ramas y la carga. Las entradas laterales y los valores
+    # fijos no tienen flancos, así no están en el grafo.
+    #   model   - El modelo de retardo (ver sta.TimingGraph)
+    def get_timing_graph(self, widths, model=None):
+        graph = sta.TimingGraph(self.__tech, model)
+        graph.add_input(path_spec.PATH_INPUT, falling=False)
+
+        gateWidths = self.__spec.get_gate_widths(self.__tech, widths)
+        nodes = set([path_spec.PATH_INPUT])
+        for gate in self.__spec.get_gates():
+            inputs = [name for name in gate['inputs'] if (name in nodes)]
+            if (len(inputs) > 0):
+                graph.add_gate(gate['name'], gate['type'], inputs, gateWidths[gate['name']])
+                nodes.add(gate['name'])
+
+        for (node, load) in self.__spec.get_branches().items():
+            if (node in nodes):
+                graph.add_load(node, load * self.__tech.W_MIN)
+        graph.add_output(self.__spec.get_output(), self.__load * self.__tech.W_MIN)
+        return graph
+
+    def get_load(self):
+        return self.__load
+
+    def plot(self, analysis, pathInNode, pathOutNode):
+        figure = plt.figure(1, (10, 5))
+        axe = plt.subplot(111)
+        plt.title('')
+        plt.xlabel('Time [s]')
+        plt.ylabel('Voltage [V]')
+        plt.grid()
+        plot(analysis[pathInNode], axis=axe)
+
+        ledgend = ['In']
+
+        for name in self.__spec.get_main_path()[:-1]:
+            node = "tmp" + name
+            plot(analysis[node], axis=axe)
+            ledgend.append(node)
+
+        ledgend.append(pathOutNode)
+
+        plot(analysis[pathOutNode], axis=axe)
+        plt.legend(ledgend, loc=(.05,.1))
+
+        plt.tight_layout()
+        plt.show()
@@ -0,0 +1,374 @@
+import json
+import logging
+import os
+import platform
+import resource
+import time
+from datetime import datetime
+
+import numpy as np
+
+from sims   import monte_carlo_sim as mcs   # Lo que medimos
+
+# =============================================================================
+# Benchmark de monte_carlo_sim
+#
+# Ejecuta do_monte_carlo_sim con cada ruta, step_time y carga (un caso por
+# combinación), repeats veces con las semillas seed, seed + 1, ... y mide:
+#   sims_per_s          - simulaciones por segundo (de todas las repeticiones)
+#   peak_rss_mb         - el RSS máximo del proceso hasta el final del caso
+#   rss_growth_mb       - cuanto crece el RSS cada 1000 simulaciones (una
+#                         fuga de memoria en ngspice o en PySpice se ve aquí)
+#   best_tp_mean / var  - el promedio y la varianza del mejor Tp de las
+#                         repeticiones. Con la misma semilla deberían ser
+#                         iguales entre versiones, si no cambiamos la búsqueda.
+#
+# Los resultados van a un archivo JSON, que se puede usar como la referencia
+# (baseline) de otra ejecución. compare_results marca como regresión:
+#   - sims_per_s más bajo que la referencia por más de tolerance
+#   - peak_rss_mb más alto que la referencia por más de tolerance
+#   - rss_growth_mb más alto que la referencia por más de tolerance y de
+#     RSS_GROWTH_FLOOR_MB (el RSS tiene ruido de algunos cientos de KB)
+#   - best_tp_mean más alto que la referencia por más de tp_tolerance
+#
+# El RSS es solo el de este proceso, con workers > 1 los workers no cuentan.
+# =============================================================================
+
+# La versión del formato del archivo
+_FILE_VERSION = 1
+
+# Ver rss_growth_mb
+RSS_GROWTH_FLOOR_MB = 1.0
+
+# El RSS actual de este proceso en MB, None si no lo podemos leer (solo Linux)
+def _get_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE') / (1024.0 * 1024.0)
+
+# El RSS máximo de este proceso en MB (ru_maxrss está en KB en Linux)
+def _get_peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+# Las características de la máquina, para saber si una referencia es comparable
+def _get_host():
+    return {'machine':  platform.machine(),
+            'node':     platform.node(),
+            'python':   platform.python_version(),
+            'numpy':    np.__version__}
+
+# El caso de una ruta, step_time y carga (ver run_benchmark)
+# Devuelve None si una ejecución de MCS falló (do_monte_carlo_sim ya mostró
+# por qué)
+def _run_case(tech, put, step_time, num_sims, repeats, seed, logger, options):
+    rssStart = _get_rss_mb()
+    rss = []
+    tps = []
+    sims = []
+    elapsed = 0.0
+
+    for r in range(repeats):
+        ts = time.time()
+        summary = mcs.do_monte_carlo_sim(tech, put, step_time, num_sims, False, None, logger,
+                                         seed=seed + r, **options)
+        elapsed += time.time() - ts
+        if (summary == None):
+            return None
+
+        tps.append(summary.tp)
+        sims.append(summary.num_sims)
+        rss.append(_get_rss_mb())
+
+    # El crecimiento entre la primera y la última repetición (la primera
+    # incluye cargar ngspice y el .lib). Con una repetición no hay otra opción.
+    growth = None
+    if (rss[-1] != None):
+        if (repeats > 1):
+            growth = (rss[-1] - rss[0]) * 1000.0 / max(1, sum(sims[1:]))
+        else:
+            growth = (rss[-1] - rssStart) * 1000.0 / max(1, sims[0])
+
+    return {'path':             put.name(),
+            'step_time':        step_time,
+            'load':             put.get_load(),
+            'sims':             sum(sims),
+            'time':             elapsed,
+            'sims_per_s':       sum(sims) / max(elapsed, 1e-9),
+            'peak_rss_mb':      _get_peak_rss_mb(),
+            'rss_growth_mb':    growth,
+            'best_tps':         tps,
+            'best_tp_mean':     float(np.mean(tps)),
+            'best_tp_var':      float(np.var(tps))}
+
+# Un filtro para el logger durante las ejecuciones de MCS
+def _warnings_only(record):
+    return (record.levelno >= logging.WARNING)
+
+# La llave de un caso para compararlo con la referencia
+def _case_key(case):
+    return (case['path'], case['step_time'], case['load'])
+
+# =============================================================================
+# tech          - La tecnologia
+# puts          - Una lista de funciones que reciben la carga y devuelven una
+#                 ruta nueva (e.g. lambda load: InversorChainPath(tech, 5, load))
+# step_times    - Los step_time que probamos
+# loads         - Las cargas que probamos
+# num_sims      - El número de simulaciones de cada ejecución
+# repeats       - Las ejecuciones de cada caso (con semillas distintas)
+# seed          - La semilla de la primera ejecución de cada caso
+# logger        - El logger. Las ejecuciones de MCS solo muestran WARNING y
+#                 más, salvo si el logger está en VERBOSE o DEBUG.
+# output        - Escribir los resultados a este archivo JSON (None si no quieres)
+# options       - Los argumentos opcionales de do_monte_carlo_sim (e.g. workers)
+#
+# Devuelve el dict que escribimos al archivo
+# =============================================================================
+def run_benchmark(tech, puts, step_times, loads, num_sims, repeats, seed, logger, output=None, **options):
+    cases = []
+    quiet = logger.getEffectiveLevel() >= logging.INFO
+
+    logger.info("Benchmark: %d paths x %d step times x %d loads, num_sims %d, repeats %d, seed %d",
+                len(puts), len(step_times), len(loads), num_sims, repeats, seed)
+
+    for newPath in puts:
+        for step_time in step_times:
+            for load in loads:
+                put = newPath(load)
+
+                # Un filtro en lugar de setLevel: los VerboseLogger que no
+                # vienen de logging.getLogger guardan el nivel en un cache
+                if (quiet):
+                    logger.addFilter(_warnings_only)
+                try:
+                    case = _run_case(tech, put, step_time, num_sims, repeats, seed, logger, options)
+                finally:
+                    logger.removeFilter(_warnings_only)
+
+                if (case == None):
+                    logger.error("%-18s step %.1e load %6.1f: MCS failed, skipping the case", put.name(), step_time,
+                                 load)
+                    continue
+                cases.append(case)
+                logger.info("%-18s step %.1e load %6.1f: %8.1f sims/s, peak RSS %7.1fMB, "
+                            "RSS growth %s MB/1000 sims, best Tp %e (var %.2e)",
+                            case['path'], step_time, load, case['sims_per_s'], case['peak_rss_mb'],
+                            "n/a" if (case['rss_growth_mb'] == None) else "%.2f" % case['rss_growth_mb'],
+                            case['best_tp_mean'], case['best_tp_var'])
+
+    results = {'version':   _FILE_VERSION,
+               'date':      datetime.now().strftime("%Y/%m/%d %H:%M:%S"),
+               'tech':      tech.NAME,
+               'host':      _get_host(),
+               'num_sims':  num_sims,
+               'repeats':   repeats,
+               'seed':      seed,
+               'options':   options,
+               'cases':     cases}
+
+    if (output != None):
+        try:
+            with open(output, 'w') as f:
+                json.dump(results, f, indent=2)
+            logger.info("Wrote benchmark results to %s", output)
+        except OSError:
+            logger.error("Failed to write %s", output)
+
+    return results
+
+def load_results(filename, logger):
+    try:
+        with open(filename) as f:
+            results = json.load(f)
+    except (OSError, ValueError):
+        logger.error("Failed to read benchmark results %s", filename)
+        return None
+
+    if ((not isinstance(results, dict)) or (results.get('version') != _FILE_VERSION)):
+        logger.error("Benchmark results %s have an unknown format", filename)
+        return None
+    return results
+
+# =============================================================================
+# Compara los resultados de run_benchmark con una referencia y muestra una
+# tabla con los cambios de cada caso (ver el comentario al comienzo).
+#   tolerance       - El cambio relativo permitido de sims/s y RSS (e.g. 0.1)
+#   tp_tolerance    - El cambio relativo permitido del mejor Tp promedio
+#
+# Devuelve una lista de (caso, métrica, referencia, nuevo) de las regresiones
+# =============================================================================
+def compare_results(results, baseline, logger, tolerance=0.1, tp_tolerance=0.01):
+    for field in ('tech', 'num_sims', 'repeats', 'seed', 'options'):
+        if (results[field] != baseline[field]):
+            logger.warning("Baseline has a different %s (%s, now %s), the comparison may not be meaningful",
+                           field, baseline[field], results[field])
+    if (results['host'] != baseline['host']):
+        logger.warning("Baseline is from a different host (%s)", baseline['host'])
+
+    baseCases = {_case_key(case): case for case in baseline['cases']}
+    regressions = []
+
+    logger.info("Comparison with baseline from %s (tolerance %.0f%%, Tp tolerance %.1f%%):",
+                baseline['date'], 100.0 * tolerance, 100.0 * tp_tolerance)
+    logger.info("  %-18s %8s %6s %9s %9s %11s %9s  %s", "path", "step", "load", "sims/s",
+                "peak RSS", "RSS growth", "best Tp", "status")
+
+    for case in results['cases']:
+        base = baseCases.get(_case_key(case))
+        if (base == None):
+            logger.info("  %-18s %8.1e %6.1f %9s %9s %11s %9s  %s", case['path'], case['step_time'],
+                        case['load'], "", "", "", "", "new case")
+            continue
+
+        caseRegressions = []
+        if (case['sims_per_s'] < base['sims_per_s'] * (1.0 - tolerance)):
+            caseRegressions.append('sims_per_s')
+        if (case['peak_rss_mb'] > base['peak_rss_mb'] * (1.0 + tolerance)):
+            caseRegressions.append('peak_rss_mb')
+        if ((case['rss_growth_mb'] != None) and (base['rss_growth_mb'] != None) and
+            (case['rss_growth_mb'] - base['rss_growth_mb'] > max(RSS_GROWTH_FLOOR_MB,
+                                                                  abs(base['rss_growth_mb']) * tolerance))):
+            caseRegressions.append('rss_growth_mb')
+        if (case['best_tp_mean'] > base['best_tp_mean'] * (1.0 + tp_tolerance)):
+            caseRegressions.append('best_tp_mean')
+
+        for metric in caseRegressions:
+            regressions.append((_case_key(case), metric, base[metric], case[metric]))
+
+        def change(metric):
+            if ((case[metric] == None) or (base[metric] == None)):
+                return "n/a"
+            if (base[metric] == 0):
+                return "%+.2f" % case[metric]
+            return "%+.1f%%" % (100.0 * (case[metric] - base[metric]) / abs(base[metric]))
+
+        logger.info("  %-18s %8.1e %6.1f %9s %9s %11s %9s  %s", case['path'], case['step_time'], case['load'],
+                    change('sims_per_s'), change('peak_rss_mb'), change('rss_growth_mb'), change('best_tp_mean'),
+                    ("REGRESSION: " + ", ".join(caseRegressions)) if (len(caseRegressions) > 0) else "ok")
+
+    runKeys = set(_case_key(case) for case in results['cases'])
+    for key in [key for key in baseCases if (key not in runKeys)]:
+        logger.info("  %-18s %8.1e %6.1f %9s %9s %11s %9s  %s", key[0], key[1], key[2], "", "", "", "",
+                    "not run")
+
+    if (len(regressions) == 0):
+        logger.info("No regressions in %d cases", len(results['cases']))
+    else:
+        logger.warning("%d regressions:", len(regressions))
+        for (key, metric, old, new) in regressions:
+            logger.warning("  %s step %.1e load %.1f: %s %s -> %s", key[0], key[1], key[2], metric, old, new)
+
+    return regressions
+
+# =============================================================================
+# Escalamiento con el largo de la ruta
+#
+# Ejecuta do_monte_carlo_sim con rutas de cada largo de lengths y con cada
+# optimizador de names, y mide cuantas simulaciones y cuanto tiempo
+# necesitan para converger (ver RunSummary.sims_to_converge). Al final
+# ajustamos sims ~ largo^k y tiempo ~ largo^k por mínimos cuadrados en log,
+# así se ve cual optimizador escala mejor.
+#
+# tech          - La tecnologia
+# newPath       - Una función que recibe el largo y la carga y devuelve una
+#                 ruta nueva (e.g. lambda n, load: InversorChainPath(tech, n, load))
+# lengths       - Los largos que probamos (e.g. 4, 8, ..., 256)
+# load          - La carga de todas las rutas
+# step_time     - El escalon máximo de las simulaciones
+# num_sims      - El número máximo de simulaciones de cada ejecución
+# names         - Los optimizadores (ver optimizers.OPTIMIZERS)
+# seed          - La semilla de todas las ejecuciones
+# logger        - El logger (ver run_benchmark)
+# output        - Escribir los resultados a este archivo JSON (None si no quieres)
+# options       - Los argumentos opcionales de do_monte_carlo_sim (e.g. workers,
+#                 patience)
+#
+# Devuelve el dict que escribimos al archivo
+# =============================================================================
+def run_scaling(tech, newPath, lengths, load, step_time, num_sims, names, seed, logger, output=None, **options):
+    cases = []
+    quiet = logger.getEffectiveLevel() >= logging.INFO
+
+    logger.info("Scaling: lengths %s x optimizers %s, load %.1f, num_sims %d, seed %d",
+                " ".join(str(n) for n in lengths), " ".join(names), load, num_sims, seed)
+
+    for n in lengths:
+        for name in names:
+            # Una ruta nueva para cada optimizador, así todos comienzan con
+            # los mismos anchos (con workers = 1 las simulaciones cambian los
+            # anchos de la ruta)
+            put = newPath(n, load)
+            if (quiet):
+                logger.addFilter(_warnings_only)
+            try:
+                summary = mcs.do_monte_carlo_sim(tech, put, step_time, num_sims, False, None, logger,
+                                                 seed=seed, optimizer=name, **options)
+            finally:
+                logger.removeFilter(_warnings_only)
+
+            if (summary == None):
+                logger.error("%-20s %-12s MCS failed, skipping it", put.name(), name)
+                continue
+
+            case = {'path':             put.name(),
+                    'length':           n,
+                    'widths':           len(summary.widths),
+                    'optimizer':        name,
+                    'sims':             summary.num_sims,
+                    'sims_to_best':     summary.sims_to_best,
+                    'sims_to_converge': summary.sims_to_converge,
+                    'time':             summary.time,
+                    # Estimado: todas las simulaciones de la ejecución duran lo mismo
+                    'time_to_converge': summary.time * summary.sims_to_converge / max(1, summary.num_sims),
+                    'best_tp':          summary.tp,
+                    'stop_reason':      summary.stop_reason}
+            cases.append(case)
+            logger.info("%-20s %-12s %8d sims, converged after %8d (%.1fs), best Tp %e, stopped by %s",
+                        case['path'], name, case['sims'], case['sims_to_converge'], case['time_to_converge'],
+                        case['best_tp'], case['stop_reason'])
+
+    # sims ~ largo^k: la pendiente de log(sims) contra log(largo)
+    fits = {}
+    for name in names:
+        points = [(c['length'], c['sims_to_converge'], c['time_to_converge']) for c in cases
+                  if ((c['optimizer'] == name) and (c['sims_to_converge'] > 0))]
+        if (len(set(p[0] for p in points)) < 2):
+            continue
+        logLengths = np.log([p[0] for p in points])
+        fits[name] = {'sims_exponent': float(np.polyfit(logLengths, np.log([p[1] for p in points]), 1)[0]),
+                      'time_exponent': float(np.polyfit(logLengths, np.log([max(p[2], 1e-9) for p in points]), 1)[0])}
+
+    logger.info("Scaling results, load %.1f:", load)
+    logger.info("  %-12s %8s %10s %16s %12s %12s", "optimizer", "length", "sims run", "sims to converge",
+                "time (s)", "best tp")
+    for c in cases:
+        logger.info("  %-12s %8d %10d %16d %12.1f %12e", c['optimizer'], c['length'], c['sims'],
+                    c['sims_to_converge'], c['time_to_converge'], c['best_tp'])
+    for (name, fit) in fits.items():
+        logger.info("  %-12s sims to converge ~ length^%.2f, time to converge ~ length^%.2f",
+                    name, fit['sims_exponent'], fit['time_exponent'])
+
+    results = {'version':   _FILE_VERSION,
+               'date':      datetime.now().strftime("%Y/%m/%d %H:%M:%S"),
+               'tech':      tech.NAME,
+               'host':      _get_host(),
+               'load':      load,
+               'step_time': step_time,
+               'num_sims':  num_sims,
+               'seed':      seed,
+               'options':   options,
+               'cases':     cases,
+               'fits':      fits}
+
+    if (output != None):
+        try:
+            with open(output, 'w') as f:
+                json.dump(results, f, indent=2)
+            logger.info("Wrote scaling results to %s", output)
+        except OSError:
+            logger.error("Failed to write %s", output)
+
+    return results
@@ -0,0 +1,338 @@
+import hashlib
+import importlib
+import json
+import multiprocessing
+import os
+from datetime import datetime
+
+import numpy as np
+
+from PySpice.Doc.ExampleTools import find_libraries
+from PySpice.Spice.Netlist import Circuit
+
+from sims   import crossings                # Búsqueda de transiciones en las formas de onda
+
+# =============================================================================
+# Caracterización de logical effort de la tecnologia
+#
+# Ver logical_effort_notes.txt. Medimos tau, p_inv y los g / p de cada
+# compuerta (GATES) con dos tipos de simulación:
+#
+# Fanout-h: una etapa de la compuerta que maneja h copias de si misma, así
+#   h = Cout / Cin es exactamente h y d = g·h + p. La entrada viene de otra
+#   etapa igual (también con h copias), así la pendiente de la entrada es la
+#   de una compuerta real. Medimos el Tp (promedio de tphl y tplh) para
+#   varios h y ajustamos una recta: Tp = tau·g·h + tau·p
+#     - Inversor: g = 1, así tau = pendiente y p_inv = ordenada / tau
+#     - Las demás: g = pendiente / tau, p = ordenada / tau
+#
+# Anillo oscilador: ring_stages (impar) compuertas en un anillo. Cada una
+#   maneja una igual (h = 1), así el retardo de cada etapa es
+#   periodo / (2 · ring_stages) = tau·(g + p). Sirve para comprobar el ajuste
+#   (ring_g_plus_p vs g + p). Para el inversor también da otro tau:
+#   ring_tau = retardo / (1 + p_inv).
+#
+# Las otras entradas de las compuertas están en el valor que no controla la
+# salida (Vdd para la NAND, 0 para la NOR). Medimos siempre la primera entrada,
+# igual que Compuerta.get_logical_effort.
+#
+# Todas las simulaciones son independientes, así las hacemos en paralelo
+# (un proceso por simulación, cada uno con su propio ngspice).
+#
+# Los resultados se guardan en un archivo JSON al lado del .lib (ver
+# get_cache_filename). La llave tiene el hash del .lib, WPFACT y los
+# parámetros de la caracterización, así un cambio del modelo o de WPFACT
+# no usa resultados viejos.
+# =============================================================================
+
+# La versión del formato del archivo
+_FILE_VERSION = 1
+
+# Las compuertas que caracterizamos (clases del módulo tech)
+GATES = ('Inversor', 'Nand', 'Nor')
+
+# Los parámetros por defecto de characterize
+DEFAULT_FANOUTS     = (1, 2, 3, 4, 6, 8)
+DEFAULT_RING_STAGES = 11
+DEFAULT_STEP_TIME   = 1e-13
+
+# Las fuentes de pulsos de la entrada (iguales a las de TpSim)
+_IN_DELAY   = 10e-12
+_IN_RISE    = 20e-12
+
+# Duraciones de las simulaciones: fanout-h tiene un flanco ascendente y uno
+# descendente (a 1ns), el anillo varios periodos
+_FANOUT_SIM_TIME    = 1.8e-9
+_RING_SIM_TIME      = 4e-9
+
+# Los resultados ya leídos del archivo, por tecnologia (ver get_gate_parameters)
+_loaded = {}
+
+# =============================================================================
+# Las simulaciones. Cada una se ejecuta en un proceso del pool y devuelve
+# un número (o None si no se pudo medir)
+# =============================================================================
+
+# Un circuito con el .lib, Vdd y el subcircuito de la compuerta
+# (también lo usa nldm)
+def new_gate_circuit(tech, gate, title):
+    circuit = Circuit(title)
+    circuit.include(find_libraries() + "/" + tech.LIB_NAME)
+    circuit.V('dd', 'Vdd', circuit.gnd, tech.VDD)
+    circuit.subcircuit(gate)
+    return circuit
+
+# Añade una instancia de gate con la entrada inNode. Las otras entradas van al
+# valor que no controla la salida, el que deja que inNode cambie la salida
+# (1 para la NAND, 0 para la NOR).
+def add_gate(tech, circuit, gate, name, inNode, outNode, w):
+    others = gate.get_num_inputs() - 1
+    value = True
+    if (gate.get_output_value([False] + [True] * others) == gate.get_output_value([True] * (others + 1))):
+        value = False
+    inNodes = [inNode] + [('Vdd' if value else circuit.gnd)] * others
+    gate.add_instance(circuit, name, 'Vdd', inNodes, outNode, w)
+
+def _get_waveform(analysis, node):
+    return np.asarray(analysis[node], dtype=np.float64)
+
+# El Tp (promedio de tphl y tplh) de una compuerta con fanout h
+def _simulate_fanout(tech, gateName, h, w, step_time):
+    gate = getattr(tech, gateName)()
+    circuit = new_gate_circuit(tech, gate, "Fanout_%s_%d" % (gateName, h))
+    circuit.PulseVoltageSource("In", "In", circuit.gnd, initial_value=0, pulsed_value=tech.VDD,
+                               pulse_width=1e-9, period=2e-9, delay_time=_IN_DELAY,
+                               rise_time=_IN_RISE, fall_time=_IN_RISE)
+
+    # La etapa que forma la entrada: maneja la etapa medida y h - 1 copias
+    add_gate(tech, circuit, gate, "Shape", 'In', 'n1', w)
+    for k in range(h - 1):
+        add_gate(tech, circuit, gate, "ShapeLoad%d" % k, 'n1', 'ShapeLoadOut%d' % k, w)
+
+    # La etapa medida, con h copias de carga
+    add_gate(tech, circuit, gate, "Dut", 'n1', 'n2', w)
+    for k in range(h):
+        add_gate(tech, circuit, gate, "Load%d" % k, 'n2', 'LoadOut%d' % k, w)
+
+    simulator = circuit.simulator(temperature=27, nominal_temperature=27)
+    analysis = simulator.transient(step_time=step_time, end_time=_FANOUT_SIM_TIME)
+
+    t = _get_waveform(analysis, 'time')
+    vIn = _get_waveform(analysis, 'n1')
+    vOut = _get_waveform(analysis, 'n2')
+    half = tech.VDD / 2
+
+    # n1 baja con el flanco ascendente de In y sube con el descendente
+    tplh = crossings.find_delay(t, vIn, vOut, half, crossings.FALL, crossings.RISE)
+    tphl = crossings.find_delay(t, vIn, vOut, half, crossings.RISE, crossings.FALL)
+    if ((tplh == None) or (tphl == None)):
+        return None
+    return (tplh + tphl) / 2
+
+# El retardo por etapa de un anillo oscilador de stages compuertas
+def _simulate_ring(tech, gateName, stages, w, step_time):
+    gate = getattr(tech, gateName)()
+    circuit = new_gate_circuit(tech, gate, "Ring_%s_%d" % (gateName, stages))
+    for i in range(stages):
+        add_gate(tech, circuit, gate, "Ring%d" % i, 'r%d' % ((i - 1) % stages), 'r%d' % i, w)
+
+    # Sin una condición inicial el punto de operación es VDD/2 en todos los
+    # nodos y el anillo no oscila
+    simulator = circuit.simulator(temperature=27, nominal_temperature=27)
+    simulator.initial_condition(r0=0)
+    analysis = simulator.transient(step_time=step_time, end_time=_RING_SIM_TIME)
+
+    t = _get_waveform(analysis, 'time')
+    rises = crossings.find_crossings(t, _get_waveform(analysis, 'r0'), tech.VDD / 2, crossings.RISE)
+
+    # El primer periodo todavía tiene el arranque
+    if (len(rises) < 3):
+        return None
+    period = float(np.median(np.diff(rises[1:])))
+    return period / (2 * stages)
+
+# job = (tipo, nombre del módulo tech, compuerta, h o stages, w, step_time)
+def _run_job(job):
+    (kind, techName, gateName, n, w, step_time) = job
+    tech = importlib.import_module(techName)
+    if (kind == 'fanout'):
+        return _simulate_fanout(tech, gateName, n, w, step_time)
+    return _simulate_ring(tech, gateName, n, w, step_time)
+
+# =============================================================================
+# El archivo de resultados
+# =============================================================================
+
+# El archivo al lado del .lib, e.g. TSMC180.characterization.json
+def get_cache_filename(tech):
+    return os.path.join(find_libraries(), os.path.splitext(tech.LIB_NAME)[0] + ".characterization.json")
+
+# Los primeros 16 dígitos del SHA-256 del .lib (OSError si no existe)
+def get_lib_hash(tech):
+    with open(os.path.join(find_libraries(), tech.LIB_NAME), 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+# La llave de los resultados: el hash del .lib, WPFACT y los parámetros
+def get_cache_key(tech, fanouts=DEFAULT_FANOUTS, ring_stages=DEFAULT_RING_STAGES,
+                  step_time=DEFAULT_STEP_TIME):
+    return "lib=%s,wpfact=%r,w=%r,fanouts=%s,ring=%d,step=%r" % (
+        get_lib_hash(tech), tech.WPFACT, tech.W_MIN, ",".join(str(h) for h in fanouts), ring_stages, step_time)
+
+def _read_cache(filename):
+    try:
+        with open(filename) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if ((not isinstance(data, dict)) or (data.get('version') != _FILE_VERSION)):
+        return None
+    return data
+
+# Los resultados guardados de characterize o None si no hay
+def load_characterization(tech, fanouts=DEFAULT_FANOUTS, ring_stages=DEFAULT_RING_STAGES,
+                          step_time=DEFAULT_STEP_TIME):
+    try:
+        key = get_cache_key(tech, fanouts, ring_stages, step_time)
+    except OSError:
+        return None
+
+    data = _read_cache(get_cache_filename(tech))
+    if (data == None):
+        return None
+    return data['entries'].get(key)
+
+def _save_characterization(tech, key, results, logger):
+    filename = get_cache_filename(tech)
+    data = _read_cache(filename)
+    if (data == None):
+        data = {'version': _FILE_VERSION, 'entries': {}}
+    data['entries'][key] = results
+
+    # Escribimos a otro archivo y lo renombramos, así otro proceso que lo
+    # lee al mismo tiempo no ve un archivo a medias
+    try:
+        with open(filename + ".tmp", 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(filename + ".tmp", filename)
+        logger.info("Wrote characterization to %s", filename)
+    except OSError:
+        logger.error("Failed to write %s", filename)
+
+# =============================================================================
+# tech          - La tecnologia
+# logger        - El logger
+# workers       - El número de procesos (None para uno por CPU)
+# fanouts       - Los h de las simulaciones fanout-h
+# ring_stages   - El número de compuertas de los anillos (impar)
+# step_time     - El escalon máximo de las simulaciones
+# force         - Simular aunque haya resultados guardados
+#
+# Devuelve un dict:
+#   tau, p_inv, ring_tau    - ver el comentario al comienzo (tau en segundos)
+#   gates                   - un dict de compuerta: dict con
+#       g, p                    - los valores medidos
+#       g_nominal, p_nominal    - los de la topología (Compuerta.get_logical_effort)
+#       fanout_tps              - el Tp de cada h (segundos, None si falló)
+#       ring_delay              - el retardo por etapa del anillo (segundos)
+#       ring_g_plus_p           - ring_delay / tau
+# o None si alguna simulación falló
+# =============================================================================
+def characterize(tech, logger, workers=None, fanouts=DEFAULT_FANOUTS, ring_stages=DEFAULT_RING_STAGES,
+                 step_time=DEFAULT_STEP_TIME, force=False):
+    if (ring_stages % 2 == 0):
+        raise ValueError("ring_stages must be odd")
+
+    key = get_cache_key(tech, fanouts, ring_stages, step_time)
+    if (not force):
+        results = load_characterization(tech, fanouts, ring_stages, step_time)
+        if (results != None):
+            logger.info("Using characterization from %s (%s)", get_cache_filename(tech), results['date'])
+            return results
+
+    jobs = []
+    for gateName in GATES:
+        for h in fanouts:
+            jobs.append(('fanout', tech.__name__, gateName, h, tech.W_MIN, step_time))
+        jobs.append(('ring', tech.__name__, gateName, ring_stages, tech.W_MIN, step_time))
+
+    logger.info("Characterizing %s: %d simulations (fanouts %s, %d stage rings)",
+                tech.NAME, len(jobs), list(fanouts), ring_stages)
+    if (workers == 1):
+        values = [_run_job(job) for job in jobs]
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            values = pool.map(_run_job, jobs)
+    measured = dict(((job[0], job[2], job[3]), value) for (job, value) in zip(jobs, values))
+
+    failed = [job for (job, value) in zip(jobs, values) if (value == None)]
+    for job in failed:
+        logger.error("Characterization simulation %s %s %d failed", job[0], job[2], job[3])
+    if (len(failed) > 0):
+        return None
+
+    # Ajustar Tp = pendiente·h + ordenada para cada compuerta
+    lines = {}
+    for gateName in GATES:
+        tps = [measured[('fanout', gateName, h)] for h in fanouts]
+        (slope, intercept) = np.polyfit(np.asarray(fanouts, dtype=np.float64), np.asarray(tps), 1)
+        lines[gateName] = (float(slope), float(intercept))
+
+    (tau, intercept) = lines['Inversor']
+    p_inv = intercept / tau
+    ringInv = measured[('ring', 'Inversor', ring_stages)]
+
+    results = {'date':      datetime.now().strftime("%Y/%m/%d %H:%M:%S"),
+               'key':       key,
+               'tau':       tau,
+               'p_inv':     p_inv,
+               'ring_tau':  ringInv / (1 + p_inv),
+               'gates':     {}}
+    for gateName in GATES:
+        gate = getattr(tech, gateName)()
+        (slope, intercept) = lines[gateName]
+        ringDelay = measured[('ring', gateName, ring_stages)]
+        results['gates'][gateName] = {'g':              slope / tau,
+                                      'p':              intercept / tau,
+                                      'g_nominal':      gate.get_logical_effort(),
+                                      'p_nominal':      gate.get_parasitic_delay(),
+                                      'fanout_tps':     [measured[('fanout', gateName, h)] for h in fanouts],
+                                      'ring_delay':     ringDelay,
+                                      'ring_g_plus_p':  ringDelay / tau}
+
+    _save_characterization(tech, key, results, logger)
+    _loaded.pop(tech.NAME, None)
+    return results
+
+def log_characterization(results, logger):
+    logger.info("tau %.2fps, p_inv %.3f, tau from the inverter ring %.2fps",
+                results['tau'] * 1e12, results['p_inv'], results['ring_tau'] * 1e12)
+    logger.info("  %-10s %8s %8s %10s %10s %10s %12s", "gate", "g", "p", "g nominal", "p nominal",
+                "g + p", "ring g + p")
+    for (gateName, gate) in results['gates'].items():
+        logger.info("  %-10s %8.3f %8.3f %10.3f %10.3f %10.3f %12.3f", gateName, gate['g'], gate['p'],
+                    gate['g_nominal'], gate['p_nominal'], gate['g'] + gate['p'], gate['ring_g_plus_p'])
+
+# =============================================================================
+# Los (g, p) de una compuerta para las rutas (e.g. las anchos óptimos de
+# logical effort). Usa los resultados guardados con los parámetros por
+# defecto si hay, si no los de la topología (Compuerta.get_logical_effort).
+# Nunca simula: para eso hay que ejecutar characterize (el comando CHAR).
+# Se lee el archivo una sola vez por proceso.
+# =============================================================================
+def get_gate_parameters(tech, gateName):
+    if (tech.NAME not in _loaded):
+        _loaded[tech.NAME] = load_characterization(tech)
+
+    results = _loaded[tech.NAME]
+    if ((results == None) or (gateName not in results['gates'])):
+        gate = getattr(tech, gateName)()
+        return (gate.get_logical_effort(), gate.get_parasitic_delay())
+    return (results['gates'][gateName]['g'], results['gates'][gateName]['p'])
+
+# El tau (s) de los resultados guardados, o None si no hay (ver get_gate_parameters)
+def get_tau(tech):
+    if (tech.NAME not in _loaded):
+        _loaded[tech.NAME] = load_characterization(tech)
+
+    results = _loaded[tech.NAME]
+    return None if (results == None) else results['tau']
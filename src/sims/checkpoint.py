@@ -0,0 +1,92 @@
+import os
+import pickle
+
+# =============================================================================
+# Checkpoints de monte_carlo_sim
+#
+# Los optimizadores (generadores) no se pueden guardar, así en lugar de
+# guardar su estado guardamos todos los Tps que devolvieron las simulaciones
+# (un float por simulación). Para continuar una ejecución la hacemos otra vez
+# desde el comienzo con la misma semilla, pero las primeras simulaciones
+# devuelven los Tps guardados en lugar de simular (ver ReplayPool). Así el
+# generador aleatorio, el optimizador, sim_time, el mejor resultado y los
+# resultados quedan exactamente como antes de la interrupción.
+#
+# El checkpoint también tiene el estado de monte_carlo_sim en ese momento
+# (mejor resultado, sim_time, estado del generador aleatorio...) para
+# mostrarlo y comprobar que la repetición llegó al mismo estado.
+# =============================================================================
+
+# La versión del formato del archivo
+_FILE_VERSION = 1
+
+def save_checkpoint(filename, state, logger):
+    # Escribimos a otro archivo y lo renombramos, así una interrupción
+    # durante la escritura no destruye el checkpoint anterior
+    tmpFilename = filename + ".tmp"
+    data = dict(state)
+    data['version'] = _FILE_VERSION
+    try:
+        with open(tmpFilename, 'wb') as f:
+            pickle.dump(data, f)
+        os.replace(tmpFilename, filename)
+    except OSError:
+        logger.error("Failed to write checkpoint %s", filename)
+
+# Devuelve el estado guardado o None si no se puede leer
+def load_checkpoint(filename, logger):
+    try:
+        with open(filename, 'rb') as f:
+            data = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        logger.error("Failed to read checkpoint %s", filename)
+        return None
+
+    if ((not isinstance(data, dict)) or (data.get('version') != _FILE_VERSION)):
+        logger.error("Checkpoint %s has an unknown format", filename)
+        return None
+
+    return data
+
+""" ReplayPool:
+        Envuelve un SimPool. Las primeras llamadas a get_tps devuelven los Tps
+        de recorded (en orden) sin simular, después simula con pool.
+        Guarda todos los Tps que devuelve (get_record).
+
+        argumentos:
+            pool        - El SimPool
+            recorded    - Los Tps de un checkpoint ([] para no repetir nada)
+"""
+
+class ReplayPool:
+
+    def __init__(self, pool, recorded):
+        self.__pool     = pool
+        self.__recorded = list(recorded)
+        self.__record   = []
+
+    def get_workers(self):
+        return self.__pool.get_workers()
+
+    def get_batch_size(self):
+        return self.__pool.get_batch_size()
+
+    # True mientras quedan Tps guardados para devolver
+    def is_replaying(self):
+        return (len(self.__record) < len(self.__recorded))
+
+    # Todos los Tps que devolvimos, en orden
+    def get_record(self):
+        return self.__record
+
+    def get_tps(self, widthsList, sim_time):
+        start = len(self.__record)
+        tps = self.__recorded[start:start + len(widthsList)]
+        if (len(tps) < len(widthsList)):
+            tps += self.__pool.get_tps(widthsList[len(tps):], sim_time)
+
+        self.__record += tps
+        return tps
+
+    def close(self):
+        self.__pool.close()
@@ -0,0 +1,169 @@
+import time
+
+import numpy as np
+
+# =============================================================================
+# Detección de transiciones (cruces de un umbral) en formas de onda
+#
+# Todas las funciones reciben arrays de numpy (o algo que np.asarray acepta):
+#   t   - los tiempos de las muestras
+#   v   - las tensiones del nodo en esos tiempos
+# y interpolan linealmente entre las dos muestras alrededor del cruce, así
+# el resultado no depende tanto del step_time.
+#
+# direction puede estar:
+#   RISE    - flanco ascendente (v pasa de < umbral a >= umbral)
+#   FALL    - flanco descendente (v pasa de > umbral a <= umbral)
+#   BOTH    - los dos
+# =============================================================================
+
+RISE = 'rise'
+FALL = 'fall'
+BOTH = 'both'
+
+def _as_arrays(t, v):
+    t = np.asarray(t, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+    if (t.shape != v.shape):
+        raise ValueError("t and v must have the same shape")
+    return t, v
+
+""" find_crossings:
+        Devuelve un array con los tiempos (interpolados) de todos los cruces
+        de v por threshold en la dirección direction, en orden.
+"""
+def find_crossings(t, v, threshold, direction=BOTH):
+    t, v = _as_arrays(t, v)
+
+    v0 = v[:-1]
+    v1 = v[1:]
+
+    if (direction == RISE):
+        mask = (v0 < threshold) & (v1 >= threshold)
+    elif (direction == FALL):
+        mask = (v0 > threshold) & (v1 <= threshold)
+    elif (direction == BOTH):
+        mask = ((v0 < threshold) & (v1 >= threshold)) | ((v0 > threshold) & (v1 <= threshold))
+    else:
+        raise ValueError("Unknown direction %s" % direction)
+
+    idx = np.nonzero(mask)[0]
+
+    # Interpolación lineal entre las muestras idx y idx+1
+    # (v1 != v0 siempre porque hay un cruce entre ellas)
+    ta = t[idx]
+    va = v[idx]
+    frac = (threshold - va) / (v[idx+1] - va)
+    return ta + frac * (t[idx+1] - ta)
+
+""" find_crossing:
+        El tiempo del cruce número n (1 es el primero) después de t_min
+        o None si no hay suficientes cruces.
+"""
+def find_crossing(t, v, threshold, direction, n=1, t_min=None):
+    crossings = find_crossings(t, v, threshold, direction)
+    if (t_min != None):
+        crossings = crossings[crossings >= t_min]
+    if (len(crossings) < n):
+        return None
+    return float(crossings[n-1])
+
+""" find_delay:
+        El retardo desde el cruce n de vin (dirección in_direction) hasta el
+        primer cruce de vout (dirección out_direction) que lo sigue.
+        Normalmente threshold = VDD/2. None si alguno de los dos no existe.
+"""
+def find_delay(t, vin, vout, threshold, in_direction, out_direction, n=1):
+    tin = find_crossing(t, vin, threshold, in_direction, n)
+    if (tin == None):
+        return None
+    tout = find_crossing(t, vout, threshold, out_direction, 1, t_min=tin)
+    if (tout == None):
+        return None
+    return tout - tin
+
+""" find_edges:
+        Analiza todos los flancos de v en una pasada.
+        Un flanco es un cruce de vdd * mid. Por cada flanco busca el último
+        cruce de low y el primer cruce de high (del mismo sentido) alrededor
+        de él para calcular el slew (10-90% por defecto).
+
+        devuelve un dict de arrays, uno elemento por flanco, en orden:
+            time        - tiempo del cruce de mid (interpolado)
+            rising      - True si es ascendente
+            slew        - tiempo entre low y high (NaN si el flanco no
+                          termina antes del final de la simulación)
+"""
+def find_edges(t, v, vdd, low=0.1, mid=0.5, high=0.9):
+    t, v = _as_arrays(t, v)
+
+    result_time     = []
+    result_rising   = []
+    result_slew     = []
+
+    for (direction, start, end) in ((RISE, low, high), (FALL, high, low)):
+        mids    = find_crossings(t, v, vdd * mid,   direction)
+        starts  = find_crossings(t, v, vdd * start, direction)
+        ends    = find_crossings(t, v, vdd * end,   direction)
+
+        # El último start antes de cada mid y el primer end después
+        startIdx = np.searchsorted(starts, mids, side='right') - 1
+        endIdx   = np.searchsorted(ends, mids, side='left')
+
+        valid = (startIdx >= 0) & (endIdx < len(ends))
+        slew = np.full(len(mids), np.nan)
+        slew[valid] = ends[endIdx[valid]] - starts[startIdx[valid]]
+
+        result_time.append(mids)
+        result_rising.append(np.full(len(mids), direction == RISE))
+        result_slew.append(slew)
+
+    times   = np.concatenate(result_time)
+    order   = np.argsort(times, kind='stable')
+    return {'time':     times[order],
+            'rising':   np.concatenate(result_rising)[order],
+            'slew':     np.concatenate(result_slew)[order]}
+
+# =============================================================================
+# Microbenchmark: comparar con la búsqueda muestra por muestra que usaba
+# monte_carlo_sim._get_tp (sin las unidades de PySpice, que la hacen aún
+# más lenta). Para ejecutarlo desde src/:
+#   python -m sims.crossings
+# =============================================================================
+
+def _loop_crossing(t, v, threshold):
+    for (vv, tt) in zip(v, t):
+        if (float(vv) >= threshold):
+            return tt
+    return None
+
+def benchmark(sizes=(100000, 300000, 1000000), vdd=1.8, repeat=3):
+    results = []
+    for n in sizes:
+        # Una rampa ascendente suave en la mitad de la simulación
+        t = np.linspace(0.0, 1e-9, n)
+        v = vdd / (1.0 + np.exp(-(t - 0.5e-9) / 20e-12))
+
+        tList = list(t)
+        vList = list(v)
+
+        best_loop = None
+        best_vec = None
+        for i in range(repeat):
+            ts = time.perf_counter()
+            _loop_crossing(tList, vList, vdd / 2)
+            te = time.perf_counter()
+            best_loop = (te - ts) if (best_loop == None) else min(best_loop, te - ts)
+
+            ts = time.perf_counter()
+            find_crossing(t, v, vdd / 2, RISE)
+            te = time.perf_counter()
+            best_vec = (te - ts) if (best_vec == None) else min(best_vec, te - ts)
+
+        results.append((n, best_loop, best_vec))
+        print("%8d points: loop %8.3fms, numpy %8.3fms, speedup %.1fx" %
+              (n, best_loop * 1e3, best_vec * 1e3, best_loop / best_vec))
+    return results
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,134 @@
+import collections
+import os
+import pickle
+
+# =============================================================================
+# Cache de evaluaciones (Tps)
+#
+# Con el método 3 de monte_carlo_sim, al final de una simulación muchos
+# candidatos están a pocos nm de otros que ya simulamos, y cada vez que
+# ejecutamos la misma ruta con la misma carga comenzamos de cero.
+#
+# La llave es (tech, ruta, carga, step_time, grid, fidelidad, meas,
+# spice_options, anchos) con los anchos redondeados a una rejilla (grid), así
+# dos candidatos en la misma celda de la rejilla tienen el mismo Tp. Con la
+# fidelidad y las opciones del simulador un Tp grueso (con tolerancias más
+# grandes) nunca sirve para una ejecución fina con el mismo step_time.
+#
+# Guardamos el Tp y el sim_time de la simulación:
+#   - Un Tp >= 0 vale para cualquier sim_time
+#   - Un Tp de -1 (la salida no transicionó) solo vale si el sim_time de ahora
+#     no es más largo que el sim_time de entonces
+# =============================================================================
+
+# La versión del formato del archivo (2: las llaves tienen la fidelidad y
+# las opciones del simulador)
+_FILE_VERSION = 2
+
+""" EvalCache:
+        Un cache LRU en memoria, opcionalmente guardado en un archivo para
+        compartirlo entre ejecuciones.
+
+        argumentos:
+            tech        - La tecnologia
+            put         - La ruta
+            step_time   - El escalon máximo de la simulación
+            grid        - El tamaño de la rejilla de los anchos (en m)
+            max_entries - El número máximo de entradas en memoria. Cuando
+                          está lleno borramos la menos usada.
+            filename    - El archivo del cache (None para no usar un archivo).
+                          Se lee en __init__ y se escribe en save().
+            logger      - El logger
+            fidelity    - La fidelidad de los Tps (e.g. 'fine' o 'coarse')
+            meas        - Si los Tps son de .meas (ver TpSim)
+            spice_options - Las .options de ngspice de las simulaciones
+                          (None para las por defecto)
+"""
+
+class EvalCache:
+
+    def __init__(self, tech, put, step_time, logger, grid=1e-9, max_entries=100000, filename=None,
+                 fidelity='fine', meas=False, spice_options=None):
+        self.__grid         = grid
+        self.__max_entries  = max_entries
+        self.__filename     = filename
+        self.__logger       = logger
+
+        options             = tuple(sorted((spice_options or {}).items()))
+        self.__prefix       = (tech.NAME, put.name(), put.get_load(), step_time, grid, fidelity, meas, options)
+        self.__entries      = collections.OrderedDict()
+
+        self.__hits         = 0
+        self.__misses       = 0
+
+        if ((filename != None) and os.path.exists(filename)):
+            self.__load()
+
+    def get_grid(self):
+        return self.__grid
+
+    def get_hits(self):
+        return self.__hits
+
+    def get_misses(self):
+        return self.__misses
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __get_key(self, widths):
+        return self.__prefix + tuple(int(round(w / self.__grid)) for w in widths)
+
+    # Devuelve el Tp de los anchos widths o None si no lo tenemos
+    def get(self, widths, sim_time):
+        key = self.__get_key(widths)
+        entry = self.__entries.get(key)
+
+        if ((entry != None) and ((entry[0] >= 0) or (sim_time <= entry[1]))):
+            self.__entries.move_to_end(key)
+            self.__hits += 1
+            return entry[0]
+
+        self.__misses += 1
+        return None
+
+    def put(self, widths, sim_time, tp):
+        key = self.__get_key(widths)
+        self.__entries[key] = (tp, sim_time)
+        self.__entries.move_to_end(key)
+
+        while (len(self.__entries) > self.__max_entries):
+            self.__entries.popitem(last=False)
+
+    def __load(self):
+        try:
+            with open(self.__filename, 'rb') as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self.__logger.warning("Failed to read cache file %s, ignoring it", self.__filename)
+            return
+
+        if ((not isinstance(data, dict)) or (data.get('version') != _FILE_VERSION)):
+            self.__logger.warning("Cache file %s has an unknown format, ignoring it", self.__filename)
+            return
+
+        # El archivo puede tener entradas de otras rutas / tecnologias.
+        # Las guardamos todas para no perderlas en save()
+        self.__entries.update(data['entries'])
+        while (len(self.__entries) > self.__max_entries):
+            self.__entries.popitem(last=False)
+
+        self.__logger.verbose("Loaded %d cache entries from %s", len(self.__entries), self.__filename)
+
+    # Escribe el cache al archivo (si hay)
+    def save(self):
+        if (self.__filename == None):
+            return
+
+        data = {'version': _FILE_VERSION,
+                'entries': list(self.__entries.items())}
+        try:
+            with open(self.__filename, 'wb') as f:
+                pickle.dump(data, f)
+        except OSError:
+            self.__logger.error("Failed to write cache file %s", self.__filename)
@@ -0,0 +1,88 @@
+import random
+
+# =============================================================================
+# Prefiltro de candidatos con logical effort
+#
+# Antes de simular un candidato calculamos su retardo según logical effort
+# (put.get_logical_effort_delay) y lo comparamos con el de los mejores anchos.
+# Si es más que el del mejor * (1 + margin) no lo simulamos.
+#
+# Logical effort no es exacto, así a veces descartamos un candidato que sería
+# mejor. Para medir cuantas veces pasa simulamos una fracción (audit) de los
+# candidatos descartados de todos modos y contamos cuantos eran mejores.
+# =============================================================================
+
+# Lo que hacemos con cada candidato
+SIMULATE    = 'simulate'
+PRUNE       = 'prune'
+AUDIT       = 'audit'       # descartado, pero lo simulamos para medir
+
+""" LEPrefilter:
+        argumentos:
+            put     - La ruta, tiene que tener get_logical_effort_delay
+            margin  - Descartar los candidatos con retardo estimado más de
+                      margin (e.g. 0.05 = 5%) peor que el del mejor
+            audit   - La fracción de los descartados que simulamos de todos
+                      modos (0 para ninguno)
+            seed    - Semilla para elegir los candidatos de audit
+"""
+
+class LEPrefilter:
+
+    def __init__(self, put, margin, audit=0.0, seed=None):
+        self.__put          = put
+        self.__margin       = margin
+        self.__audit        = audit
+        self.__rng          = random.Random(seed)
+
+        self.__checked      = 0     # candidatos que pasaron por el filtro
+        self.__pruned       = 0     # descartados (incluso los de audit)
+        self.__audited      = 0     # descartados que simulamos
+        self.__falseRejects = 0     # descartados que eran mejores que el mejor
+
+    def get_margin(self):
+        return self.__margin
+
+    def get_checked(self):
+        return self.__checked
+
+    def get_pruned(self):
+        return self.__pruned
+
+    def get_audited(self):
+        return self.__audited
+
+    def get_false_rejects(self):
+        return self.__falseRejects
+
+    # La fracción de los descartados de audit que eran mejores
+    # (None si no simulamos ninguno)
+    def get_false_reject_rate(self):
+        if (self.__audited == 0):
+            return None
+        return self.__falseRejects / self.__audited
+
+    # Devuelve SIMULATE, PRUNE o AUDIT para cada candidato
+    def check(self, candidates, bestWidths):
+        limit = self.__put.get_logical_effort_delay(bestWidths) * (1.0 + self.__margin)
+
+        actions = []
+        for widths in candidates:
+            self.__checked += 1
+            if (self.__put.get_logical_effort_delay(widths) <= limit):
+                actions.append(SIMULATE)
+                continue
+
+            self.__pruned += 1
+            if ((self.__audit > 0.0) and (self.__rng.random() < self.__audit)):
+                self.__audited += 1
+                actions.append(AUDIT)
+            else:
+                actions.append(PRUNE)
+
+        return actions
+
+    # El Tp de un candidato de AUDIT, y el mejor Tp cuando lo descartamos
+    def audit_result(self, tp, bestTp):
+        if ((tp >= 0) and (tp < bestTp)):
+            self.__falseRejects += 1
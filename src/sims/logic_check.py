@@ -0,0 +1,252 @@
+import importlib
+import multiprocessing
+
+import numpy as np
+
+from PySpice.Doc.ExampleTools import find_libraries
+from PySpice.Spice.Netlist import Circuit
+
+# =============================================================================
+# Pruebas lógicas de compuertas (GT) y rutas (PT)
+#
+# Probamos todas las 2^n combinaciones de las entradas. El bit i de la
+# combinación (inVal) es la entrada i. Hay varias formas de simular:
+#   OP      - Un punto de operación (operating_point) por combinación, cada
+#             uno con un simulador nuevo. Es la original, 2^n simulaciones.
+#   DC      - Un barrido DC de las dos primeras entradas (4 combinaciones con
+#             un solo simulador) por cada valor de las demás: 2^(n-2)
+#             simulaciones.
+#   TRAN    - Todas las combinaciones en un solo transitorio: cada entrada
+#             es una fuente PWL que cambia cada period, y leemos la salida
+#             al final de cada periodo (SAMPLE_AT), cuando ya se estabilizó.
+#             Usa un circuito nuevo con las fuentes PWL, no cambia el del
+#             que llama.
+#   AUTO    - DC si hay hasta dos entradas (es exacto y es una simulación),
+#             si no TRAN.
+#
+# Con workers > 1 repartimos las combinaciones entre procesos, cada uno con
+# su propio circuito y su propio ngspice.
+#
+# El informe (report) es el mismo con todos los métodos.
+# =============================================================================
+
+OP      = 'op'
+DC      = 'dc'
+TRAN    = 'tran'
+AUTO    = 'auto'
+METHODS = (OP, DC, TRAN, AUTO)
+
+# Qué probamos
+GATE    = 'gate'
+PATH    = 'path'
+
+# La duración de cada combinación con TRAN
+DEFAULT_PERIOD  = 2e-9
+
+# El flanco de las fuentes PWL (igual que TpSim.IN_RISE)
+_RISE           = 20e-12
+
+# Con TRAN leemos la salida en esta fracción de cada periodo
+SAMPLE_AT       = 0.9
+
+# Las entradas del barrido DC (ngspice barre una o dos fuentes)
+_DC_INPUTS      = 2
+
+# =============================================================================
+# Los circuitos de prueba
+# =============================================================================
+
+def _new_circuit(tech, title):
+    circuit = Circuit(title)
+    circuit.include(find_libraries() + "/" + tech.LIB_NAME)    #.inclcude "foo.lib"
+    circuit.V('dd', 'Vdd', circuit.gnd, tech.VDD)               # Fuente de tensión Vdd
+    return circuit
+
+# La fuente de una entrada: DC con value, o PWL con los puntos pwl
+def _add_source(circuit, node, value, pwl):
+    if (pwl == None):
+        return circuit.V(node, node, circuit.gnd, value)
+    return circuit.PieceWiseLinearVoltageSource(node, node, circuit.gnd, values=pwl)
+
+# Devuelve (circuit, fuentes de las entradas en orden)
+#   pwl - None para fuentes DC, o los puntos PWL de cada entrada (TRAN)
+def get_gate_circuit(tech, gut, pwl=None):
+    circuit = _new_circuit(tech, "Gate_Test"+type(gut).__name__+"_"+tech.NAME)
+    circuit.subcircuit(gut)                                     # Añadir el subcircuito
+
+    inNodes     = []
+    inFuentes   = []
+    for i in range(gut.get_num_inputs()):
+        node = 'in'+str(i)                                      # in0, in1, ...
+        inNodes.append(node)                                    # Añadir el nodo a la lista
+        inFuentes.append(_add_source(circuit, node, 0, None if (pwl == None) else pwl[i]))
+
+    gut.add_instance(circuit, 1, 'Vdd', inNodes, "Out", tech.W_MIN)
+    return (circuit, inFuentes)
+
+# Devuelve (circuit, fuentes de las entradas en orden): 'In' y después las
+# de put.get_input_sources()
+#   pwl - None para fuentes DC, o los puntos PWL de cada entrada (TRAN)
+def get_path_circuit(tech, put, pwl=None):
+    circuit = _new_circuit(tech, "Gate_Test"+type(put).__name__+"_"+tech.NAME)
+
+    inSources = []
+    if (pwl == None):
+        inSources.append(circuit.V('In', 'In', circuit.gnd, 0))
+        put.add_to_circuit(circuit, 'Vdd', 'In', 'Out')
+    else:
+        inSources.append(_add_source(circuit, 'In', 0, pwl[0]))
+        put.add_to_circuit(circuit, 'Vdd', 'In', 'Out',
+                           add_source=lambda circuit, k, node, value: _add_source(circuit, node, value, pwl[k + 1]))
+
+    # Una ruta tiene otras entradas que están puesto en un valor por defecto
+    # Por un fuente propio por cada entrada (que no es la entrada 'In')
+    inSources += put.get_input_sources()
+    return (circuit, inSources)
+
+# Los valores (0 o 1) de las entradas de la combinación inVal
+def get_inputs(inVal, numInputs):
+    return [1 if (inVal & (1 << i)) else 0 for i in range(numInputs)]
+
+# =============================================================================
+# Las simulaciones. Cada una devuelve la tensión de la salida de las
+# combinaciones first .. first + count - 1
+# =============================================================================
+
+def _get_levels_op(tech, circuit, sources, first, count):
+    voltages = []
+    for inVal in range(first, first + count):
+        for (source, value) in zip(sources, get_inputs(inVal, len(sources))):
+            source.dc_value = tech.VDD if value else 0
+
+        simulator = circuit.simulator(temperature=27, nominal_temperature=27)
+        analysis = simulator.operating_point()
+        voltages.append(float(analysis.out))
+    return voltages
+
+def _get_levels_dc(tech, circuit, sources, first, count):
+    swept = sources[:_DC_INPUTS]
+    block = 2**len(swept)
+
+    voltages = {}
+    for base in range(first - first % block, first + count, block):
+        for (source, value) in zip(sources, get_inputs(base, len(sources))):
+            source.dc_value = tech.VDD if value else 0
+
+        # La primera fuente es la del bucle interno, así el orden de los
+        # resultados es el de inVal
+        simulator = circuit.simulator(temperature=27, nominal_temperature=27)
+        sweep = dict((source.name, slice(0, tech.VDD, tech.VDD)) for source in swept)
+        analysis = simulator.dc(**sweep)
+        for (k, v) in enumerate(np.array(analysis.out, dtype=np.float64)[:block]):
+            voltages[base + k] = float(v)
+
+    return [voltages[inVal] for inVal in range(first, first + count)]
+
+# Los puntos PWL de la entrada i con los valores de todas las combinaciones
+def _get_pwl(tech, i, first, count, period):
+    values = [tech.VDD if (inVal & (1 << i)) else 0 for inVal in range(first, first + count)]
+    points = [(0, values[0])]
+    for k in range(1, count):
+        if (values[k] != values[k - 1]):
+            points += [(k * period, values[k - 1]), (k * period + _RISE, values[k])]
+    points.append((count * period, values[-1]))
+    return points
+
+# El circuito de prueba de una compuerta (GATE) o una ruta (PATH)
+def _get_circuit(tech, kind, target, pwl=None):
+    if (kind == GATE):
+        return get_gate_circuit(tech, target, pwl)
+    return get_path_circuit(tech, target, pwl)
+
+def _get_levels_tran(tech, kind, target, numInputs, first, count, period):
+    pwl = [_get_pwl(tech, i, first, count, period) for i in range(numInputs)]
+    (circuit, sources) = _get_circuit(tech, kind, target, pwl)
+
+    simulator = circuit.simulator(temperature=27, nominal_temperature=27)
+    analysis = simulator.transient(step_time=period / 200, end_time=count * period, max_time=period / 20)
+
+    time = np.array(analysis.time, dtype=np.float64)
+    out = np.array(analysis.out, dtype=np.float64)
+    sampleTimes = (np.arange(count) + SAMPLE_AT) * period
+    return np.interp(sampleTimes, time, out).tolist()
+
+def _get_levels(tech, kind, target, circuit, sources, method, first, count, period):
+    if (method == OP):
+        return _get_levels_op(tech, circuit, sources, first, count)
+    if (method == DC):
+        return _get_levels_dc(tech, circuit, sources, first, count)
+    return _get_levels_tran(tech, kind, target, len(sources), first, count, period)
+
+# Se ejecuta en un proceso del pool: crea su propio circuito (target es el
+# nombre de la clase de la compuerta o la ruta, que llega sin netlist)
+def _run_job(job):
+    (techName, kind, target, method, first, count, period) = job
+    tech = importlib.import_module(techName)
+    if (kind == GATE):
+        target = getattr(tech, target)()
+    (circuit, sources) = _get_circuit(tech, kind, target)
+    return _get_levels(tech, kind, target, circuit, sources, method, first, count, period)
+
+# El método que usa AUTO
+def get_method(method, numInputs):
+    if (method != AUTO):
+        return method
+    return DC if (numInputs <= _DC_INPUTS) else TRAN
+
+# Las tensiones de la salida de todas las combinaciones, en el orden de inVal
+#   kind        - GATE o PATH
+#   target      - La compuerta o la ruta
+#   circuit, sources - Los de get_gate_circuit / get_path_circuit (para
+#                 simular en este proceso)
+#   method      - Ver el comentario al comienzo
+#   period      - La duración de cada combinación con TRAN
+#   workers     - El número de procesos
+def get_output_voltages(tech, kind, target, circuit, sources, method=OP, period=DEFAULT_PERIOD, workers=1):
+    numVectors = 2**len(sources)
+    method = get_method(method, len(sources))
+
+    if ((workers <= 1) or (numVectors < 2 * workers)):
+        return _get_levels(tech, kind, target, circuit, sources, method, 0, numVectors, period)
+
+    # Los trozos de cada proceso (con DC, barridos completos)
+    block = 2**min(_DC_INPUTS, len(sources)) if (method == DC) else 1
+    size = -(-numVectors // (workers * block)) * block
+    if (kind == GATE):
+        target = type(target).__name__
+    jobs = [(tech.__name__, kind, target, method, first, min(size, numVectors - first), period)
+            for first in range(0, numVectors, size)]
+    with multiprocessing.Pool(workers) as pool:
+        results = pool.map(_run_job, jobs)
+    return [v for voltages in results for v in voltages]
+
+# El informe de la prueba: cada combinación con su salida y los errores
+#   get_expected    - Devuelve la salida esperada de una lista de entradas
+# Devuelve el número de errores
+def report(tech, numInputs, voltages, get_expected):
+    errors = 0
+    # 1 entrada  - 2 combinaciones
+    # 2 entradas - 4 combinaciones
+    # 3 entradas - 8 combinaciones
+    # n entradas - 2^n combinaciones
+    for (inVal, outputVoltage) in enumerate(voltages):
+        inputs = get_inputs(inVal, numInputs)
+        expectedOutput = get_expected(inputs)
+
+        if (outputVoltage > tech.VDD - 0.1):
+            actualOutput = 1
+        elif (outputVoltage < 0.1):
+            actualOutput = 0
+        else:
+            print(str(outputVoltage) + "V is not a valid logic level")
+            errors += 1
+            continue
+
+        print("Inputs: " + str(inputs) + " Output: " + str(actualOutput))
+
+        if (actualOutput != expectedOutput):
+            print("  Error: " + str(expectedOutput) + " expected");
+            errors += 1
+
+    print("Test finished with " + str(errors) + " errors")
+    return errors
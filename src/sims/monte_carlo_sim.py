@@ -1,5 +1,6 @@
 import os
 from datetime import datetime
+import logging, verboselogs
 import time
 import random
 
@@ -15,77 +16,208 @@ import numpy as np
 from dataclasses import dataclass
 from typing import List
 
+from sims   import tp_sim                   # La simulación de un Tp
+from sims   import sim_pool                 # Para simular en paralelo
+from sims   import result_store             # Para guardar los resultados en disco
+from sims   import eval_cache               # Para no simular los mismos anchos otra vez
+from sims   import optimizers               # Las estrategias que generan los candidatos
+from sims   import le_prefilter             # Para no simular candidatos que logical effort dice que son peores
+from sims   import checkpoint               # Para continuar una ejecución interrumpida
+from sims   import phase_timer              # Los tiempos de cada fase
+
 @dataclass
 class Result:
     tp:         float
     widths:     List[float]
 
-def _get_widths_str(widths):
-    res = ""
-    for i, w in enumerate(widths):
-        if (i != 0):
-            res += ", "
-        res += "%.2fe-6" % (w*1e6)
-
-    return res
-
-def _get_tp(circuit, tech, put, sim_time, step_time, logger):
-    # ======================
-    # Ejecutar la simulación
-    # ======================
-    simulator = circuit.simulator(temperature=27, nominal_temperature=27)
-    analysis = simulator.transient(end_time=sim_time, step_time=step_time)
-
-    # ===============
-    # Encontrar el Tp
-    # ===============
-    in_rises = 0
-    out_transitions = 0
-
-    # usamos la función zip() para construir un tuple así que
-    # podríamos iterar por los dos arrays al mismo tiempo
-    # v es la tensión del nodo in y t es el tiempo de la muestra
-
-    # Prhimero encontrar la transición de la entrada
-    for (v,t) in zip(analysis['in'], analysis['in'].abscissa):
-        if (float(v) >= (tech.VDD / 2)):
-            in_rises = t
-            logger.debug("In rises past 50%% at %s", str(in_rises.convert_to_power(-12)))
-            break
+# Los criterios que pueden terminar una ejecución (ver RunSummary.stop_reason)
+STOP_NUM_SIMS       = 'num_sims'        # hicimos num_sims simulaciones
+STOP_CONVERGED      = 'converged'       # el optimizador convergió
+STOP_TIME_BUDGET    = 'time_budget'     # se acabó el tiempo
+STOP_PATIENCE       = 'patience'        # patience simulaciones sin mejorar
+STOP_TARGET_TP      = 'target_tp'       # encontramos un Tp <= target_tp
+
+# El resumen de una ejecución de do_monte_carlo_sim
+#   sims_to_best        - la simulación (1, 2, ...) que encontró el mejor Tp
+#   sims_to_converge    - la primera simulación con un Tp a menos de
+#                         CONVERGED_PERCENT del mejor
+#   history             - (simulación, tp) de cada mejor Tp que encontramos
+#   stop_reason         - el criterio que terminó la ejecución (STOP_*)
+@dataclass
+class RunSummary:
+    optimizer:          str
+    tp:                 float
+    widths:             List[float]
+    num_sims:           int
+    sims_to_best:       int
+    sims_to_converge:   int
+    time:               float
+    history:            List
+    stop_reason:        str = STOP_NUM_SIMS
+    initial_widths:     List[float] = None  # los anchos con los que comenzó
+
+# Ver RunSummary.sims_to_converge
+CONVERGED_PERCENT = 1.0
+
+# Las tolerancias de ngspice de la fidelidad gruesa (ver coarse_step)
+# Los valores por defecto de ngspice son reltol = 1e-3, abstol = 1e-12, vntol = 1e-6
+COARSE_SPICE_OPTIONS = {'reltol': 1e-2, 'abstol': 1e-10, 'vntol': 1e-4}
+
+# Con las estrategias que necesitan Tps exactos (ver Optimizer.EXACT_TPS) la
+# simulación dura el mejor Tp * EXACT_TPS_MARGIN, así los candidatos un
+# poco peores también tienen un Tp
+EXACT_TPS_MARGIN = 2.0
 
-    # Después encontrar la trasición de la salida
-    for (v, t) in zip(analysis['out'], analysis['out'].abscissa):
-        # la salida será un flanco ascendente o descendente?
-        if (put.inverts()):
-            if (float(v) <= (tech.VDD / 2)):
-                out_transitions = t
-                logger.debug("Out falls past 50%% at %s", str(out_transitions.convert_to_power(-12)))
-                break
-        else:
-            if (float(v) >= (tech.VDD / 2)):
-                out_transitions = t
-                logger.debug("Out rises past 50%% at %s", str(out_transitions.convert_to_power(-12)))
-                break
-
-    # =====================
-    # Devolver el resultado
-    # =====================
-    if (out_transitions == 0):
-        # La duración de simulación no estuvo suficiente largo
-        return -1
-    else:
-        return float(out_transitions - in_rises)
+def _get_widths_str(widths):
+    return ", ".join("%.2fe-6" % (w*1e6) for w in widths)
+
+# Los Tps de los candidatos, usando el cache (si hay) y simulando solo los que
+# no están en el cache
+def _get_tps(pool, cache, candidates, sim_time):
+    if (cache == None):
+        return pool.get_tps(candidates, sim_time)
+
+    tps = [cache.get(widths, sim_time) for widths in candidates]
+    misses = [i for (i, tp) in enumerate(tps) if (tp == None)]
+    if (len(misses) > 0):
+        simulated = pool.get_tps([candidates[i] for i in misses], sim_time)
+        for (i, tp) in zip(misses, simulated):
+            cache.put(candidates[i], sim_time, tp)
+            tps[i] = tp
+
+    return tps
+
+# Guarda el estado de do_monte_carlo_sim (ver checkpoint.py)
+def _save_checkpoint(filename, runKey, seed, l, sim_time, succesfull_run, bestResult, rng, pool, finePool, logger):
+    state = {'key':             runKey,
+             'seed':            seed,
+             'sim_count':       l,
+             'sim_time':        sim_time,
+             'succesfull_run':  succesfull_run,
+             'best':            (bestResult.tp, list(bestResult.widths)),
+             'rng_state':       rng.getstate(),
+             'tps':             {'main': list(pool.get_record()),
+                                 'fine': [] if (finePool is pool) else list(finePool.get_record())}}
+    checkpoint.save_checkpoint(filename, state, logger)
+    logger.verbose("Checkpoint at simulation %d written to %s", l, filename)
+
+# Un pool que usa el cache (ver _get_tps). Con checkpoint_file lo envolvemos en
+# un ReplayPool, así guardamos los Tps con los aciertos del cache incluidos
+# (el archivo del cache puede cambiar antes de continuar)
+class _CachedPool:
+
+    def __init__(self, pool, cache):
+        self.__pool     = pool
+        self.__cache    = cache
+
+    def get_workers(self):
+        return self.__pool.get_workers()
+
+    def get_batch_size(self):
+        return self.__pool.get_batch_size()
+
+    def get_tps(self, candidates, sim_time):
+        return _get_tps(self.__pool, self.__cache, candidates, sim_time)
+
+    def close(self):
+        self.__pool.close()
 
 # tech          - La tecnologia usar
 # put           - Path Under Test (Ruta bajo prueba)
 # step_time     - El escalon máximo para usar en la simulación
 # num_sims      - El número de simulaciones
-#                   Falta de memoria después de ~50,000 simulaciones
 #                   Normalmente encontramos el mejor antes de 5,000 simulaciones
 # plot_result   - Muestra una grafica de la simulación mejor al final
+#                 Si no, ngspice solo guarda los nodos in y out (ver TpSim)
 # cvs           - Escribir los resultados a este archivo en formato .cvs (None si no quieres)
+#                 Durante la simulación los resultados van a <cvs>.rows (ver
+#                 ResultStore), que borramos después de escribir el .cvs
+# results_file  - Escribir los resultados a este archivo en formato binario .npy
+#                 (None si no quieres). Ver result_store.load_results
+# cache         - No simular candidatos con los mismos anchos (redondeados a
+#                 cache_grid) que otros que ya simulamos (ver EvalCache)
+# cache_grid    - El tamaño de la rejilla de los anchos del cache
+# cache_size    - El número máximo de entradas en el cache
+# cache_file    - Leer el cache de este archivo al comienzo y escribirlo al
+#                 final, para compartirlo entre ejecuciones. Implica cache.
 # logger        - El logger (debería estar VerboseLogger)
 #                 Los niveles usados son: WARNING, INFO, VERBOSE, DEBUG
+# workers       - El número de procesos para simular en paralelo.
+#                 Cada ronda simula workers candidatos, todos generados desde
+#                 el mejor resultado al comienzo de la ronda.
+#                 Con workers = 1 es igual que antes (una simulación por ronda).
+# seed          - Semilla del generador aleatorio (None para usar el tiempo del sistema)
+#                 Con la misma semilla y el mismo workers los resultados son iguales.
+# session       - Cargar el netlist una vez en ngspice y solo cambiar los anchos
+#                 para cada simulación (ver TpSim)
+# meas          - Calcular el Tp en ngspice con .meas en lugar de buscar las
+#                 transiciones en las formas de onda (ver TpSim)
+# early_stop    - Terminar cada simulación apenas la salida cruza VDD/2 y no
+#                 simular más que el mejor Tp * stop_margin. Los candidatos
+#                 que no terminan así son peores que el mejor (ver TpSim)
+# stop_margin   - El margen sobre el mejor Tp con early_stop
+
+# optimizer     - La estrategia que genera los candidatos (ver optimizers.OPTIMIZERS)
+#                 'random' es la búsqueda original (método 3). Las demás pueden
+#                 terminar antes de num_sims si convergen.
+# le_margin     - No simular los candidatos cuyo retardo según logical effort es
+#                 más de le_margin (e.g. 0.05) peor que el del mejor
+#                 (ver LEPrefilter). None para simular todos.
+#                 Los candidatos descartados cuentan en num_sims.
+# le_audit      - La fracción de los candidatos descartados que simulamos de
+#                 todos modos para medir cuantos eran mejores
+# batch         - El número de copias de la ruta en el netlist. Cada tran
+#                 simula batch candidatos (ver TpSim copies), y cada ronda
+#                 tiene workers * batch candidatos. No funciona con early_stop.
+# coarse_step   - Simular todos los candidatos primero con este escalon máximo
+#                 y las tolerancias de COARSE_SPICE_OPTIONS (fidelidad gruesa),
+#                 y solo los que pueden ser mejores otra vez con step_time
+#                 (fidelidad fina). Solo un Tp fino puede ser el mejor (también
+#                 el del optimizador) y el .cvs / results_file solo tiene los
+#                 finos. La simulación del mejor y la de logical effort siempre
+#                 son finas.
+#                 None para simular todo con step_time.
+# fine_margin   - Simular con step_time los candidatos con Tp grueso a menos
+#                 de fine_margin (e.g. 0.02) del mejor
+# fine_top_k    - Y como máximo los fine_top_k mejores de cada ronda (None para
+#                 todos)
+# checkpoint_file - Guardar el estado de la ejecución a este archivo cada
+#                 checkpoint_every simulaciones y al final (None si no quieres)
+#                 Sin seed usamos una semilla aleatoria (la guardamos).
+# checkpoint_every - Ver checkpoint_file
+# resume        - Continuar la ejecución de este checkpoint. Repetimos las
+#                 simulaciones guardadas sin simular (ver checkpoint.py), así
+#                 el resultado es el mismo que sin la interrupción. Los demás
+#                 argumentos deben ser los mismos (menos num_sims, que puede
+#                 ser más grande). La semilla es la del checkpoint. Si no hay
+#                 checkpoint_file seguimos guardando en resume.
+#                 Ojo: la última ronda se recorta a num_sims, así el
+#                 checkpoint del final solo es exacto si num_sims es un
+#                 múltiplo de workers * batch (los periódicos siempre lo son)
+# surrogate_file - El archivo de muestras del optimizador 'surrogate' (ver
+#                 SurrogateOptimizer), para usar las de otras ejecuciones
+# time_budget   - Terminar después de time_budget segundos (None para no
+#                 limitar el tiempo). Lo comprobamos después de cada ronda.
+# patience      - Terminar después de patience simulaciones sin que el mejor
+#                 Tp mejore más de patience_epsilon (None para no terminar)
+# patience_epsilon - La mejora relativa (e.g. 0.001 = 0.1%) que cuenta para
+#                 patience. Las mejoras más pequeñas cambian el mejor pero no
+#                 reinician la cuenta.
+# target_tp     - Terminar cuando el mejor Tp es <= target_tp (None para no
+#                 terminar)
+# timing_file   - Escribir los tiempos de cada fase de cada ronda a este archivo,
+#                 una línea JSON por ronda (ver TimingStream). None si no quieres.
+#                 Al final siempre mostramos el informe de las fases
+#                 (ver phase_timer.PHASES) con totales y percentiles.
+# widths        - Los anchos iniciales (None para los que tiene la ruta con el
+#                 netlist nuevo), ver RunSummary.initial_widths
+# double_sim_time - Mientras la salida no transiciona, doblar el incremento de
+#                 la duración de la simulación cada vez (para rutas largas que
+#                 necesitan muchos ns). False: 100ps cada vez, como siempre.
+# Terminamos con el primero de num_sims, time_budget, patience o target_tp
+# (o cuando el optimizador converge), ver RunSummary.stop_reason
+#
+# Devuelve un RunSummary
 
 # Ejemplo:
 #   from tech   import TSMC180              as tech     # Tecnologia que queremos usar
@@ -99,9 +231,50 @@ def _get_tp(circuit, tech, put, sim_time, step_time, logger):
 #   put = path.InversorChainPath(tech, 5)
 #   mcs.do_monte_carlo_sim(tech, put, 1e-9, 10000, None, True)
 
-def do_monte_carlo_sim(tech, put, step_time, num_sims, plot_result, cvs, logger):
-    # initialisar el generador alatoria usando el tiempo del sistema
-    random.seed()
+def do_monte_carlo_sim(tech, put, step_time, num_sims, plot_result, cvs, logger, workers=1, seed=None, session=False, meas=False,
+                       early_stop=False, stop_margin=1.1, results_file=None,
+                       cache=False, cache_grid=1e-9, cache_size=100000, cache_file=None,
+                       optimizer='random', le_margin=None, le_audit=0.0,
+                       surrogate_file=None, batch=1, coarse_step=None, fine_margin=0.02, fine_top_k=None,
+                       checkpoint_file=None, checkpoint_every=1000, resume=None,
+                       time_budget=None, patience=None, patience_epsilon=0.001, target_tp=None,
+                       timing_file=None, widths=None, double_sim_time=False):
+    # Estos argumentos tienen que ser iguales para continuar un checkpoint
+    runKey = {'path': put.name(), 'tech': tech.NAME, 'load': put.get_load(), 'step_time': step_time,
+              'optimizer': optimizer, 'round_size': workers * batch, 'early_stop': early_stop,
+              'stop_margin': stop_margin, 'coarse_step': coarse_step, 'le_margin': le_margin}
+    # Solo si no es el por defecto, así los checkpoints anteriores siguen valiendo
+    if (double_sim_time):
+        runKey['double_sim_time'] = True
+
+    # Los Tps de las simulaciones del checkpoint, de cada fidelidad
+    recorded = {'main': [], 'fine': []}
+    resumeState = None
+    if (resume != None):
+        resumeState = checkpoint.load_checkpoint(resume, logger)
+        if (resumeState == None):
+            return
+        if (resumeState['key'] != runKey):
+            logger.error("Checkpoint %s is for a different run (%s), aborting", resume, resumeState['key'])
+            return
+        seed = resumeState['seed']
+        recorded = resumeState['tps']
+        if (checkpoint_file == None):
+            checkpoint_file = resume
+        logger.info("Resuming from %s at simulation %d, best Tp %e",
+                    resume, resumeState['sim_count'], resumeState['best'][0])
+    elif ((checkpoint_file != None) and (seed == None)):
+        # Necesitamos una semilla para poder continuar
+        seed = random.randrange(2**32)
+        logger.info("Using seed %d", seed)
+
+    # initialisar el generador alatoria usando la semilla
+    # o el tiempo del sistema si seed es None
+    rng = random.Random(seed)
+
+    if (early_stop and (batch > 1)):
+        logger.error("early_stop doesn't work with batch > 1, aborting")
+        return
 
     # Abrir el archivo de .cvs
     if (cvs != None):
@@ -112,22 +285,88 @@ def do_monte_carlo_sim(tech, put, step_time, num_sims, plot_result, cvs, logger)
             return
 
 
-    logger.info("Running Monte Carlo simulation with path %s, tech %s, with step_time %e, num_sims %d", put.name(), tech.NAME, step_time, num_sims)
+    logger.info("Running Monte Carlo simulation with path %s, tech %s, with step_time %e, num_sims %d, workers %d, batch %d, session %s, meas %s, early_stop %s, optimizer %s",
+                put.name(), tech.NAME, step_time, num_sims, workers, batch, session, meas, early_stop, optimizer)
 
     # ==================
     # Generar el netlist
     # ==================
-    libraries_path = find_libraries()
-    circuit = Circuit("Monte_Carlo_Sim_"+put.name()+"_"+tech.NAME)
-    circuit.include(libraries_path + "/" + tech.LIB_NAME)   #.inclcude "foo.lib"
-
-    vdd = circuit.V('dd', 'Vdd', circuit.gnd, tech.VDD)     # Fuente de tensión Vdd
-
-    # Fuente de tensión de pulses que usamos como la entrada de la ruta
-    vin = circuit.PulseVoltageSource("In", "In", circuit.gnd, initial_value=0, pulsed_value=tech.VDD, pulse_width=1e-9, period=2e-9, delay_time=10e-12, rise_time=20e-12, fall_time=20e-12)
-
-    # La ruta que queremos probar
-    put.add_to_circuit(circuit, 'Vdd', 'In', 'Out')
+    # Para plotear necesitamos todos los nodos, si no solo guardamos in y out
+    probes = None if plot_result else tp_sim.TpSim.DEFAULT_PROBES
+    sim = tp_sim.TpSim(tech, put, step_time, logger, session, meas, early_stop=early_stop, probes=probes,
+                       copies=batch)
+
+    # Los procesos que hacen las simulaciones
+    # (con workers = 1 usamos sim en este proceso)
+    finePool = sim_pool.SimPool(sim, workers)
+
+    # Con coarse_step, otro TpSim para la fidelidad gruesa. pool es el que
+    # simula todos los candidatos
+    pool = finePool
+    if (coarse_step != None):
+        (rebuild, args) = put.__reduce__()
+        coarseSim = tp_sim.TpSim(tech, rebuild(*args), coarse_step, logger, session, meas,
+                                 early_stop=early_stop, copies=batch, spice_options=COARSE_SPICE_OPTIONS)
+        pool = sim_pool.SimPool(coarseSim, workers)
+
+    # Los tiempos de las fases: de las simulaciones de cada fidelidad y del
+    # bucle de este proceso (propose, prefilter, observe)
+    loopTimer = phase_timer.PhaseTimer()
+    timers = {'fine': sim.get_timer()}
+    if (coarse_step != None):
+        timers['coarse'] = coarseSim.get_timer()
+    timers['loop'] = loopTimer
+
+    timingStream = None
+    if (timing_file != None):
+        try:
+            timingStream = phase_timer.TimingStream(timing_file, timers)
+        except OSError:
+            logger.error("Failed to open %s for writing, not streaming timings", timing_file)
+
+    # El tiempo y el número de simulaciones de cada fidelidad
+    coarseTime = 0.0
+    coarseSims = 0
+    fineTime = 0.0
+    fineSims = 0
+
+    # Los anchos iniciales
+    if (widths != None):
+        put.set_widths(widths)
+    initialWidths = put.get_widths()
+
+    # La estrategia que genera los candidatos
+    opt = optimizers.get_optimizer(optimizer, tech, put, initialWidths, rng, logger, pool.get_batch_size(),
+                                   {'model_file': surrogate_file})
+    exactMargin = EXACT_TPS_MARGIN if opt.EXACT_TPS else 1.0
+
+    # El prefiltro de logical effort (None si no lo usamos)
+    prefilter = None
+    if (le_margin != None):
+        prefilter = le_prefilter.LEPrefilter(put, le_margin, le_audit, seed)
+
+    # El cache de Tps (None si no lo usamos)
+    evalCache = None
+    if (cache or (cache_file != None)):
+        if (coarse_step == None):
+            evalCache = eval_cache.EvalCache(tech, put, step_time, logger, cache_grid, cache_size, cache_file,
+                                             'fine', meas)
+        else:
+            evalCache = eval_cache.EvalCache(tech, put, coarse_step, logger, cache_grid, cache_size, cache_file,
+                                             'coarse', meas, COARSE_SPICE_OPTIONS)
+
+    # Para guardar (y repetir) los Tps de las simulaciones
+    # (loopCache es el cache que usamos en el bucle, None si pool ya lo usa)
+    loopCache = evalCache
+    if (checkpoint_file != None):
+        mainPool = pool if (evalCache == None) else _CachedPool(pool, evalCache)
+        loopCache = None
+        if (pool is not finePool):
+            finePool = checkpoint.ReplayPool(finePool, recorded['fine'])
+            pool = checkpoint.ReplayPool(mainPool, recorded['main'])
+        else:
+            pool = checkpoint.ReplayPool(mainPool, recorded['main'])
+            finePool = pool
 
     # ======================
     # Hacer las simulaciones
@@ -142,103 +381,269 @@ def do_monte_carlo_sim(tech, put, step_time, num_sims, plot_result, cvs, logger)
     sim_time_step = 100e-12
     # Once we've seen a succesfull transisition (sim time was long enough)
     # we reduce simulation time to bestResult.tp + 50ps
+    # (or to the input transition + bestResult.tp * stop_margin with early_stop)
     succesfull_run = False
 
+    # Con early_stop, cuantos candidatos no terminaron antes del mejor Tp * stop_margin
+    worseThanBest = 0
+
     # Hay varios resultados con el mismo (o muy parecido) Tp
     # Si una simulación da un Tp un poco peor (1%?) peor usa menos area, deberíamos
     # usar esto resultado cómo el mejor.
     TP_FLEX_PERCENT = 1.0
 
     # guardamos el mejor resultado
-    bestResult = Result(100.0, put.get_widths())
-
-    # Y guardamos un array de todos los resultados
-    allResults = []
-
-    for l in range(1,num_sims+1):
-
-        widths = put.get_widths()
-        totalWidth = sum(widths)
-
-        logger.debug("Running simulation with widths: [%s], sim_time %e, step_time %e", _get_widths_str(widths), sim_time, step_time)
+    bestResult = Result(100.0, initialWidths)
+
+    # Y guardamos todos los resultados en disco, por trozos
+    # (solo los necesitamos para el .cvs)
+    results = None
+    if ((cvs != None) or (results_file != None)):
+        rowsFile = (cvs if (cvs != None) else results_file) + ".rows"
+        results = result_store.ResultStore(rowsFile, len(initialWidths))
+        logger.verbose("Streaming results to %s", results.get_filename())
+
+    # Cuando encontramos cada mejor Tp: (simulación, tp)
+    bestHistory = []
+
+    # La simulación del último checkpoint
+    lastCheckpoint = 0
+
+    # Para patience: la última simulación que mejoró el Tp más de
+    # patience_epsilon, y ese Tp
+    lastImprovement = 0
+    improvementTp = bestResult.tp
+
+    # El criterio que terminó la ejecución
+    stopReason = STOP_NUM_SIMS
+
+    l = 0
+    while (l < num_sims):
+
+        # ====================================
+        # Generar los candidatos de esta ronda
+        # ====================================
+
+        # (ver optimizers por las estrategias)
+        with loopTimer.phase('propose'):
+            candidates = opt.propose(min(pool.get_batch_size(), num_sims - l))
+        if (len(candidates) == 0):
+            logger.info("Optimizer %s converged after %d simulations", opt.name(), l)
+            stopReason = STOP_CONVERGED
+            break
 
-        tp = _get_tp(circuit, tech, put, sim_time, step_time, logger)
-        if (tp < 0):
-            # La duración de simulación no estuvo suficiente largo
-            # Si vimos una transición antes, entonces es claro que esto no puede ser mejor.
-            # Pero si nunca vimos una transición antes, incrementamos la duración
-            if (not succesfull_run):
-                sim_time += sim_time_step
-                logger.verbose("Out never transititons, increasing simulation time to %e", sim_time)
-            else:
-                logger.debug("Out never transititons")
+        # Descartar los candidatos que según logical effort son mucho peores
+        # que el mejor (cuando ya tenemos uno)
+        actions = [le_prefilter.SIMULATE] * len(candidates)
+        if ((prefilter != None) and succesfull_run):
+            with loopTimer.phase('prefilter'):
+                actions = prefilter.check(candidates, bestResult.widths)
+        toSim = [widths for (widths, action) in zip(candidates, actions) if (action != le_prefilter.PRUNE)]
+
+        # Con cientos de anchos el texto cuesta más que la simulación, así
+        # solo lo generamos si lo vamos a mostrar
+        if (logger.isEnabledFor(logging.DEBUG)):
+            for widths in toSim:
+                logger.debug("Running simulation with widths: [%s], sim_time %e, step_time %e", _get_widths_str(widths), sim_time, step_time)
+
+        ps = time.time()
+        simTps = iter(_get_tps(pool, loopCache, toSim, sim_time))
+        if (coarse_step == None):
+            fineTime += time.time() - ps
+            fineSims += len(toSim)
         else:
-            succesfull_run = True
-
-            logger.verbose("tp: %e, widths: [%s], totalWidth: %e", tp, _get_widths_str(widths), totalWidth)
-
-            allResults.append(Result(tp, widths))
-
-            # este resultado tiene menor tp que el corriente mejor?
-            if (tp < bestResult.tp):
-                logger.verbose("  New Best Tp")
-                bestResult = Result(tp, widths)
-
-                # reducir la duración de la simulación a tp + 50ps
-                sim_time = tp + 50e-12
-
-        # =====================
-        # Actualizar los anchos
-        # =====================
-
-        # Usamos los mejores anchos que encontramos como base
-        widths = list(bestResult.widths)    # tomar una copia
-
-        #-------------------------------------------------------------------
-        # Método 1: Cambiar todos los ancho aleatoriamente
-        #-------------------------------------------------------------------
-        #for idx in range(1, len(widths)):
-        #    width = random.uniform(tech.W_MIN, put.get_max_width())
-        #    widths[idx] = width
-
-        #----------------------------------------------------------------
-        # Método 2: Cambiar un ancho aleatoriamente adentro todo el rango
-        #----------------------------------------------------------------
-
-        # Generar un ancho aleatoriamente entre tech.W_MIN y put.get_max_width()
-        #width = random.uniform(tech.W_MIN, put.get_max_width())
-
-        # Elegir cual ancho cambiar (no elegimos el primero)
-        #idx = random.randint(1, len(widths)-1)
-        #widths[idx] = width
-
-        #----------------------------------------------------------------------
-        # Método 3: Cambiar todos los ancho aleatoriamente en el rango de 0.5w
-        #           a 2w. Dónde w es el ancho actual.
-        #----------------------------------------------------------------------
-        for idx in range(1, len(widths)):
-            minWidth = max(tech.W_MIN, widths[idx]/2)
-            maxWidth = min(put.get_max_width(), widths[idx]*2)
-            width = random.uniform(minWidth, maxWidth)
-
-            logger.debug("curr_width %e, minWidth %e, maxWidth %e, new width %e",
-                          widths[idx], minWidth, maxWidth, width)
-
-            widths[idx] = width
+            coarseTime += time.time() - ps
+            coarseSims += len(toSim)
+
+        # El Tp de los descartados es None
+        tps = [None if (action == le_prefilter.PRUNE) else next(simTps) for action in actions]
+
+        # isFine[i] es True si tps[i] es de fidelidad fina
+        isFine = [coarse_step == None] * len(candidates)
+        if (coarse_step != None):
+            # Simular otra vez con step_time los que pueden ser mejores
+            limit = bestResult.tp * (1.0 + fine_margin)
+            promising = [i for (i, tp) in enumerate(tps) if ((tp != None) and (tp >= 0) and (tp <= limit))]
+            promising.sort(key=lambda i: tps[i])
+            if (fine_top_k != None):
+                promising = promising[:fine_top_k]
+
+            ps = time.time()
+            fineTps = finePool.get_tps([candidates[i] for i in promising], sim_time)
+            fineTime += time.time() - ps
+            fineSims += len(promising)
+
+            for (i, tp) in zip(promising, fineTps):
+                logger.debug("Coarse tp %e, fine tp %e", tps[i], tp)
+                tps[i] = tp
+                isFine[i] = True
+        for (tp, action) in zip(tps, actions):
+            if (action == le_prefilter.AUDIT):
+                prefilter.audit_result(tp, bestResult.tp)
+
+        # ==========================================
+        # Procesar los resultados en el mismo orden
+        # que los candidatos
+        # ==========================================
+        for (widths, tp, fine) in zip(candidates, tps, isFine):
+            l += 1
+            totalWidth = sum(widths)
+
+            if (tp == None):
+                if (logger.isEnabledFor(logging.DEBUG)):
+                    logger.debug("Pruned by logical effort, widths: [%s]", _get_widths_str(widths))
+            elif (tp < 0):
+                # La duración de simulación no estuvo suficiente largo
+                # Si vimos una transición antes, entonces es claro que esto no puede ser mejor.
+                # Pero si nunca vimos una transición antes, incrementamos la duración
+                if (not succesfull_run):
+                    sim_time += sim_time_step
+                    # Una ruta larga puede necesitar muchos ns, así cada
+                    # incremento es el doble del anterior
+                    if (double_sim_time):
+                        sim_time_step *= 2
+                    logger.verbose("Out never transititons, increasing simulation time to %e", sim_time)
+                elif (early_stop):
+                    worseThanBest += 1
+                    logger.debug("Worse than best, stopped at %e", sim_time)
+                else:
+                    logger.debug("Out never transititons")
+            else:
+                succesfull_run = True
+
+                if (logger.isEnabledFor(verboselogs.VERBOSE)):
+                    logger.verbose("tp: %e, widths: [%s], totalWidth: %e", tp, _get_widths_str(widths), totalWidth)
+
+                # Solo guardamos los Tps finos, los gruesos no son comparables
+                if (fine and (results != None)):
+                    results.append(tp, widths)
+
+                # este resultado tiene menor tp que el corriente mejor?
+                # (solo los Tps finos pueden ser el mejor)
+                if (fine and (tp < bestResult.tp)):
+                    logger.verbose("  New Best Tp")
+                    bestResult = Result(tp, widths)
+                    bestHistory.append((l, tp))
+
+                    if (tp < improvementTp * (1.0 - patience_epsilon)):
+                        lastImprovement = l
+                        improvementTp = tp
+
+                    if (early_stop):
+                        # no simular más que el mejor tp * stop_margin
+                        sim_time = sim.get_in_cross_time() + tp * max(stop_margin, exactMargin)
+                    else:
+                        # reducir la duración de la simulación a tp + 50ps
+                        sim_time = tp * exactMargin + 50e-12
+
+            if (l % 100 == 0):
+                logger.info("Ran %d / %d (%.1f%%)", l, num_sims, (100.0 * l)/num_sims)
+
+        # Para el optimizador un descartado es como uno que no transiciona
+        with loopTimer.phase('observe'):
+            opt.observe(candidates, [-1 if (tp == None) else tp for tp in tps], isFine)
+
+        if (timingStream != None):
+            timingStream.write(l, best_tp=bestResult.tp, sim_time=sim_time)
+
+        if ((resumeState != None) and (l >= resumeState['sim_count']) and (lastCheckpoint < resumeState['sim_count'])):
+            # Terminamos de repetir el checkpoint, debemos estar en el mismo estado
+            logger.info("Resumed at simulation %d, best Tp %e", l, bestResult.tp)
+            if ((l != resumeState['sim_count']) or (rng.getstate() != resumeState['rng_state']) or
+                (bestResult.tp != resumeState['best'][0])):
+                logger.warning("The replayed run doesn't match checkpoint %s, results may differ", resume)
+            lastCheckpoint = l
+
+        if ((checkpoint_file != None) and (l - lastCheckpoint >= checkpoint_every)):
+            _save_checkpoint(checkpoint_file, runKey, seed, l, sim_time, succesfull_run, bestResult,
+                             rng, pool, finePool, logger)
+            lastCheckpoint = l
+
+        # ===================================
+        # ¿Terminar antes de num_sims?
+        # ===================================
+        if ((target_tp != None) and (bestResult.tp <= target_tp)):
+            stopReason = STOP_TARGET_TP
+            break
+        if ((patience != None) and succesfull_run and (l - lastImprovement >= patience)):
+            stopReason = STOP_PATIENCE
+            break
+        if ((time_budget != None) and (time.time() - ts >= time_budget)):
+            stopReason = STOP_TIME_BUDGET
+            break
 
-        # Hazlo
-        put.set_widths(widths)
+    if (checkpoint_file != None):
+        _save_checkpoint(checkpoint_file, runKey, seed, l, sim_time, succesfull_run, bestResult,
+                         rng, pool, finePool, logger)
+        logger.info("Wrote checkpoint %s at simulation %d", checkpoint_file, l)
 
-        if (l % 100 == 0):
-            logger.info("Ran %d / %d (%.1f%%)", l, num_sims, (100.0 * l)/num_sims)
+    pool.close()
+    if (pool is not finePool):
+        finePool.close()
+    opt.close()
 
     te = time.time();
 
+    if (timingStream != None):
+        timingStream.close()
+
     # ======================
     # Mostrar los resultados
     # ======================
-    logger.info("Took %ds to run %d simulations", int(te - ts), num_sims);
+    logger.info("Took %ds to run %d simulations (%.2fms per simulation, %.1f simulations/s)",
+                int(te - ts), l, (1000.0 * (te - ts)) / max(1, l), l / max(te - ts, 1e-9));
+    for (name, timer) in timers.items():
+        # Con workers > 1 las fases de las simulaciones son la suma de todos los procesos
+        title = ("%s TpSim" % name.capitalize()) if (name != 'loop') else "Main loop"
+        if ((name != 'loop') and (workers > 1)):
+            title += " (summed over %d workers)" % workers
+        timer.log_report(logger, title, te - ts)
     logger.info("Best Tp %e, Widths [%s]", bestResult.tp, _get_widths_str(bestResult.widths))
+    if (stopReason == STOP_TARGET_TP):
+        logger.info("Stopped by target_tp: reached Tp <= %e after %d / %d simulations", target_tp, l, num_sims)
+    elif (stopReason == STOP_PATIENCE):
+        logger.info("Stopped by patience: no improvement over %.2f%% in the last %d simulations (%d / %d run)",
+                    100.0 * patience_epsilon, l - lastImprovement, l, num_sims)
+    elif (stopReason == STOP_TIME_BUDGET):
+        logger.info("Stopped by time_budget: %.1fs >= %.1fs after %d / %d simulations",
+                    te - ts, time_budget, l, num_sims)
+    else:
+        logger.info("Stopped by %s after %d / %d simulations", stopReason, l, num_sims)
+    if (coarse_step != None):
+        logger.info("Coarse fidelity (step %e): %d simulations in %.1fs (%.2fms per simulation)",
+                    coarse_step, coarseSims, coarseTime, (1000.0 * coarseTime) / max(1, coarseSims))
+    logger.info("Fine fidelity (step %e): %d simulations in %.1fs (%.2fms per simulation)",
+                step_time, fineSims, fineTime, (1000.0 * fineTime) / max(1, fineSims))
+
+    summary = RunSummary(opt.name(), bestResult.tp, bestResult.widths, l, 0, 0, te - ts, bestHistory, stopReason,
+                         initialWidths)
+    if (len(bestHistory) > 0):
+        summary.sims_to_best = bestHistory[-1][0]
+        summary.sims_to_converge = next(sim for (sim, tp) in bestHistory
+                                        if (tp <= bestResult.tp * (1.0 + CONVERGED_PERCENT / 100.0)))
+        logger.info("Optimizer %s: best Tp after %d simulations, within %.1f%% of it after %d",
+                    opt.name(), summary.sims_to_best, CONVERGED_PERCENT, summary.sims_to_converge)
+    if (early_stop):
+        logger.info("%d / %d simulations stopped early as worse than best (margin %.2f)",
+                    worseThanBest, l, stop_margin)
+    if (prefilter != None):
+        rate = prefilter.get_false_reject_rate()
+        logger.info("Logical effort prefilter (margin %.2f): pruned %d / %d candidates (%.1f%%), "
+                    "audited %d, %d would have been improvements (false reject rate %s)",
+                    le_margin, prefilter.get_pruned(), prefilter.get_checked(),
+                    (100.0 * prefilter.get_pruned()) / max(1, prefilter.get_checked()),
+                    prefilter.get_audited(), prefilter.get_false_rejects(),
+                    "n/a" if (rate == None) else "%.1f%%" % (100.0 * rate))
+    if (evalCache != None):
+        lookups = evalCache.get_hits() + evalCache.get_misses()
+        logger.info("Eval cache: %d hits, %d misses (%.1f%% hit rate), %d entries, grid %e",
+                    evalCache.get_hits(), evalCache.get_misses(),
+                    (100.0 * evalCache.get_hits()) / max(1, lookups), len(evalCache), cache_grid)
+        evalCache.save()
+
+    if (meas and (bestResult.tp < 1.0)):
+        # Comparar con el Tp que calculamos desde las formas de onda
+        logger.info("Best Tp using waveforms %e", sim.get_tp_waveform(bestResult.widths, sim_time))
 
     # ============================================
     # Encontrar el Tp optimo usando logical effort
@@ -248,14 +653,31 @@ def do_monte_carlo_sim(tech, put, step_time, num_sims, plot_result, cvs, logger)
         logger.warning("Optimal case not supported by this path")
     else:
         logger.info("Running test with optimal widths calculated via logical effort: [%s]", _get_widths_str(LEwidths))
-        put.set_widths(LEwidths)
-        LEtp = _get_tp(circuit, tech, put, sim_time, step_time, logger)
+        LEsim_time = sim_time
+        if (early_stop):
+            # El caso óptimo puede ser peor que el mejor * stop_margin, pero la
+            # simulación termina cuando la salida transiciona, así podemos
+            # usar una duración larga (antes del flanco descendente de in)
+            LEsim_time = max(sim_time, 1e-9)
+        LEtp = sim.get_tp(LEwidths, LEsim_time)
 
         if (LEtp <= 0):
             logger.info("Optimal Case: Out never transititons")
         else:
             logger.info("Optimal Case: %e, widths: [%s]", LEtp, _get_widths_str(LEwidths))
 
+    loadWidth = put.get_load() * tech.W_MIN
+
+    # ================================================
+    # Escribir los resultados al .npy
+    # ================================================
+    if (results_file != None):
+        try:
+            result_store.write_results(results, results_file, loadWidth)
+            logger.info("Wrote %d results to %s", len(results), results_file)
+        except OSError:
+            logger.error("Failed to write %s", results_file)
+
     # ================================================
     # Escribir los resultados al .cvs
     # ================================================
@@ -275,52 +697,96 @@ def do_monte_carlo_sim(tech, put, step_time, num_sims, plot_result, cvs, logger)
                              (LEtp, _get_widths_str(LEwidths)))
 
         # El titulo de los columnos:
-        widthHeadings = ""
-        for i in range(len(widths)):
-            widthHeadings += "width[%d], " % i
-
-        ratioHeadings = ""
-        for i in range(len(widths) - 1):
-            ratioHeadings += "ratio %d to %d, " % (i, i+1)
-        ratioHeadings += "ratio %d to load, " % (i+1)
+        numWidths = results.get_num_widths()
+        widthHeadings = "".join("width[%d], " % i for i in range(numWidths))
+        ratioHeadings = "".join("ratio %d to %d, " % (i, i+1) for i in range(numWidths - 1))
+        ratioHeadings += "ratio %d to load, " % (numWidths - 1)
 
         cvs_handle.write("Tp, " + widthHeadings + "load width, Total width, " + ratioHeadings + "Average ratio (not including load), Average ratio (including load)\n")
 
-        # Y los resultados
-        for r in allResults:
-
-            ratios = []
-            for i in range(len(r.widths) - 1):
-                ratios.append(r.widths[i+1] / r.widths[i])
-
-            avgWithoutLoad = sum(ratios)/len(ratios)
-
-            ratios.append(put.get_load() * tech.W_MIN / r.widths[i+1])
-            avgWithLoad = sum(ratios)/len(ratios)
-
-            ratiosStr = ""
-            for i, ratio in enumerate(ratios):
-                if (i != 0):
-                    ratiosStr += ", "
-                ratiosStr += "%.2f" % ratio
-
-            cvs_handle.write("%e, %s, %e, %e, %s, %.2f, %.2f\n" %
-                             (r.tp,
-                              _get_widths_str(r.widths),
-                              put.get_load() * tech.W_MIN,
-                              sum(r.widths),
-                              ratiosStr,
-                              avgWithoutLoad,
-                              avgWithLoad))
+        # Y los resultados, leyendo del archivo por trozos
+        # Los anchos en um ("%.2fe-6") como _get_widths_str
+        fmt = (["%e"] + ["%.2fe-6"] * numWidths + ["%e", "%e"] +
+               ["%.2f"] * numWidths + ["%.2f", "%.2f"])
+        for chunk in results.chunks():
+            (ratios, avgWithoutLoad, avgWithLoad) = result_store.get_ratios(chunk['widths'], loadWidth)
+            columns = np.column_stack((chunk['tp'],
+                                       chunk['widths'] * 1e6,
+                                       np.full(len(chunk), loadWidth),
+                                       chunk['widths'].sum(axis=1),
+                                       ratios,
+                                       avgWithoutLoad,
+                                       avgWithLoad))
+            np.savetxt(cvs_handle, columns, fmt=fmt, delimiter=", ")
 
         cvs_handle.close()
 
+    # Ya tenemos todo en el .cvs / .npy
+    if (results != None):
+        results.remove()
+
     # ================================================
     # Finalmente simula una vez más con anchos mejores
     # que encontramos y plotear el resultado
     # ================================================
     if (plot_result and (bestResult.tp > 0.0) and (bestResult.tp < 1.0)):
         put.set_widths(bestResult.widths)
-        simulator = circuit.simulator(temperature=27, nominal_temperature=27)
-        analysis = simulator.transient(end_time=sim_time*1.5, step_time=step_time)
+        analysis = sim.simulate(sim_time*1.5)
         put.plot(analysis, 'In', 'Out')
+
+    return summary
+
+# Ejecuta do_monte_carlo_sim con cada estrategia de names (con la misma
+# semilla) en cada ruta de puts y compara cuantas simulaciones necesitan para
+# converger.
+#   curve   - Escribir la curva del mejor Tp contra el número de simulaciones
+#             de cada ejecución a este archivo .cvs (None si no quieres)
+# kwargs son los argumentos opcionales de do_monte_carlo_sim
+# Todas las estrategias comienzan con los mismos anchos, los de la primera
+# ejecución (con workers = 1 las simulaciones cambian los anchos de put).
+# Devuelve la lista de RunSummary, en el mismo orden (ruta, estrategia), sin
+# las ejecuciones que fallaron
+def compare_optimizers(tech, puts, step_time, num_sims, names, logger, curve=None, **kwargs):
+    # Todas con la misma semilla
+    if (kwargs.get('seed') == None):
+        kwargs['seed'] = random.randrange(2**32)
+
+    summaries = []
+    for put in puts:
+        initialWidths = None
+        putSummaries = []
+        for name in names:
+            summary = do_monte_carlo_sim(tech, put, step_time, num_sims, False, None, logger,
+                                         optimizer=name, widths=initialWidths, **kwargs)
+            if (summary == None):
+                logger.error("Optimizer %s failed with path %s, skipping it", name, put.name())
+                continue
+            if (initialWidths == None):
+                initialWidths = summary.initial_widths
+            putSummaries.append(summary)
+
+        logger.info("Optimizer comparison, path %s, load %.2f, num_sims %d, seed %d:",
+                    put.name(), put.get_load(), num_sims, kwargs['seed'])
+        logger.info("%-12s %12s %10s %12s %16s %10s %12s", "optimizer", "best tp", "sims run",
+                    "sims to best", "sims to converge", "time (s)", "stopped by")
+        for s in putSummaries:
+            logger.info("%-12s %12e %10d %12d %16d %10.1f %12s", s.optimizer, s.tp, s.num_sims,
+                        s.sims_to_best, s.sims_to_converge, s.time, s.stop_reason)
+
+        summaries += [(put, s) for s in putSummaries]
+
+    # La curva: una fila por cada mejor Tp
+    if (curve != None):
+        try:
+            with open(curve, "w") as handle:
+                handle.write("#%s: Step time %.1e, Num sims %d, tech: %s, seed %d\n" %
+                             (datetime.now().strftime("%Y/%m/%d %H:%M:%S"), step_time,
+                              num_sims, tech.NAME, kwargs['seed']))
+                handle.write("Path, Load, Optimizer, Simulation, Best Tp\n")
+                for (put, s) in summaries:
+                    for (sim, tp) in s.history:
+                        handle.write("%s, %.2f, %s, %d, %e\n" % (put.name(), put.get_load(), s.optimizer, sim, tp))
+        except OSError:
+            logger.error("Failed to write %s", curve)
+
+    return [s for (put, s) in summaries]
@@ -0,0 +1,408 @@
+import json
+import multiprocessing
+import importlib
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+from PySpice.Doc.ExampleTools import find_libraries
+
+from sims   import crossings                # Búsqueda de transiciones en las formas de onda
+from sims   import characterize             # El circuito de una compuerta y el hash del .lib
+from sims   import tp_sim                   # La fuente de pulsos de TpSim (IN_RISE)
+
+# =============================================================================
+# Tablas de retardo / slew (estilo NLDM de Liberty)
+#
+# Para cada compuerta (characterize.GATES) de ancho W_MIN simulamos una
+# rejilla de pendientes de entrada (slew 10-90%) y cargas (un inversor de
+# carga * W_MIN) y guardamos cuatro tablas 2-D, TABLES:
+#   delay_rise  - Tp (50% a 50%) cuando la salida sube
+#   delay_fall  - Tp cuando la salida baja
+#   slew_rise   - el slew 10-90% de la salida cuando sube
+#   slew_fall   - el slew de la salida cuando baja
+# Todas las compuertas de tech invierten, así la salida sube con el flanco
+# descendente de la entrada.
+#
+# Una compuerta de ancho w con una carga de L * W_MIN se comporta como la de
+# ancho W_MIN con una carga L * W_MIN / w (todas las capacitancias y
+# corrientes escalan con w), así las tablas sirven para cualquier ancho.
+#
+# GateTable.query interpola (bilineal) arrays de puntos de una vez, y fuera
+# de la rejilla extrapola linealmente con la celda del borde.
+# estimate_chain_delay estima el Tp de muchos candidatos de una ruta a la vez
+# (microsegundos por candidato en lugar de una simulación).
+#
+# Las simulaciones se hacen en un pool de procesos y las tablas se guardan en
+# un archivo JSON al lado del .lib, con una llave como la de characterize.
+# =============================================================================
+
+# La versión del formato del archivo
+_FILE_VERSION = 1
+
+# Las tablas de cada compuerta
+TABLES = ('delay_rise', 'delay_fall', 'slew_rise', 'slew_fall')
+
+# La rejilla por defecto: slews 10-90% de la entrada (s) y cargas (en W_MIN)
+DEFAULT_SLEWS       = (10e-12, 20e-12, 40e-12, 80e-12, 160e-12, 320e-12)
+DEFAULT_LOADS       = (1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0)
+DEFAULT_STEP_TIME   = 2e-13
+
+# El slew 10-90% de la fuente de pulsos de TpSim (una rampa lineal)
+DEFAULT_IN_SLEW     = 0.8 * tp_sim.TpSim.IN_RISE
+
+# El ancho del pulso de la entrada: con cargas grandes la salida de una
+# compuerta de W_MIN tarda mucho más que el Tp de una ruta
+_MIN_PULSE_WIDTH        = 1e-9
+_PULSE_WIDTH_PER_LOAD   = 50e-12
+_IN_DELAY               = 10e-12
+
+# Las tablas ya leídas del archivo, por tecnologia (ver get_library)
+_loaded = {}
+
+# =============================================================================
+# Las simulaciones
+# =============================================================================
+
+# Los valores de TABLES de una compuerta con slew de entrada y carga
+# (en W_MIN), en un dict, o None si alguno no se pudo medir
+def _simulate_point(tech, gateName, slew, load, step_time):
+    gate = getattr(tech, gateName)()
+    inverter = tech.Inversor()
+    circuit = characterize.new_gate_circuit(tech, gate, "NLDM_%s_%g_%g" % (gateName, slew, load))
+    if (gateName != 'Inversor'):
+        circuit.subcircuit(inverter)
+
+    # Una rampa lineal: el slew 10-90% es el 80% del tiempo de subida
+    ramp = slew / 0.8
+    width = _MIN_PULSE_WIDTH + load * _PULSE_WIDTH_PER_LOAD
+    circuit.PulseVoltageSource("In", "In", circuit.gnd, initial_value=0, pulsed_value=tech.VDD,
+                               pulse_width=width, period=4 * width, delay_time=_IN_DELAY,
+                               rise_time=ramp, fall_time=ramp)
+
+    characterize.add_gate(tech, circuit, gate, "Dut", 'In', 'Out', tech.W_MIN)
+    inverter.add_instance(circuit, "Load", 'Vdd', ['Out'], 'LoadOut', tech.W_MIN * load)
+
+    simulator = circuit.simulator(temperature=27, nominal_temperature=27)
+    analysis = simulator.transient(step_time=step_time, end_time=_IN_DELAY + 2 * (ramp + width))
+
+    t = np.asarray(analysis['time'], dtype=np.float64)
+    vIn = np.asarray(analysis['in'], dtype=np.float64)
+    vOut = np.asarray(analysis['out'], dtype=np.float64)
+    half = tech.VDD / 2
+
+    inRise = crossings.find_crossing(t, vIn, half, crossings.RISE)
+    inFall = crossings.find_crossing(t, vIn, half, crossings.FALL)
+    edges = crossings.find_edges(t, vOut, tech.VDD)
+    if ((inRise == None) or (inFall == None)):
+        return None
+
+    values = {}
+    for (inTime, outRising, suffix) in ((inRise, False, 'fall'), (inFall, True, 'rise')):
+        idx = np.nonzero((edges['time'] > inTime) & (edges['rising'] == outRising))[0]
+        if ((len(idx) == 0) or np.isnan(edges['slew'][idx[0]])):
+            return None
+        values['delay_' + suffix] = float(edges['time'][idx[0]] - inTime)
+        values['slew_' + suffix] = float(edges['slew'][idx[0]])
+    return values
+
+# job = (nombre del módulo tech, compuerta, slew, carga, step_time)
+def _run_job(job):
+    (techName, gateName, slew, load, step_time) = job
+    return _simulate_point(importlib.import_module(techName), gateName, slew, load, step_time)
+
+# =============================================================================
+# Las tablas
+# =============================================================================
+
+# El índice de la celda de cada x y la fracción dentro de ella (< 0 o > 1
+# fuera de la rejilla, así extrapolamos con la celda del borde)
+def _get_cells(grid, x):
+    i = np.clip(np.searchsorted(grid, x) - 1, 0, len(grid) - 2)
+    return (i, (x - grid[i]) / (grid[i + 1] - grid[i]))
+
+""" GateTable:
+        Las tablas de una compuerta de ancho W_MIN.
+
+        argumentos:
+            gateName    - La clase de la compuerta en tech (e.g. 'Nand')
+            slews       - Los slews de entrada de la rejilla, en orden (s)
+            loads       - Las cargas de la rejilla, en orden (en W_MIN)
+            values      - Un dict de tabla (ver TABLES): matriz de
+                          len(slews) x len(loads)
+"""
+
+class GateTable:
+
+    def __init__(self, gateName, slews, loads, values):
+        self.__gateName = gateName
+        self.__slews    = np.asarray(slews, dtype=np.float64)
+        self.__loads    = np.asarray(loads, dtype=np.float64)
+        self.__values   = {name: np.asarray(values[name], dtype=np.float64) for name in TABLES}
+
+        if ((len(self.__slews) < 2) or (len(self.__loads) < 2)):
+            raise ValueError("The grid needs at least 2 slews and 2 loads")
+
+    def get_gate_name(self):
+        return self.__gateName
+
+    def get_slews(self):
+        return self.__slews
+
+    def get_loads(self):
+        return self.__loads
+
+    def get_values(self, name):
+        return self.__values[name]
+
+    # Interpola la tabla name en los puntos (slew, load). slew y load pueden
+    # ser números o arrays (con broadcasting), devuelve un array
+    def query(self, name, slew, load):
+        slew = np.asarray(slew, dtype=np.float64)
+        load = np.asarray(load, dtype=np.float64)
+        (i, fx) = _get_cells(self.__slews, slew)
+        (j, fy) = _get_cells(self.__loads, load)
+        v = self.__values[name]
+        return ((v[i, j] * (1 - fx) + v[i + 1, j] * fx) * (1 - fy) +
+                (v[i, j + 1] * (1 - fx) + v[i + 1, j + 1] * fx) * fy)
+
+    # El retardo y el slew de la salida de una compuerta de ancho w (m) con
+    # una carga de load * W_MIN
+    #   outRising   - True si la salida sube (la entrada baja)
+    # devuelve (delay, slew)
+    def get_delay_slew(self, slew, load, w, wMin, outRising):
+        effLoad = np.asarray(load, dtype=np.float64) * (wMin / np.asarray(w, dtype=np.float64))
+        suffix = 'rise' if outRising else 'fall'
+        return (self.query('delay_' + suffix, slew, effLoad), self.query('slew_' + suffix, slew, effLoad))
+
+    def to_dict(self):
+        return {'slews':    self.__slews.tolist(),
+                'loads':    self.__loads.tolist(),
+                'values':   {name: self.__values[name].tolist() for name in TABLES}}
+
+""" NLDMLibrary:
+        Las GateTables de todas las compuertas de una tecnologia.
+
+        argumentos:
+            tech        - La tecnologia
+            tables      - Un dict de compuerta: GateTable
+            info        - La llave y la fecha de las simulaciones
+"""
+
+class NLDMLibrary:
+
+    def __init__(self, tech, tables, info):
+        self.__tech     = tech
+        self.__tables   = tables
+        self.__info     = info
+        self.__cIns     = {}
+
+    def get_tech(self):
+        return self.__tech
+
+    def get_info(self):
+        return self.__info
+
+    def get_gate_names(self):
+        return list(self.__tables)
+
+    def get_table(self, gateName):
+        return self.__tables[gateName]
+
+    # La capacitancia de la primera entrada de una compuerta de ancho W_MIN,
+    # en W_MIN de inversor (el g de la topología, ver Compuerta.get_logical_effort)
+    def get_input_load(self, gateName):
+        if (gateName not in self.__cIns):
+            self.__cIns[gateName] = getattr(self.__tech, gateName)().get_logical_effort()
+        return self.__cIns[gateName]
+
+    def to_dict(self):
+        return {'info':     self.__info,
+                'tables':   {name: table.to_dict() for (name, table) in self.__tables.items()}}
+
+def _from_dict(tech, data):
+    tables = {name: GateTable(name, t['slews'], t['loads'], t['values']) for (name, t) in data['tables'].items()}
+    return NLDMLibrary(tech, tables, data['info'])
+
+# =============================================================================
+# El archivo de las tablas
+# =============================================================================
+
+# El archivo al lado del .lib, e.g. TSMC180.nldm.json
+def get_cache_filename(tech):
+    return os.path.join(find_libraries(), os.path.splitext(tech.LIB_NAME)[0] + ".nldm.json")
+
+def get_cache_key(tech, slews=DEFAULT_SLEWS, loads=DEFAULT_LOADS, step_time=DEFAULT_STEP_TIME):
+    return "lib=%s,wpfact=%r,w=%r,slews=%s,loads=%s,step=%r" % (
+        characterize.get_lib_hash(tech), tech.WPFACT, tech.W_MIN,
+        ",".join("%g" % s for s in slews), ",".join("%g" % l for l in loads), step_time)
+
+def _read_cache(filename):
+    try:
+        with open(filename) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if ((not isinstance(data, dict)) or (data.get('version') != _FILE_VERSION)):
+        return None
+    return data
+
+# Las tablas guardadas o None si no hay
+def load_tables(tech, slews=DEFAULT_SLEWS, loads=DEFAULT_LOADS, step_time=DEFAULT_STEP_TIME):
+    try:
+        key = get_cache_key(tech, slews, loads, step_time)
+    except OSError:
+        return None
+
+    data = _read_cache(get_cache_filename(tech))
+    if ((data == None) or (key not in data['entries'])):
+        return None
+    return _from_dict(tech, data['entries'][key])
+
+def _save_tables(tech, key, library, logger):
+    filename = get_cache_filename(tech)
+    data = _read_cache(filename)
+    if (data == None):
+        data = {'version': _FILE_VERSION, 'entries': {}}
+    data['entries'][key] = library.to_dict()
+
+    try:
+        with open(filename + ".tmp", 'w') as f:
+            json.dump(data, f)
+        os.replace(filename + ".tmp", filename)
+        logger.info("Wrote NLDM tables to %s", filename)
+    except OSError:
+        logger.error("Failed to write %s", filename)
+
+# =============================================================================
+# tech          - La tecnologia
+# logger        - El logger
+# workers       - El número de procesos (None para uno por CPU)
+# slews         - Los slews 10-90% de la entrada de la rejilla (s)
+# loads         - Las cargas de la rejilla (en W_MIN)
+# step_time     - El escalon máximo de las simulaciones
+# force         - Simular aunque haya tablas guardadas
+#
+# Devuelve un NLDMLibrary o None si alguna simulación falló
+# =============================================================================
+def build_tables(tech, logger, workers=None, slews=DEFAULT_SLEWS, loads=DEFAULT_LOADS,
+                 step_time=DEFAULT_STEP_TIME, force=False):
+    slews = sorted(slews)
+    loads = sorted(loads)
+    key = get_cache_key(tech, slews, loads, step_time)
+    if (not force):
+        library = load_tables(tech, slews, loads, step_time)
+        if (library != None):
+            logger.info("Using NLDM tables from %s (%s)", get_cache_filename(tech), library.get_info()['date'])
+            return library
+
+    jobs = [(tech.__name__, gateName, slew, load, step_time)
+            for gateName in characterize.GATES for slew in slews for load in loads]
+    logger.info("Building NLDM tables for %s: %d gates x %d slews x %d loads = %d simulations",
+                tech.NAME, len(characterize.GATES), len(slews), len(loads), len(jobs))
+
+    if (workers == 1):
+        values = [_run_job(job) for job in jobs]
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            values = pool.map(_run_job, jobs)
+
+    failed = [job for (job, value) in zip(jobs, values) if (value == None)]
+    for job in failed:
+        logger.error("NLDM simulation of %s, slew %e, load %g failed", job[1], job[2], job[3])
+    if (len(failed) > 0):
+        return None
+
+    points = dict(((job[1], job[2], job[3]), value) for (job, value) in zip(jobs, values))
+    tables = {}
+    for gateName in characterize.GATES:
+        grid = {name: [[points[(gateName, slew, load)][name] for load in loads] for slew in slews]
+                for name in TABLES}
+        tables[gateName] = GateTable(gateName, slews, loads, grid)
+
+    library = NLDMLibrary(tech, tables, {'key': key, 'date': datetime.now().strftime("%Y/%m/%d %H:%M:%S")})
+    _save_tables(tech, key, library, logger)
+    _loaded.pop(tech.NAME, None)
+    return library
+
+# Las tablas guardadas con la rejilla por defecto (leídas una vez por
+# proceso) o None si no hay. Nunca simula.
+def get_library(tech):
+    if (tech.NAME not in _loaded):
+        _loaded[tech.NAME] = load_tables(tech)
+    return _loaded[tech.NAME]
+
+def log_tables(library, logger):
+    for gateName in library.get_gate_names():
+        table = library.get_table(gateName)
+        for name in TABLES:
+            logger.info("%s %s (ps), rows: input slew (ps), columns: load (W_MIN)", gateName, name)
+            logger.info("  %8s" + " %8g" * len(table.get_loads()), "", *table.get_loads())
+            for (slew, row) in zip(table.get_slews(), table.get_values(name)):
+                logger.info("  %8.1f" + " %8.2f" * len(row), slew * 1e12, *(row * 1e12))
+
+# =============================================================================
+# Estima el Tp de una ruta de compuertas en cadena con las tablas, como lo
+# mide TpSim: desde el 50% del flanco ascendente de la entrada hasta el 50%
+# de la salida. Cada etapa maneja la entrada de la siguiente (o la carga) y
+# el slew de su salida es el slew de entrada de la siguiente.
+#
+#   library     - El NLDMLibrary
+#   gateTypes   - Las compuertas de la ruta en orden (e.g. put.get_gate_types())
+#   widths      - Los anchos: una lista (un candidato) o una matriz con un
+#                 candidato por fila
+#   loadWidth   - El ancho del inversor de la carga (m)
+#   inSlew      - El slew 10-90% de la entrada
+#
+# Devuelve el Tp (un número o un array con uno por candidato)
+# =============================================================================
+def estimate_chain_delay(library, gateTypes, widths, loadWidth, inSlew=DEFAULT_IN_SLEW):
+    wMin = library.get_tech().W_MIN
+    widths = np.asarray(widths, dtype=np.float64)
+    single = (widths.ndim == 1)
+    widths = np.atleast_2d(widths)
+
+    delay = np.zeros(len(widths))
+    slew = np.full(len(widths), inSlew)
+    outRising = False
+    for (k, gateName) in enumerate(gateTypes):
+        if (k + 1 < len(gateTypes)):
+            load = library.get_input_load(gateTypes[k + 1]) * widths[:, k + 1] / wMin
+        else:
+            load = np.full(len(widths), loadWidth / wMin)
+
+        (stageDelay, slew) = library.get_table(gateName).get_delay_slew(slew, load, widths[:, k], wMin, outRising)
+        delay += stageDelay
+        outRising = not outRising
+
+    return float(delay[0]) if single else delay
+
+# =============================================================================
+# Muestra el Tp estimado de los anchos óptimos de esfuerzo lógico de put (y
+# la estimación de esfuerzo lógico para comparar), y mide el costo de
+# estimar num_candidates candidatos aleatorios de una vez.
+# =============================================================================
+def log_path_estimate(library, put, logger, num_candidates=10000, seed=0):
+    tech = library.get_tech()
+    gateTypes = put.get_gate_types()
+    loadWidth = put.get_load() * tech.W_MIN
+
+    widths = put.get_logical_effort_optimal_widths()
+    logger.info("%s, load %g: logical effort optimal widths %s", put.name(), put.get_load(),
+                " ".join("%.3e" % w for w in widths))
+    if (not put.is_chain()):
+        logger.info("  %s is not a simple chain, use the STA command with --model nldm", put.name())
+        return
+    logger.info("  NLDM estimate %e, logical effort estimate %.2f tau",
+                estimate_chain_delay(library, gateTypes, widths, loadWidth),
+                put.get_logical_effort_delay(widths))
+
+    rng = np.random.default_rng(seed)
+    candidates = rng.uniform(tech.W_MIN, put.get_max_width(), (num_candidates, len(gateTypes)))
+    ts = time.perf_counter()
+    tps = estimate_chain_delay(library, gateTypes, candidates, loadWidth)
+    elapsed = time.perf_counter() - ts
+    logger.info("  %d random candidates in %.1f ms (%.2f us per candidate), best estimate %e",
+                num_candidates, 1000.0 * elapsed, 1e6 * elapsed / num_candidates, tps.min())
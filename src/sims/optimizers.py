@@ -0,0 +1,724 @@
+import abc
+import math
+
+import numpy as np
+
+from sims   import surrogate
+from sims   import sensitivity
+
+# =============================================================================
+# Optimizadores de los anchos
+#
+# Todos tienen la misma interfaz:
+#   propose(n)                  - devuelve hasta n candidatos (listas de
+#                                 anchos) para simular. [] cuando terminó.
+#   observe(candidates, tps)    - los Tps de los candidatos (-1 si la salida
+#                                 no transicionó)
+#
+# Cada estrategia implementa _search() como un generador que hace
+# yield de una lista de puntos (en el espacio de log(anchos), ver abajo) y
+# recibe la lista de sus costes (el Tp o math.inf si no transicionó).
+# La clase Optimizer se encarga de repartir esos puntos en lotes de n.
+#
+# El primer ancho (el de la entrada de la ruta) no cambia nunca, igual que en
+# el método 3 original. Los demás se optimizan en log(ancho) y siempre están
+# entre tech.W_MIN y put.get_max_width().
+# =============================================================================
+
+# Genera un candidato nuevo desde los anchos widths (normalmente los mejores)
+# rng es un random.Random, así los resultados son reproducibles con una semilla
+def _perturb_widths(tech, put, widths, rng, logger):
+    widths = list(widths)    # tomar una copia
+
+    #-------------------------------------------------------------------
+    # Método 1: Cambiar todos los ancho aleatoriamente
+    #-------------------------------------------------------------------
+    #for idx in range(1, len(widths)):
+    #    width = rng.uniform(tech.W_MIN, put.get_max_width())
+    #    widths[idx] = width
+
+    #----------------------------------------------------------------
+    # Método 2: Cambiar un ancho aleatoriamente adentro todo el rango
+    #----------------------------------------------------------------
+
+    # Generar un ancho aleatoriamente entre tech.W_MIN y put.get_max_width()
+    #width = rng.uniform(tech.W_MIN, put.get_max_width())
+
+    # Elegir cual ancho cambiar (no elegimos el primero)
+    #idx = rng.randint(1, len(widths)-1)
+    #widths[idx] = width
+
+    #----------------------------------------------------------------------
+    # Método 3: Cambiar todos los ancho aleatoriamente en el rango de 0.5w
+    #           a 2w. Dónde w es el ancho actual.
+    #----------------------------------------------------------------------
+    for idx in range(1, len(widths)):
+        minWidth = max(tech.W_MIN, widths[idx]/2)
+        maxWidth = min(put.get_max_width(), widths[idx]*2)
+        width = rng.uniform(minWidth, maxWidth)
+
+        logger.debug("curr_width %e, minWidth %e, maxWidth %e, new width %e",
+                      widths[idx], minWidth, maxWidth, width)
+
+        widths[idx] = width
+
+    return widths
+
+""" Optimizer:
+        La clase base de los optimizadores.
+
+        argumentos:
+            tech        - La tecnologia
+            put         - La ruta
+            widths      - Los anchos iniciales
+            rng         - Un random.Random (para que sea reproducible)
+            logger      - El logger
+            batch       - Cuantos candidatos queremos por ronda (normalmente
+                          el número de workers). Las estrategias secuenciales
+                          (e.g. Nelder-Mead) a veces piden menos.
+            options     - Un dict con opciones de la estrategia (e.g. model_file
+                          para SurrogateOptimizer). None si no hay.
+"""
+
+class Optimizer(abc.ABC):
+
+    NAME = None
+
+    # Si la estrategia compara Tps peores que el mejor (no solo si es mejor
+    # o no). En ese caso la simulación no puede ser tan corta (ver
+    # monte_carlo_sim) y, hasta el primer candidato que transiciona,
+    # repetimos el primer lote en lugar de pasarle solo infinitos.
+    EXACT_TPS = True
+
+    def __init__(self, tech, put, widths, rng, logger, batch=1, options=None):
+        self.__options      = {} if (options == None) else options
+        self.__tech         = tech
+        self.__put          = put
+        self.__rng          = rng
+        self.__logger       = logger
+        self.__batch        = max(1, batch)
+        self.__initial      = list(widths)
+
+        # Los límites, en anchos y en log(ancho)
+        self.__minWidth     = tech.W_MIN
+        self.__maxWidth     = put.get_max_width()
+        self.__lo           = math.log(self.__minWidth)
+        self.__hi           = math.log(self.__maxWidth)
+
+        self.__bestTp       = None
+        self.__bestWidths   = list(widths)
+
+        self.__pending      = []    # los candidatos que _search pidió
+        self.__proposed     = 0     # cuantos de __pending ya propusimos
+        self.__costs        = []    # los costes de los que ya observamos
+        self.__done         = False
+
+        self.__search       = self._search()
+        self.__next_batch(None)
+
+    def name(self):
+        return self.NAME
+
+    def get_tech(self):
+        return self.__tech
+
+    def get_put(self):
+        return self.__put
+
+    def get_rng(self):
+        return self.__rng
+
+    def get_logger(self):
+        return self.__logger
+
+    def get_batch(self):
+        return self.__batch
+
+    def get_options(self):
+        return self.__options
+
+    def get_initial_widths(self):
+        return list(self.__initial)
+
+    # El mejor Tp que observamos (None si ninguno transicionó)
+    def get_best_tp(self):
+        return self.__bestTp
+
+    def get_best_widths(self):
+        return list(self.__bestWidths)
+
+    # True cuando la estrategia convergió y no tiene más candidatos
+    def is_done(self):
+        return self.__done
+
+    # Al final de la ejecución (e.g. para guardar algo)
+    def close(self):
+        pass
+
+    # Hasta n candidatos para simular
+    def propose(self, n):
+        candidates = self.__pending[self.__proposed:self.__proposed + n]
+        self.__proposed += len(candidates)
+        return candidates
+
+    # fine - None si todos los Tps son finos, o una lista con False para los
+    #        de la fidelidad gruesa (ver monte_carlo_sim coarse_step). Esos
+    #        sirven de coste para la búsqueda pero nunca son el mejor.
+    def observe(self, candidates, tps, fine=None):
+        if (fine == None):
+            fine = [True] * len(candidates)
+        for (widths, tp, isFine) in zip(candidates, tps, fine):
+            if (tp >= 0):
+                if (isFine and ((self.__bestTp == None) or (tp < self.__bestTp))):
+                    self.__bestTp       = tp
+                    self.__bestWidths   = list(widths)
+                self.__costs.append(tp)
+            else:
+                self.__costs.append(math.inf)
+
+        if (len(self.__costs) < len(self.__pending)):
+            return
+
+        if (self.EXACT_TPS and (self.__bestTp == None)):
+            # Ninguno transicionó todavía, probar otra vez (con una
+            # simulación más larga)
+            self.__proposed = 0
+            self.__costs    = []
+            return
+
+        self.__next_batch(self.__costs)
+
+    def __next_batch(self, costs):
+        try:
+            if (costs == None):
+                points = next(self.__search)
+            else:
+                points = self.__search.send(costs)
+        except StopIteration:
+            self.__done = True
+            points = []
+
+        self.__pending  = [self._to_widths(x) for x in points]
+        self.__proposed = 0
+        self.__costs    = []
+
+    # =========================================================================
+    # Para las estrategias
+    # =========================================================================
+
+    # El número de dimensiones (anchos que cambiamos)
+    def _get_dims(self):
+        return len(self.__initial) - 1
+
+    # Los límites de un punto
+    def _get_bounds(self):
+        return (self.__lo, self.__hi)
+
+    def _clip(self, x):
+        return np.clip(np.asarray(x, dtype=np.float64), self.__lo, self.__hi)
+
+    # anchos -> punto (log de los anchos sin el primero)
+    def _from_widths(self, widths):
+        return self._clip(np.log(widths[1:]))
+
+    # punto -> anchos. Los puntos pueden ser listas de anchos (e.g. los de
+    # RandomOptimizer), que se devuelven tal cual
+    def _to_widths(self, x):
+        if (isinstance(x, list)):
+            return x
+        # exp(log(w)) no siempre es exactamente w
+        widths = np.clip(np.exp(self._clip(x)), self.__minWidth, self.__maxWidth)
+        return [self.__initial[0]] + widths.tolist()
+
+    # Las derivadas del coste respecto a log(ancho) de las dimensiones dims
+    # (índices de x) en x, con un lote de sensitivity.get_candidates (todos
+    # se simulan juntos). fx es el coste de x. 0 si un candidato no
+    # transiciona. Hay que usarlo con yield from en _search.
+    def _get_gradient(self, x, fx, dims, step=sensitivity.DEFAULT_STEP, method=sensitivity.FORWARD):
+        widths = self._to_widths(x)
+        indices = [i + 1 for i in dims]
+        candidates = sensitivity.get_candidates(widths, indices, step, method, self.__maxWidth)
+        costs = yield candidates
+        result = sensitivity.get_sensitivity(widths, fx, costs, indices, step, method, self.__maxWidth)
+
+        # dtp/dlog(w) = w * dtp/dw
+        gradient = np.array(result.derivatives) * np.array([widths[i] for i in indices])
+        gradient[~np.isfinite(gradient)] = 0.0
+        return gradient
+
+    # Debe ser un generador, ver el comentario al comienzo del archivo
+    @abc.abstractmethod
+    def _search(self):
+        pass
+
+""" RandomOptimizer:
+        La búsqueda original de monte_carlo_sim: cada candidato es una
+        perturbación aleatoria del mejor (ver _perturb_widths).
+        Nunca termina.
+"""
+
+class RandomOptimizer(Optimizer):
+
+    NAME = 'random'
+
+    # Solo nos importa si un Tp es mejor que el mejor
+    EXACT_TPS = False
+
+    def _search(self):
+        # La primera ronda comienza con los anchos iniciales de la ruta
+        base = self.get_initial_widths()
+        points = [base]
+        while True:
+            while (len(points) < self.get_batch()):
+                points.append(_perturb_widths(self.get_tech(), self.get_put(), base,
+                                              self.get_rng(), self.get_logger()))
+            yield points
+
+            base = self.get_best_widths()
+            points = []
+
+""" CoordinateDescentOptimizer:
+        Multiplica y divide cada ancho por un factor, uno por uno, y se queda
+        con el mejor cambio. Cuando ningún cambio mejora reduce el factor.
+        Con batch > 2 prueba varios anchos en cada ronda.
+        Termina cuando el factor es menor que 1 + MIN_STEP.
+"""
+
+class CoordinateDescentOptimizer(Optimizer):
+
+    NAME = 'coordinate'
+
+    INITIAL_STEP    = math.log(2.0)
+    MIN_STEP        = math.log(1.005)
+
+    def _search(self):
+        x = self._from_widths(self.get_initial_widths())
+        fx = (yield [x])[0]
+        step = self.INITIAL_STEP
+        dims = self._get_dims()
+        coordsPerRound = max(1, self.get_batch() // 2)
+
+        while (step >= self.MIN_STEP):
+            improved = False
+            for first in range(0, dims, coordsPerRound):
+                points = []
+                for i in range(first, min(dims, first + coordsPerRound)):
+                    for s in (step, -step):
+                        y = x.copy()
+                        y[i] += s
+                        y = self._clip(y)
+                        if (y[i] != x[i]):
+                            points.append(y)
+                if (len(points) == 0):
+                    continue
+
+                costs = yield points
+                k = int(np.argmin(costs))
+                if (costs[k] < fx):
+                    (x, fx) = (points[k], costs[k])
+                    improved = True
+
+            if (not improved):
+                step /= 2
+
+""" NelderMeadOptimizer:
+        El método simplex de Nelder-Mead. Es secuencial: menos el simplex
+        inicial y las reducciones, cada ronda simula un solo candidato.
+        Cuando el simplex es más pequeño que TOLERANCE comienza otra vez con
+        un simplex nuevo alrededor del mejor punto (el simplex se degenera
+        fácilmente contra los límites de los anchos). Termina cuando un
+        simplex nuevo no mejora.
+"""
+
+class NelderMeadOptimizer(Optimizer):
+
+    NAME = 'nelder_mead'
+
+    INITIAL_STEP    = math.log(1.5)
+    TOLERANCE       = math.log(1.001)
+
+    # Coeficientes estándar
+    ALPHA   = 1.0   # reflexión
+    GAMMA   = 2.0   # expansión
+    RHO     = 0.5   # contracción
+    SIGMA   = 0.5   # reducción
+
+    def _search(self):
+        x0 = self._from_widths(self.get_initial_widths())
+        f0 = math.inf
+        while True:
+            (x, fx) = yield from self.__simplex_search(x0)
+            if (fx >= f0):
+                return
+            (x0, f0) = (x, fx)
+
+    # Una búsqueda desde x0, devuelve el mejor vértice y su coste
+    def __simplex_search(self, x0):
+        (lo, hi) = self._get_bounds()
+        dims = self._get_dims()
+
+        # El simplex inicial, cada vértice cambia un ancho hacia adentro del rango
+        simplex = [x0]
+        for i in range(dims):
+            x = x0.copy()
+            x[i] += self.INITIAL_STEP if (x0[i] + self.INITIAL_STEP <= hi) else -self.INITIAL_STEP
+            simplex.append(self._clip(x))
+        costs = list((yield simplex))
+
+        while True:
+            order = sorted(range(len(simplex)), key=lambda i: costs[i])
+            simplex = [simplex[i] for i in order]
+            costs = [costs[i] for i in order]
+
+            size = max(np.max(np.abs(x - simplex[0])) for x in simplex[1:])
+            if (size < self.TOLERANCE):
+                return (simplex[0], costs[0])
+
+            centroid = np.mean(simplex[:-1], axis=0)
+
+            xr = self._clip(centroid + self.ALPHA * (centroid - simplex[-1]))
+            fr = (yield [xr])[0]
+
+            if ((costs[0] <= fr) and (fr < costs[-2])):
+                (simplex[-1], costs[-1]) = (xr, fr)
+                continue
+
+            if (fr < costs[0]):
+                xe = self._clip(centroid + self.GAMMA * (xr - centroid))
+                fe = (yield [xe])[0]
+                (simplex[-1], costs[-1]) = (xe, fe) if (fe < fr) else (xr, fr)
+                continue
+
+            if (fr < costs[-1]):
+                # Contracción afuera
+                xc = self._clip(centroid + self.RHO * (xr - centroid))
+                fc = (yield [xc])[0]
+                accept = (fc <= fr)
+            else:
+                # Contracción adentro
+                xc = self._clip(centroid + self.RHO * (simplex[-1] - centroid))
+                fc = (yield [xc])[0]
+                accept = (fc < costs[-1])
+
+            if (accept):
+                (simplex[-1], costs[-1]) = (xc, fc)
+                continue
+
+            # Reducción hacia el mejor vértice
+            simplex = [simplex[0]] + [self._clip(simplex[0] + self.SIGMA * (x - simplex[0]))
+                                      for x in simplex[1:]]
+            costs = [costs[0]] + list((yield simplex[1:]))
+
+""" SimulatedAnnealingOptimizer:
+        Recocido simulado. Cada ronda genera batch vecinos del punto actual
+        (una perturbación gausiana en log(ancho)) y toma el mejor. Si es peor
+        que el actual lo acepta con probabilidad exp(-dTp / (Tp * T)).
+        La temperatura T baja por COOLING cada ronda y termina con MIN_TEMP.
+"""
+
+class SimulatedAnnealingOptimizer(Optimizer):
+
+    NAME = 'annealing'
+
+    INITIAL_TEMP    = 0.05      # relativo al Tp
+    MIN_TEMP        = 1e-4
+    COOLING         = 0.995
+    SIGMA           = math.log(1.25)
+
+    def _search(self):
+        rng = self.get_rng()
+        x = self._from_widths(self.get_initial_widths())
+        fx = (yield [x])[0]
+        temp = self.INITIAL_TEMP
+
+        while (temp > self.MIN_TEMP):
+            # El paso se reduce con la temperatura, pero no menos de 1/10
+            sigma = self.SIGMA * max(0.1, math.sqrt(temp / self.INITIAL_TEMP))
+            points = [self._clip([xi + rng.gauss(0.0, sigma) for xi in x])
+                      for i in range(self.get_batch())]
+            costs = yield points
+
+            k = int(np.argmin(costs))
+            (y, fy) = (points[k], costs[k])
+            if (fy < fx):
+                (x, fx) = (y, fy)
+            elif ((fy < math.inf) and (fx < math.inf)):
+                if (rng.random() < math.exp(-(fy - fx) / (fx * temp))):
+                    (x, fx) = (y, fy)
+
+            temp *= self.COOLING
+
+""" CMAESOptimizer:
+        CMA-ES (Covariance Matrix Adaptation Evolution Strategy) en log(ancho),
+        la versión (mu/mu_w, lambda) estándar. Cada generación simula lambda
+        candidatos (al menos batch). Los candidatos fuera del rango se
+        recortan y se usan así en la actualización.
+        Termina cuando el paso es menor que TOLERANCE.
+"""
+
+class CMAESOptimizer(Optimizer):
+
+    NAME = 'cmaes'
+
+    INITIAL_SIGMA   = math.log(1.5)
+    TOLERANCE       = math.log(1.001)
+
+    def _search(self):
+        n = self._get_dims()
+        nprng = np.random.default_rng(self.get_rng().getrandbits(64))
+
+        lam = max(4 + int(3 * math.log(n)), self.get_batch())
+        mu = lam // 2
+        weights = math.log(mu + 0.5) - np.log(np.arange(1, mu + 1))
+        weights /= weights.sum()
+        mueff = 1.0 / np.sum(weights ** 2)
+
+        cc = (4 + mueff / n) / (n + 4 + 2 * mueff / n)
+        cs = (mueff + 2) / (n + mueff + 5)
+        c1 = 2 / ((n + 1.3) ** 2 + mueff)
+        cmu = min(1 - c1, 2 * (mueff - 2 + 1 / mueff) / ((n + 2) ** 2 + mueff))
+        damps = 1 + 2 * max(0, math.sqrt((mueff - 1) / (n + 1)) - 1) + cs
+        chiN = math.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n ** 2))
+
+        mean = self._from_widths(self.get_initial_widths())
+        sigma = self.INITIAL_SIGMA
+        pc = np.zeros(n)
+        ps = np.zeros(n)
+        B = np.eye(n)
+        D = np.ones(n)
+        C = np.eye(n)
+        gen = 0
+
+        # El primer lote es solo el punto inicial, así sabemos su Tp
+        yield [mean]
+
+        while (sigma * np.max(D) >= self.TOLERANCE):
+            z = nprng.standard_normal((lam, n))
+            points = [self._clip(mean + sigma * (B @ (D * zi))) for zi in z]
+            costs = yield points
+            gen += 1
+
+            order = np.argsort(costs, kind='stable')[:mu]
+            selected = np.array([points[i] for i in order])
+
+            old = mean
+            mean = weights @ selected
+
+            invsqrtC = B @ np.diag(1 / D) @ B.T
+            ps = (1 - cs) * ps + math.sqrt(cs * (2 - cs) * mueff) * (invsqrtC @ (mean - old)) / sigma
+            hsig = (np.linalg.norm(ps) / math.sqrt(1 - (1 - cs) ** (2 * gen)) / chiN) < (1.4 + 2 / (n + 1))
+            pc = (1 - cc) * pc + hsig * math.sqrt(cc * (2 - cc) * mueff) * (mean - old) / sigma
+
+            artmp = (selected - old) / sigma
+            C = ((1 - c1 - cmu) * C +
+                 c1 * (np.outer(pc, pc) + (not hsig) * cc * (2 - cc) * C) +
+                 cmu * (artmp.T @ np.diag(weights) @ artmp))
+
+            sigma *= math.exp((cs / damps) * (np.linalg.norm(ps) / chiN - 1))
+
+            C = np.triu(C) + np.triu(C, 1).T
+            (eig, B) = np.linalg.eigh(C)
+            D = np.sqrt(np.maximum(eig, 1e-20))
+
+""" SurrogateOptimizer:
+        Aprende un modelo del Tp (ver surrogate.RidgeModel) con las
+        simulaciones más cercanas al mejor (un polinomio de segundo grado
+        solo es bueno localmente) y lo vuelve a ajustar cada REFIT_EVERY
+        simulaciones.
+        Cada ronda genera NUM_CANDIDATES perturbaciones del mejor y solo
+        simula las batch con mayor mejora esperada según el modelo.
+        Hasta que tiene bastantes muestras simula perturbaciones aleatorias.
+
+        opciones:
+            model_file  - Un archivo de muestras. Al comienzo usamos las de la
+                          misma ruta con una carga hasta WARM_LOAD_RATIO
+                          veces diferente, y al final añadimos las nuevas.
+        Nunca termina.
+"""
+
+class SurrogateOptimizer(Optimizer):
+
+    NAME = 'surrogate'
+
+    REFIT_EVERY     = 20
+    NUM_CANDIDATES  = 500
+    LOCAL_FACTOR    = 4                 # usamos LOCAL_FACTOR * características muestras
+    WARM_LOAD_RATIO = 2.0
+    STEPS           = (math.log(2.0), math.log(1.25), math.log(1.05))
+
+    def close(self):
+        filename = self.get_options().get('model_file')
+        if ((filename != None) and (len(self.__newSamples) > 0)):
+            surrogate.save_samples(filename, self.__key, self.__newSamples, self.get_logger())
+
+    def _search(self):
+        nprng = np.random.default_rng(self.get_rng().getrandbits(64))
+        (lo, hi) = self._get_bounds()
+        logLoad = math.log(self.get_put().get_load())
+        self.__key = (self.get_tech().NAME, self.get_put().name())
+        self.__newSamples = []
+
+        samples = surrogate.load_samples(self.get_options().get('model_file'), self.__key, logLoad,
+                                         math.log(self.WARM_LOAD_RATIO), self.get_logger())
+        if (len(samples) > 0):
+            self.get_logger().info("Surrogate warm start with %d samples", len(samples))
+
+        model = surrogate.RidgeModel()
+        minSamples = surrogate.get_num_features(self._get_dims() + 1)
+        sinceFit = self.REFIT_EVERY
+
+        best = self._from_widths(self.get_initial_widths())
+        bestCost = math.inf
+
+        points = [best] + [self.__perturb(nprng, best, self.STEPS[0]) for i in range(self.get_batch() - 1)]
+        while True:
+            costs = yield points
+
+            for (x, cost) in zip(points, costs):
+                if (cost < math.inf):
+                    sample = (tuple(x), logLoad, cost)
+                    samples.append(sample)
+                    self.__newSamples.append(sample)
+                    sinceFit += 1
+                if (cost < bestCost):
+                    (best, bestCost) = (x, cost)
+
+            if ((len(samples) >= minSamples) and (sinceFit >= self.REFIT_EVERY)):
+                Z = np.array([list(s[0]) + [s[1]] for s in samples])
+                y = np.array([s[2] for s in samples]) * 1e12     # en ps
+
+                # Las más cercanas al mejor (con la carga de ahora)
+                distance = np.sum((Z - np.append(best, logLoad)) ** 2, axis=1)
+                local = np.argsort(distance, kind='stable')[:self.LOCAL_FACTOR * minSamples]
+
+                Z[:, :-1] -= lo
+                model.fit(Z[local], y[local])
+                sinceFit = 0
+
+            if (not model.is_fitted()):
+                points = [self.__perturb(nprng, best, self.STEPS[0]) for i in range(self.get_batch())]
+                continue
+
+            steps = np.resize(np.array(self.STEPS), self.NUM_CANDIDATES)[:, None]
+            candidates = self._clip(best + steps * nprng.uniform(-1.0, 1.0, (self.NUM_CANDIDATES, len(best))))
+            Z = np.hstack((candidates - lo, np.full((len(candidates), 1), logLoad)))
+            (mean, std) = model.predict(Z)
+            ei = surrogate.expected_improvement(mean, std, bestCost * 1e12)
+
+            order = np.argsort(-ei, kind='stable')[:self.get_batch()]
+            points = [candidates[i] for i in order]
+
+    # Método 3 en log(ancho): cada ancho entre w / e^step y w * e^step
+    def __perturb(self, nprng, x, step):
+        return self._clip(x + nprng.uniform(-step, step, len(x)))
+
+""" GradientOptimizer:
+        El modo para rutas grandes (cientos de anchos), donde las
+        perturbaciones de todos los anchos a la vez (método 3, CMA-ES,
+        Nelder-Mead) casi nunca mejoran.
+
+        Descenso por bloques de coordenadas en log(ancho). Cada ronda:
+          - Estima las derivadas de un bloque de BLOCK_SIZE anchos (al menos
+            batch) con diferencias finitas, un candidato por ancho, todos en
+            el mismo lote (así se simulan en paralelo, ver _get_gradient).
+          - Mueve cada ancho del bloque por el paso en la dirección
+            contraria a su derivada (el signo del gradiente, como
+            CoordinateDescentOptimizer pero todos juntos), con los pasos
+            LINE_STEPS (otro lote). Solo cambian los anchos del bloque, así
+            con session solo alteramos esos (ver SpecPath.get_alterations).
+        La primera pasada estima todas las derivadas. Después la mitad del
+        bloque son los anchos con la derivada más grande y la otra mitad los
+        que no estimamos hace más tiempo. Cuando ninguno mejora solo
+        reducimos el paso si todas las derivadas son del punto actual.
+
+        Comienza desde el mejor de los anchos iniciales y los de logical
+        effort (si la ruta los tiene).
+        Termina cuando el paso es menor que MIN_STEP.
+"""
+
+class GradientOptimizer(Optimizer):
+
+    NAME = 'gradient'
+
+    BLOCK_SIZE      = 16
+    FD_STEP         = 0.03              # más grande que el ruido del Tp
+    INITIAL_STEP    = math.log(1.5)
+    MIN_STEP        = math.log(1.005)
+    LINE_STEPS      = (0.5, 1.0, 2.0)   # relativos al paso
+
+    def _search(self):
+        (lo, hi) = self._get_bounds()
+        dims = self._get_dims()
+
+        starts = [self._from_widths(self.get_initial_widths())]
+        LEwidths = self.get_put().get_logical_effort_optimal_widths()
+        if (LEwidths != None):
+            starts.append(self._from_widths(LEwidths))
+        costs = yield starts
+        k = int(np.argmin(costs))
+        (x, fx) = (starts[k], costs[k])
+
+        grad = np.zeros(dims)
+        age = np.zeros(dims)        # rondas desde que estimamos cada derivada
+        stale = np.zeros(dims, dtype=bool)  # derivadas de antes del último cambio de x
+        blockSize = min(dims, max(self.BLOCK_SIZE, self.get_batch()))
+        step = self.INITIAL_STEP
+
+        # La primera pasada: todas las derivadas, sin mover x
+        for first in range(0, dims, blockSize):
+            block = np.arange(first, min(dims, first + blockSize))
+            grad[block] = yield from self._get_gradient(x, fx, block, self.FD_STEP)
+
+        while (step >= self.MIN_STEP):
+            # La mitad por la derivada, la otra mitad por la edad. Los anchos
+            # en un límite que el gradiente empuja afuera no pueden cambiar.
+            byGrad = np.argsort(-np.abs(self.__project(x, grad)), kind='stable')[:(blockSize + 1) // 2]
+            rest = np.setdiff1d(np.arange(dims), byGrad)
+            byAge = rest[np.argsort(-age[rest], kind='stable')][:blockSize - len(byGrad)]
+            block = np.sort(np.concatenate((byGrad, byAge)))
+
+            age += 1
+            age[block] = 0
+            stale[block] = False
+            grad[block] = yield from self._get_gradient(x, fx, block, self.FD_STEP)
+
+            g = self.__project(x, grad)[block]
+            if (not np.any(g != 0)):
+                if (not np.any(stale)):
+                    step /= 2
+                continue
+
+            # Solo cambian los anchos del bloque, cada uno por el paso en la
+            # dirección contraria a su derivada
+            direction = np.zeros(dims)
+            direction[block] = -np.sign(g) * step
+            points = [self._clip(x + s * direction) for s in self.LINE_STEPS]
+            costs = yield points
+
+            k = int(np.argmin(costs))
+            if (costs[k] < fx):
+                (x, fx) = (points[k], costs[k])
+                step = min(step * self.LINE_STEPS[k], hi - lo)
+                stale[:] = True
+            elif (not np.any(stale)):
+                # Solo reducimos el paso cuando todas las derivadas son de x
+                step /= 2
+
+    # El gradiente sin las derivadas que empujan x afuera de los límites
+    def __project(self, x, grad):
+        (lo, hi) = self._get_bounds()
+        return np.where(((x <= lo) & (grad > 0)) | ((x >= hi) & (grad < 0)), 0.0, grad)
+
+OPTIMIZERS = {
+                RandomOptimizer.NAME                : RandomOptimizer,
+                CoordinateDescentOptimizer.NAME     : CoordinateDescentOptimizer,
+                NelderMeadOptimizer.NAME            : NelderMeadOptimizer,
+                SimulatedAnnealingOptimizer.NAME    : SimulatedAnnealingOptimizer,
+                CMAESOptimizer.NAME                 : CMAESOptimizer,
+                SurrogateOptimizer.NAME             : SurrogateOptimizer,
+                GradientOptimizer.NAME              : GradientOptimizer
+             }
+
+# Crea el optimizador con nombre name (ver OPTIMIZERS)
+def get_optimizer(name, tech, put, widths, rng, logger, batch=1, options=None):
+    return OPTIMIZERS[name](tech, put, widths, rng, logger, batch, options)
@@ -0,0 +1,158 @@
+import json
+import time
+
+import numpy as np
+
+# =============================================================================
+# Tiempos de las fases de una evaluación
+#
+# Cada TpSim tiene un PhaseTimer que mide cuanto tarda cada fase de cada
+# simulación (ver PHASES). Guardamos cada muestra (un float por fase y por
+# simulación), así al final podemos calcular percentiles además de los totales.
+#
+# Los procesos del SimPool tienen su propio TpSim. Después de cada lote
+# mandan sus muestras con take() y el SimPool las junta (merge) en el
+# PhaseTimer del TpSim del proceso principal.
+# =============================================================================
+
+# Las fases de una evaluación, en orden
+#   set_widths  - poner los anchos en la ruta (put.set_widths)
+#   netlist     - generar el netlist (str del simulador) o, con session, los
+#                 comandos alter de los anchos que cambiaron
+#   simulator   - crear el simulador de PySpice y el ngspice (una vez)
+#   load        - cargar el netlist en ngspice
+#   transient   - el tran de ngspice
+#   transfer    - traer las formas de onda / mediciones de ngspice (plot)
+#   get_tp      - buscar el Tp en las formas de onda (o leer el .meas)
+PHASES = ('set_widths', 'netlist', 'simulator', 'load', 'transient', 'transfer', 'get_tp')
+
+# Los percentiles del informe
+PERCENTILES = (50, 90, 99)
+
+""" PhaseTimer:
+        Guarda la duración de cada vez que se ejecuta cada fase.
+        Las fases pueden ser cualquier string, PHASES son las de TpSim.
+
+        ejemplo:
+            timer = PhaseTimer()
+            with timer.phase('transient'):
+                ...
+            timer.log_report(logger, "TpSim")
+"""
+
+class PhaseTimer:
+
+    def __init__(self):
+        self.__samples = {}
+
+    # Un context manager que mide el bloque
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def add(self, name, seconds):
+        self.__samples.setdefault(name, []).append(seconds)
+
+    # Las muestras de cada fase: un dict de nombre: lista de segundos
+    def get_samples(self):
+        return self.__samples
+
+    # Devuelve las muestras y las borra (para mandarlas a otro proceso)
+    def take(self):
+        samples = self.__samples
+        self.__samples = {}
+        return samples
+
+    # Añade las muestras de take() de otro PhaseTimer
+    def merge(self, samples):
+        for (name, values) in samples.items():
+            self.__samples.setdefault(name, []).extend(values)
+
+    # (número de muestras, total) de cada fase
+    def get_totals(self):
+        return {name: (len(values), sum(values)) for (name, values) in self.__samples.items()}
+
+    # Las estadísticas de cada fase, en el orden de PHASES (las demás al final)
+    # Devuelve una lista de dicts: phase, count, total, mean y p<percentil>
+    def get_report(self):
+        names = [name for name in PHASES if (name in self.__samples)]
+        names += sorted(name for name in self.__samples if (name not in PHASES))
+
+        report = []
+        for name in names:
+            values = np.asarray(self.__samples[name])
+            row = {'phase': name, 'count': len(values), 'total': float(values.sum()),
+                   'mean': float(values.mean())}
+            for (p, value) in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+                row['p%d' % p] = float(value)
+            report.append(row)
+        return report
+
+    # Escribe el informe (una línea por fase) al logger
+    #   title   - lo que medimos (e.g. "Fine TpSim")
+    #   elapsed - el tiempo total de la ejecución, para el % de cada fase
+    def log_report(self, logger, title, elapsed=None):
+        report = self.get_report()
+        if (len(report) == 0):
+            return
+
+        logger.info("%s phase times:", title)
+        logger.info("  %-12s %8s %10s %7s %10s %10s %10s %10s", "phase", "count", "total (s)", "%",
+                    "mean (ms)", "p50 (ms)", "p90 (ms)", "p99 (ms)")
+        for row in report:
+            percent = (100.0 * row['total'] / elapsed) if (elapsed) else 0.0
+            logger.info("  %-12s %8d %10.2f %7.1f %10.3f %10.3f %10.3f %10.3f", row['phase'], row['count'],
+                        row['total'], percent, 1000.0 * row['mean'], 1000.0 * row['p50'],
+                        1000.0 * row['p90'], 1000.0 * row['p99'])
+
+class _Phase:
+
+    def __init__(self, timer, name):
+        self.__timer    = timer
+        self.__name     = name
+        self.__start    = None
+
+    def __enter__(self):
+        self.__start = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.__timer.add(self.__name, time.perf_counter() - self.__start)
+        return False
+
+""" TimingStream:
+        Escribe una línea JSON por ronda con los tiempos de cada fase desde
+        la línea anterior, para seguir una ejecución larga mientras corre
+        (e.g. tail -f).
+
+        argumentos:
+            filename    - El archivo (se sobrescribe)
+            timers      - Un dict de nombre: PhaseTimer (e.g. {'fine': ...})
+"""
+
+class TimingStream:
+
+    def __init__(self, filename, timers):
+        self.__handle   = open(filename, 'w')
+        self.__timers   = timers
+        self.__last     = {name: {} for name in timers}
+        self.__start    = time.time()
+
+    # sims - el número de simulaciones hasta ahora
+    def write(self, sims, **fields):
+        elapsed = time.time() - self.__start
+        line = {'sims': sims, 'elapsed': elapsed, 'sims_per_s': sims / max(elapsed, 1e-9)}
+        line.update(fields)
+
+        for (name, timer) in self.__timers.items():
+            totals = timer.get_totals()
+            last = self.__last[name]
+            line[name] = {phase: {'count': count - last.get(phase, (0, 0.0))[0],
+                                  'total': total - last.get(phase, (0, 0.0))[1]}
+                          for (phase, (count, total)) in totals.items()}
+            self.__last[name] = totals
+
+        self.__handle.write(json.dumps(line) + "\n")
+        self.__handle.flush()
+
+    def close(self):
+        self.__handle.close()
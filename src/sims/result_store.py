@@ -0,0 +1,161 @@
+import os
+
+import numpy as np
+
+# =============================================================================
+# Almacén de resultados en disco
+#
+# Las simulaciones de Monte Carlo producen un resultado (tp y anchos) por
+# cada simulación con éxito. En lugar de guardarlos todos en una lista en RAM
+# los ponemos en un buffer de tamaño fijo (un array de records de numpy) y lo
+# escribimos al archivo cada vez que se llena. Así la memoria es O(chunk_size)
+# sin importar el número de simulaciones, y si el proceso se muere tenemos en
+# disco todo menos el último chunk.
+#
+# El archivo es binario, sin cabecera: solo los records uno tras otro.
+# Para leerlo hay que saber cuantos anchos tiene la ruta (ver load_rows).
+#
+# Al final se puede convertir a un archivo .npy (ver write_results) con todas
+# las columnas del .cvs, que se abre con load_results sin parsear texto.
+# =============================================================================
+
+# El número de resultados en el buffer antes de escribirlo al archivo
+DEFAULT_CHUNK_SIZE = 4096
+
+# El tipo de cada record
+#   tp      - el Tp de la simulación
+#   widths  - los anchos de la ruta
+def get_dtype(num_widths):
+    return np.dtype([('tp',     np.float64),
+                     ('widths', np.float64, (num_widths,))])
+
+# Abre un archivo de resultados (de un ResultStore) sin leerlo a la memoria
+# Devuelve un array de records (memmap) o un array vacío si no hay resultados
+def load_rows(filename, num_widths):
+    dtype = get_dtype(num_widths)
+    if (os.path.getsize(filename) == 0):
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode='r')
+
+# El tipo de cada record en un archivo .npy de write_results
+#   tp              - el Tp de la simulación
+#   widths          - los anchos de la ruta
+#   total_width     - la suma de los anchos
+#   ratios          - widths[i+1] / widths[i] y al final carga / widths[-1]
+#   avg_ratio       - el promedio de los ratios sin la carga
+#   avg_ratio_load  - el promedio de los ratios con la carga
+def get_results_dtype(num_widths):
+    return np.dtype([('tp',             np.float64),
+                     ('widths',         np.float64, (num_widths,)),
+                     ('total_width',    np.float64),
+                     ('ratios',         np.float64, (num_widths,)),
+                     ('avg_ratio',      np.float64),
+                     ('avg_ratio_load', np.float64)])
+
+# Calcula los ratios de todas las filas de una vez
+#   widths      - una matriz de anchos, una fila por resultado
+#   loadWidth   - el ancho de la carga (load * W_MIN)
+# devuelve (ratios, avg_ratio, avg_ratio_load), ver get_results_dtype
+def get_ratios(widths, loadWidth):
+    widths = np.asarray(widths, dtype=np.float64)
+    ratios = np.empty(widths.shape)
+    ratios[:, :-1]  = widths[:, 1:] / widths[:, :-1]
+    ratios[:, -1]   = loadWidth / widths[:, -1]
+    return (ratios, ratios[:, :-1].mean(axis=1), ratios.mean(axis=1))
+
+# Escribe todos los resultados de un ResultStore a un archivo .npy de records
+# (ver get_results_dtype), un trozo a la vez
+def write_results(store, filename, loadWidth):
+    out = np.lib.format.open_memmap(filename, mode='w+',
+                                    dtype=get_results_dtype(store.get_num_widths()),
+                                    shape=(len(store),))
+    start = 0
+    for chunk in store.chunks():
+        end = start + len(chunk)
+        rows = out[start:end]
+        rows['tp']          = chunk['tp']
+        rows['widths']      = chunk['widths']
+        rows['total_width'] = chunk['widths'].sum(axis=1)
+        (rows['ratios'], rows['avg_ratio'], rows['avg_ratio_load']) = get_ratios(chunk['widths'], loadWidth)
+        start = end
+
+    out.flush()
+    del out
+
+# Abre un archivo de write_results sin leerlo a la memoria
+# Devuelve un array de records, e.g.:
+#   r = load_results("mcs.npy")
+#   best = r[np.argmin(r['tp'])]
+#   r['widths'][:, 2]
+def load_results(filename):
+    return np.load(filename, mmap_mode='r')
+
+""" ResultStore:
+        Guarda resultados en un archivo binario, añadiendo al final.
+
+        argumentos:
+            filename    - El archivo. Se sobrescribe si ya existe.
+            num_widths  - El número de anchos de la ruta
+            chunk_size  - El número de resultados en el buffer
+"""
+
+class ResultStore:
+
+    def __init__(self, filename, num_widths, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.__filename     = filename
+        self.__num_widths   = num_widths
+        self.__buffer       = np.zeros(chunk_size, dtype=get_dtype(num_widths))
+        self.__used         = 0     # resultados en el buffer
+        self.__count        = 0     # resultados en total
+        self.__handle       = open(filename, 'wb')
+
+    def get_filename(self):
+        return self.__filename
+
+    def get_num_widths(self):
+        return self.__num_widths
+
+    def get_chunk_size(self):
+        return len(self.__buffer)
+
+    def __len__(self):
+        return self.__count
+
+    def append(self, tp, widths):
+        row = self.__buffer[self.__used]
+        row['tp']       = tp
+        row['widths']   = widths
+
+        self.__used     += 1
+        self.__count    += 1
+
+        if (self.__used == len(self.__buffer)):
+            self.flush()
+
+    # Escribe el buffer al archivo
+    def flush(self):
+        if (self.__handle == None):
+            return
+        if (self.__used > 0):
+            self.__buffer[:self.__used].tofile(self.__handle)
+            self.__used = 0
+        self.__handle.flush()
+
+    # Todos los resultados, en orden, en trozos de chunk_size records
+    # Cada trozo es un array de records de numpy (ver get_dtype)
+    def chunks(self):
+        self.flush()
+        rows = load_rows(self.__filename, self.__num_widths)
+        for start in range(0, len(rows), len(self.__buffer)):
+            yield rows[start:start + len(self.__buffer)]
+
+    def close(self):
+        if (self.__handle != None):
+            self.flush()
+            self.__handle.close()
+            self.__handle = None
+
+    # Cierra y borra el archivo
+    def remove(self):
+        self.close()
+        os.remove(self.__filename)
@@ -0,0 +1,200 @@
+import math
+from dataclasses import dataclass
+from typing import List
+
+import numpy as np
+
+from sims   import tp_sim                   # La simulación de un Tp
+from sims   import sim_pool                 # Para simular en paralelo
+
+# =============================================================================
+# Sensibilidad del Tp respecto a cada ancho
+#
+# Para cada ancho w_i simulamos la ruta con ese ancho cambiado y los demás
+# iguales, todos los candidatos en una sola llamada al pool (así se simulan
+# en paralelo):
+#   FORWARD     - w_i * (1 + step): N + 1 simulaciones con la base
+#   CENTRAL     - w_i * (1 + step) y w_i / (1 + step): 2N + 1 simulaciones,
+#                 más preciso (el error es O(step^2) en lugar de O(step))
+# Si w_i * (1 + step) es más que el ancho máximo: con FORWARD usamos
+# w_i / (1 + step) (hacia atrás), con CENTRAL el ancho máximo, y el cociente
+# usa la diferencia real entre los dos anchos (si w_i ya es el máximo es la
+# diferencia hacia atrás).
+#
+# Los resultados de cada ancho:
+#   derivative  - dtp/dw_i en s/m (nan si un candidato no transiciona)
+#   elasticity  - (w_i / tp) * dtp/dw_i: el cambio relativo del Tp por un
+#                 cambio relativo del ancho. -0.2 quiere decir que con w_i un
+#                 1% más ancho el Tp es un 0.2% más corto.
+#
+# Los optimizadores piden el gradiente con Optimizer._get_gradient, que usa
+# get_candidates y get_sensitivity con sus propios lotes.
+# =============================================================================
+
+FORWARD     = 'forward'
+CENTRAL     = 'central'
+METHODS     = (FORWARD, CENTRAL)
+
+DEFAULT_STEP = 0.03
+
+# Con la base la simulación dura su Tp * SIM_TIME_MARGIN + 50ps, así los
+# candidatos un poco más lentos también transicionan
+SIM_TIME_MARGIN = 2.0
+
+# Buscando la duración de la base, comenzamos con 100ps y la doblamos hasta
+# MAX_SIM_TIME
+MAX_SIM_TIME = 100e-9
+
+@dataclass
+class Sensitivity:
+    tp:             float
+    widths:         List[float]
+    indices:        List[int]       # los anchos que cambiamos
+    derivatives:    List[float]     # uno por índice de indices
+    elasticities:   List[float]
+
+# Los cambios de cada candidato: una lista de (índice, ancho nuevo), en el
+# orden de get_candidates
+def _get_perturbations(widths, indices, step, method, maxWidth):
+    perturbations = []
+    for i in indices:
+        up = widths[i] * (1.0 + step)
+        down = widths[i] / (1.0 + step)
+        if (method == CENTRAL):
+            if ((maxWidth != None) and (up > maxWidth)):
+                up = max(maxWidth, widths[i])
+            perturbations += [(i, up), (i, down)]
+        elif ((maxWidth != None) and (up > maxWidth)):
+            perturbations.append((i, down))
+        else:
+            perturbations.append((i, up))
+    return perturbations
+
+# Los candidatos (listas de anchos) para la sensibilidad de widths, sin la base
+#   indices     - Los anchos que cambiamos (None para todos)
+#   step        - El cambio relativo de cada ancho
+#   method      - FORWARD o CENTRAL
+#   maxWidth    - El ancho máximo (None si no hay), ver el comentario al comienzo
+def get_candidates(widths, indices=None, step=DEFAULT_STEP, method=FORWARD, maxWidth=None):
+    if (indices == None):
+        indices = range(len(widths))
+
+    candidates = []
+    for (i, w) in _get_perturbations(widths, indices, step, method, maxWidth):
+        candidate = list(widths)
+        candidate[i] = w
+        candidates.append(candidate)
+    return candidates
+
+# La sensibilidad con los Tps de la base (tp) y de los candidatos de
+# get_candidates (tps, en el mismo orden, con los mismos argumentos).
+# Los Tps negativos o infinitos son de candidatos que no transicionaron.
+def get_sensitivity(widths, tp, tps, indices=None, step=DEFAULT_STEP, method=FORWARD, maxWidth=None):
+    if (indices == None):
+        indices = range(len(widths))
+    indices = list(indices)
+
+    perturbations = _get_perturbations(widths, indices, step, method, maxWidth)
+    tps = np.array(tps, dtype=np.float64)
+    tps[(tps < 0) | ~np.isfinite(tps)] = np.nan
+    if ((tp < 0) or (not math.isfinite(tp))):
+        tp = math.nan
+
+    derivatives = []
+    if (method == CENTRAL):
+        for k in range(len(indices)):
+            ((i, up), (i, down)) = perturbations[2*k:2*k + 2]
+            derivatives.append((tps[2*k] - tps[2*k + 1]) / (up - down))
+    else:
+        for (k, (i, w)) in enumerate(perturbations):
+            derivatives.append((tps[k] - tp) / (w - widths[i]))
+
+    derivatives = np.array(derivatives)
+    elasticities = derivatives * np.array([widths[i] for i in indices]) / tp
+    return Sensitivity(tp, list(widths), indices, derivatives.tolist(), elasticities.tolist())
+
+# La sensibilidad de widths simulando la base y todos los candidatos con una
+# sola llamada a pool.get_tps (ver sim_pool.SimPool)
+def get_pool_sensitivity(pool, widths, sim_time, indices=None, step=DEFAULT_STEP, method=FORWARD, maxWidth=None):
+    candidates = get_candidates(widths, indices, step, method, maxWidth)
+    tps = pool.get_tps([list(widths)] + candidates, sim_time)
+    return get_sensitivity(widths, tps[0], tps[1:], indices, step, method, maxWidth)
+
+# Una duración de simulación suficiente para widths, y su Tp
+# (None, -1 si no transiciona antes de MAX_SIM_TIME)
+def _find_sim_time(pool, widths, logger):
+    sim_time = 100e-12
+    while (sim_time <= MAX_SIM_TIME):
+        tp = pool.get_tps([list(widths)], sim_time)[0]
+        if (tp >= 0):
+            return (tp * SIM_TIME_MARGIN + 50e-12, tp)
+        logger.verbose("Out never transititons, increasing simulation time to %e", 2 * sim_time)
+        sim_time *= 2
+    return (None, -1)
+
+# tech          - La tecnologia
+# put           - La ruta
+# step_time     - El escalon máximo de las simulaciones
+# logger        - El logger
+# widths        - Los anchos (None para los de logical effort, o los de la
+#                 ruta si no los tiene)
+# step, method  - Ver el comentario al comienzo
+# workers       - El número de procesos del pool
+# session, meas - Ver TpSim
+# batch         - El número de copias de la ruta en el netlist (ver TpSim copies)
+#
+# Devuelve un Sensitivity (None si la base no transiciona o widths no tiene
+# un ancho por cada ancho de la ruta)
+def do_sensitivity(tech, put, step_time, logger, widths=None, step=DEFAULT_STEP, method=FORWARD,
+                   workers=1, session=False, meas=False, batch=1):
+    sim = tp_sim.TpSim(tech, put, step_time, logger, session, meas, copies=batch)
+
+    if (widths == None):
+        widths = put.get_logical_effort_optimal_widths()
+        if (widths == None):
+            widths = put.get_widths()
+    elif (len(widths) != len(put.get_widths())):
+        logger.error("Path %s has %d widths, got %d", put.name(), len(put.get_widths()), len(widths))
+        return None
+
+    logger.info("Sensitivity of path %s, tech %s, load %.2f, step_time %e: %s differences, step %.1f%%, "
+                "%d simulations, workers %d, batch %d", put.name(), tech.NAME, put.get_load(), step_time,
+                method, 100.0 * step, len(widths) * (2 if (method == CENTRAL) else 1) + 1, workers, batch)
+
+    pool = sim_pool.SimPool(sim, workers)
+    try:
+        (sim_time, tp) = _find_sim_time(pool, widths, logger)
+        if (sim_time == None):
+            logger.error("Out never transitions with widths [%s], aborting",
+                         ", ".join("%.2fe-6" % (w*1e6) for w in widths))
+            return None
+
+        result = get_pool_sensitivity(pool, widths, sim_time, None, step, method, put.get_max_width())
+    finally:
+        pool.close()
+
+    log_sensitivity(tech, put, result, logger)
+    return result
+
+def log_sensitivity(tech, put, result, logger):
+    gateTypes = put.get_gate_types()
+    elasticities = np.array(result.elasticities)
+    order = np.argsort(-np.abs(np.nan_to_num(elasticities)), kind='stable')
+    ranks = np.empty(len(order), dtype=int)
+    ranks[order] = np.arange(1, len(order) + 1)
+
+    logger.info("Tp %e", result.tp)
+    logger.info("  %5s %-10s %12s %16s %12s %6s", "stage", "gate", "width (W_MIN)", "dtp/dw (ps/um)",
+                "elasticity", "rank")
+    for (k, i) in enumerate(result.indices):
+        logger.info("  %5d %-10s %12.3f %16s %12s %6d", i, gateTypes[i] if (i < len(gateTypes)) else "",
+                    result.widths[i] / tech.W_MIN,
+                    "n/a" if math.isnan(result.derivatives[k]) else "%.4f" % (result.derivatives[k] * 1e6),
+                    "n/a" if math.isnan(result.elasticities[k]) else "%.4f" % result.elasticities[k],
+                    ranks[k])
+
+    # Cambiar todos los anchos juntos: la suma de las elasticidades
+    if (not np.any(np.isnan(elasticities))):
+        logger.info("Most sensitive stage %d (%.2f%% Tp change for 1%% wider). All widths 1%% wider: "
+                    "%.2f%% Tp change", result.indices[order[0]], elasticities[order[0]],
+                    float(np.sum(elasticities)))
@@ -0,0 +1,86 @@
+import importlib
+import logging
+import multiprocessing
+
+from sims   import tp_sim
+
+# ==============================================================================
+# El estado de cada proceso del pool
+# Cada proceso tiene su propia ruta, su propio netlist y su propio ngspice
+# ==============================================================================
+_worker_sim = None
+
+# Se ejecuta una vez en cada proceso cuando comienza
+#   tech_name   - el nombre del módulo de la tecnologia (e.g. "tech.TSMC180"),
+#                 no se puede mandar un módulo a otro proceso
+#   put         - la ruta. Las rutas implementan __reduce__ así que
+#                 llegan al proceso nuevas, sin netlist
+#   options     - los argumentos opcionales de TpSim (ver TpSim.get_options)
+def _worker_init(tech_name, put, step_time, options):
+    global _worker_sim
+    tech = importlib.import_module(tech_name)
+    _worker_sim = tp_sim.TpSim(tech, put, step_time, logging.getLogger(__name__), **options)
+
+# Devuelve (tps, las muestras del PhaseTimer de este lote)
+def _worker_get_tps(job):
+    widthsList, sim_time = job
+    tps = _worker_sim.get_tps(widthsList, sim_time)
+    return (tps, _worker_sim.get_timer().take())
+
+""" SimPool:
+        Evalúa listas de anchos (candidatos) y devuelve sus Tps.
+        Si workers <= 1 usa el TpSim que le pasas, en este proceso.
+        Si no, crea un pool de workers procesos, cada uno con su propio TpSim.
+        Cada proceso recibe lotes de sim.get_copies() candidatos, que simula
+        con un solo tran (ver TpSim copies).
+
+        Los resultados siempre vuelven en el mismo orden que los candidatos,
+        así que los resultados no dependen de cual proceso termina primero.
+        Los tiempos de las fases de los procesos se añaden al PhaseTimer de
+        sim (ver TpSim.get_timer).
+
+        argumentos:
+            sim         - El TpSim de este proceso
+            workers     - El número de procesos
+"""
+
+class SimPool:
+
+    def __init__(self, sim, workers):
+        self.__sim      = sim
+        self.__workers  = max(1, workers)
+        self.__pool     = None
+
+        if (self.__workers > 1):
+            self.__pool = multiprocessing.Pool(self.__workers,
+                                               initializer=_worker_init,
+                                               initargs=(sim.get_tech().__name__,
+                                                         sim.get_put(),
+                                                         sim.get_step_time(),
+                                                         sim.get_options()))
+
+    def get_workers(self):
+        return self.__workers
+
+    # El número de candidatos que simulamos a la vez
+    def get_batch_size(self):
+        return self.__workers * self.__sim.get_copies()
+
+    # widthsList    - una lista de listas de anchos
+    # devuelve una lista de Tps (-1 si la salida nunca transiciona)
+    def get_tps(self, widthsList, sim_time):
+        if (self.__pool == None):
+            return self.__sim.get_tps(widthsList, sim_time)
+
+        copies = self.__sim.get_copies()
+        jobs = [(widthsList[i:i + copies], sim_time) for i in range(0, len(widthsList), copies)]
+        results = self.__pool.map(_worker_get_tps, jobs)
+        for (tps, samples) in results:
+            self.__sim.get_timer().merge(samples)
+        return [tp for (tps, samples) in results for tp in tps]
+
+    def close(self):
+        if (self.__pool != None):
+            self.__pool.close()
+            self.__pool.join()
+            self.__pool = None
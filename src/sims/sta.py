@@ -0,0 +1,400 @@
+import heapq
+import math
+
+from sims   import characterize             # g, p y tau de las compuertas
+from sims   import nldm                     # Las tablas de retardo / slew
+
+# =============================================================================
+# Análisis de tiempo estático (STA) de un grafo de compuertas
+#
+# TimingGraph es un DAG de entradas y compuertas (clases de tech: Inversor,
+# Nand, Nor) con sus anchos. Cada compuerta tiene un nodo de salida con su
+# mismo nombre, así las entradas de una compuerta son nombres de entradas
+# del grafo o de otras compuertas. Las entradas de una compuerta que no están
+# en el grafo están en el valor que no controla la salida (como las
+# entradas B de NandChainPath), no cargan ningún nodo.
+#
+# Propagamos en orden topológico el tiempo de llegada (arrival) y el slew de
+# cada flanco (RISE / FALL) de cada nodo. Todas las compuertas de tech
+# invierten, así el flanco ascendente de la salida viene del descendente de
+# las entradas y viceversa. La llegada de la salida es el máximo sobre las
+# entradas de llegada + retardo, y el slew es el de esa entrada (la crítica).
+#
+# El retardo de cada compuerta viene de un modelo:
+#   LogicalEffortModel  - d = tau·(g·h + p), con g, p (y tau) de la
+#                         caracterización si hay (ver characterize). El slew
+#                         de la salida es el de un RC con el mismo retardo
+#                         (no depende del slew de la entrada). Sin
+#                         caracterización el resultado está en unidades de tau.
+#   NLDMModel           - las tablas de nldm (retardo y slew según el slew
+#                         de la entrada y la carga)
+#
+# La carga de un nodo es la suma de las entradas que maneja (g·w de cada
+# una) más las cargas externas (add_output), en anchos de inversor.
+#
+# set_width solo marca las compuertas afectadas: la misma compuerta y las
+# que manejan sus entradas (su carga cambió). La próxima consulta recalcula
+# esas y sigue hacia adelante solo mientras la llegada o el slew de un nodo
+# cambian, así cambiar un ancho en un grafo grande cuesta pocas compuertas.
+#
+# Esto sirve para explorar anchos rápido. El Tp final hay que comprobarlo
+# con una simulación (TpSim).
+# =============================================================================
+
+# Los flancos (índices de arrival / slew)
+RISE = 0
+FALL = 1
+EDGE_NAMES = ('rise', 'fall')
+
+""" LogicalEffortModel:
+        d = tau·(g·h + p), h = carga / (g·w), con g y p de
+        characterize.get_gate_parameters. El slew (10-90%) de la salida es
+        el de la respuesta de un RC a un escalón con el mismo retardo (50%):
+        d·ln(9)/ln(2). El modelo no usa el slew de la entrada.
+
+        argumentos:
+            tech    - La tecnologia
+"""
+
+class LogicalEffortModel:
+
+    # El slew 10-90% de un RC es ln(9)·RC y su retardo 50% es ln(2)·RC
+    SLEW_PER_DELAY = math.log(9.0) / math.log(2.0)
+
+    def __init__(self, tech):
+        self.__tech     = tech
+        self.__tau      = characterize.get_tau(tech)
+        self.__params   = {}
+
+    def get_units(self):
+        return "tau" if (self.__tau == None) else "s"
+
+    def __get_parameters(self, gateName):
+        if (gateName not in self.__params):
+            self.__params[gateName] = characterize.get_gate_parameters(self.__tech, gateName)
+        return self.__params[gateName]
+
+    # La capacitancia de una entrada de una compuerta de ancho 1, en anchos
+    # de inversor (igual que los get_logical_effort_delay de las rutas)
+    def get_input_load(self, gateName):
+        return self.__get_parameters(gateName)[0]
+
+    # load en anchos de inversor (m), devuelve (retardo, slew de la salida)
+    def get_delay_slew(self, gateName, w, load, slew, outRising):
+        (g, p) = self.__get_parameters(gateName)
+        tau = 1.0 if (self.__tau == None) else self.__tau
+        h = load / (g * w)
+        delay = tau * (g * h + p)
+        return (delay, delay * self.SLEW_PER_DELAY)
+
+""" NLDMModel:
+        El retardo y el slew de las tablas de nldm.
+
+        argumentos:
+            library - Un nldm.NLDMLibrary (e.g. nldm.get_library(tech))
+"""
+
+class NLDMModel:
+
+    def __init__(self, library):
+        self.__library  = library
+        self.__wMin     = library.get_tech().W_MIN
+
+    def get_units(self):
+        return "s"
+
+    def get_input_load(self, gateName):
+        return self.__library.get_input_load(gateName)
+
+    def get_delay_slew(self, gateName, w, load, slew, outRising):
+        (delay, slew) = self.__library.get_table(gateName).get_delay_slew(slew, load / self.__wMin, w,
+                                                                          self.__wMin, outRising)
+        return (float(delay), float(slew))
+
+# Un nodo del grafo: una entrada (gateName None) o la salida de una compuerta
+class _Node:
+
+    def __init__(self, name, gateName, inputs, width):
+        self.name       = name
+        self.gateName   = gateName
+        self.inputs     = inputs
+        self.width      = width
+        self.fanouts    = []            # Las compuertas que maneja (una vez por entrada)
+        self.extraLoad  = 0.0
+        self.isOutput   = False
+        self.order      = -1            # El índice en el orden topológico
+        self.arrival    = [-math.inf, -math.inf]
+        self.slew       = [0.0, 0.0]
+        self.pred       = [None, None]  # La entrada crítica de cada flanco
+
+""" TimingGraph:
+        Un DAG de compuertas con STA incremental (ver el comentario al comienzo).
+
+        argumentos:
+            tech    - La tecnologia
+            model   - El modelo de retardo (LogicalEffortModel(tech) si None)
+
+        ejemplo:
+            graph = TimingGraph(tech)
+            graph.add_input('a')
+            graph.add_input('b')
+            graph.add_gate('n1', 'Nand', ['a', 'b'], tech.W_MIN)
+            graph.add_gate('n2', 'Inversor', ['n1'], 2 * tech.W_MIN)
+            graph.add_output('n2', 8 * tech.W_MIN)
+            graph.get_worst()
+            graph.set_width('n1', 2 * tech.W_MIN)
+            graph.get_critical_path()
+"""
+
+class TimingGraph:
+
+    def __init__(self, tech, model=None):
+        self.__tech         = tech
+        self.__model        = LogicalEffortModel(tech) if (model == None) else model
+        self.__nodes        = {}
+        self.__order        = None      # Las compuertas en orden topológico, None si hay que calcularlo
+        self.__dirty        = set()
+        self.__recomputed   = 0
+
+    def get_model(self):
+        return self.__model
+
+    # ========================
+    # La estructura del grafo
+    # ========================
+
+    #   arrival - El tiempo de llegada de los dos flancos
+    #   slew    - El slew 10-90% de los dos flancos
+    #   rising  - False si la entrada no tiene flanco ascendente (e.g. para
+    #             medir solo el Tp de subida, como TpSim), falling igual
+    def add_input(self, name, arrival=0.0, slew=nldm.DEFAULT_IN_SLEW, rising=True, falling=True):
+        node = self.__new_node(name, None, [], None)
+        node.arrival = [arrival if rising else -math.inf, arrival if falling else -math.inf]
+        node.slew = [slew, slew]
+
+    #   gateName    - La clase de la compuerta en tech (e.g. 'Nand')
+    #   inputs      - Los nodos de sus entradas (a lo más get_num_inputs)
+    #   width       - El ancho (m)
+    def add_gate(self, name, gateName, inputs, width):
+        if (gateName not in characterize.GATES):
+            raise ValueError("Unknown gate %s for %s" % (gateName, name))
+        if ((len(inputs) == 0) or (len(inputs) > getattr(self.__tech, gateName)().get_num_inputs())):
+            raise ValueError("Gate %s (%s) has %d inputs" % (name, gateName, len(inputs)))
+        self.__new_node(name, gateName, list(inputs), width)
+
+    # Marca node como salida del grafo, con una carga de un inversor de ancho
+    # loadWidth (ver add_load)
+    def add_output(self, name, loadWidth=0.0):
+        self.__get_node(name).isOutput = True
+        self.add_load(name, loadWidth)
+
+    # Una carga fuera del grafo en node (e.g. una rama), un inversor de ancho
+    # loadWidth. Se suma si hay varias.
+    def add_load(self, name, loadWidth):
+        node = self.__get_node(name)
+        node.extraLoad += loadWidth
+        if (node.gateName != None):
+            self.__dirty.add(name)
+
+    def __new_node(self, name, gateName, inputs, width):
+        if (name in self.__nodes):
+            raise ValueError("Node %s already exists" % name)
+        node = _Node(name, gateName, inputs, width)
+        self.__nodes[name] = node
+        self.__order = None
+        return node
+
+    def __get_node(self, name):
+        node = self.__nodes.get(name)
+        if (node == None):
+            raise KeyError("Unknown node %s" % name)
+        return node
+
+    def get_gate_names(self):
+        return [name for (name, node) in self.__nodes.items() if (node.gateName != None)]
+
+    def get_outputs(self):
+        outputs = [name for (name, node) in self.__nodes.items() if (node.isOutput)]
+        if (len(outputs) == 0):
+            self.__sort()
+            outputs = [node.name for node in self.__order if (len(node.fanouts) == 0)]
+        return outputs
+
+    def get_width(self, name):
+        return self.__get_node(name).width
+
+    def set_width(self, name, width):
+        node = self.__get_node(name)
+        if (node.gateName == None):
+            raise ValueError("%s is an input" % name)
+        if (node.width == width):
+            return
+        node.width = width
+        self.__dirty.add(name)
+        self.__mark_drivers(node)
+
+    #   widths  - Un dict de compuerta: ancho
+    def set_widths(self, widths):
+        for (name, width) in widths.items():
+            self.set_width(name, width)
+
+    # Las compuertas que manejan las entradas de node (su carga cambió)
+    def __mark_drivers(self, node):
+        for inName in node.inputs:
+            if ((inName in self.__nodes) and (self.__nodes[inName].gateName != None)):
+                self.__dirty.add(inName)
+
+    # El orden topológico de las compuertas (Kahn), y las listas de fanout
+    def __sort(self):
+        if (self.__order != None):
+            return
+
+        for node in self.__nodes.values():
+            node.fanouts = []
+        pending = {}
+        for node in self.__nodes.values():
+            if (node.gateName == None):
+                continue
+            for inName in node.inputs:
+                if (inName not in self.__nodes):
+                    raise ValueError("Input %s of gate %s is not a node" % (inName, node.name))
+                self.__nodes[inName].fanouts.append(node)
+            pending[node.name] = len(node.inputs)
+
+        ready = [node for node in self.__nodes.values() if (node.gateName == None)]
+        order = []
+        while (len(ready) > 0):
+            node = ready.pop()
+            if (node.gateName != None):
+                node.order = len(order)
+                order.append(node)
+            for fanout in node.fanouts:
+                pending[fanout.name] -= 1
+                if (pending[fanout.name] == 0):
+                    ready.append(fanout)
+
+        if (len(order) < len(pending)):
+            cycle = sorted(name for (name, count) in pending.items() if (count > 0))
+            raise ValueError("The graph has a cycle through %s" % ", ".join(cycle[:10]))
+
+        self.__order = order
+        self.__dirty = set(node.name for node in order)
+
+    # ==========
+    # Propagar
+    # ==========
+
+    # La carga del nodo en anchos de inversor
+    def __get_load(self, node):
+        load = node.extraLoad
+        for fanout in node.fanouts:
+            load += self.__model.get_input_load(fanout.gateName) * fanout.width
+        return load
+
+    # Calcula la llegada y el slew de una compuerta, devuelve True si cambiaron
+    def __compute(self, node):
+        load = self.__get_load(node)
+        old = (tuple(node.arrival), tuple(node.slew))
+
+        for edge in (RISE, FALL):
+            inEdge = FALL if (edge == RISE) else RISE
+            (arrival, slew, pred) = (-math.inf, 0.0, None)
+            for inName in node.inputs:
+                src = self.__nodes[inName]
+                if (src.arrival[inEdge] == -math.inf):
+                    continue
+                (delay, outSlew) = self.__model.get_delay_slew(node.gateName, node.width, load,
+                                                               src.slew[inEdge], edge == RISE)
+                if (src.arrival[inEdge] + delay > arrival):
+                    (arrival, slew, pred) = (src.arrival[inEdge] + delay, outSlew, inName)
+            node.arrival[edge] = arrival
+            node.slew[edge] = slew
+            node.pred[edge] = pred
+
+        return (old != (tuple(node.arrival), tuple(node.slew)))
+
+    # Recalcula las compuertas marcadas y las que dependen de ellas, en
+    # orden topológico. Devuelve el número de compuertas recalculadas.
+    def update(self):
+        self.__sort()
+        if (len(self.__dirty) == 0):
+            return 0
+
+        heap = [(self.__nodes[name].order, name) for name in self.__dirty]
+        heapq.heapify(heap)
+        queued = set(self.__dirty)
+        self.__dirty = set()
+        count = 0
+
+        while (len(heap) > 0):
+            (order, name) = heapq.heappop(heap)
+            node = self.__nodes[name]
+            count += 1
+            if (self.__compute(node)):
+                for fanout in node.fanouts:
+                    if (fanout.name not in queued):
+                        queued.add(fanout.name)
+                        heapq.heappush(heap, (fanout.order, fanout.name))
+
+        self.__recomputed += count
+        return count
+
+    # El total de compuertas recalculadas desde que se creó el grafo
+    def get_recomputed(self):
+        return self.__recomputed
+
+    # ===========
+    # Consultas
+    # ===========
+
+    # La llegada de un flanco del nodo, o la peor de los dos (edge None)
+    def get_arrival(self, name, edge=None):
+        self.update()
+        node = self.__get_node(name)
+        return max(node.arrival) if (edge == None) else node.arrival[edge]
+
+    def get_slew(self, name, edge):
+        self.update()
+        return self.__get_node(name).slew[edge]
+
+    # La peor llegada de las salidas: (nodo, flanco, llegada)
+    def get_worst(self):
+        self.update()
+        worst = (None, None, -math.inf)
+        for name in self.get_outputs():
+            node = self.__nodes[name]
+            for edge in (RISE, FALL):
+                if (node.arrival[edge] > worst[2]):
+                    worst = (name, edge, node.arrival[edge])
+        return worst
+
+    # La ruta crítica desde una entrada hasta la peor salida, una lista de
+    # (nodo, compuerta (None para la entrada), flanco, llegada, slew)
+    def get_critical_path(self):
+        (name, edge, arrival) = self.get_worst()
+        path = []
+        while (name != None):
+            node = self.__nodes[name]
+            path.append((name, node.gateName, edge, node.arrival[edge], node.slew[edge]))
+            (name, edge) = (node.pred[edge], FALL if (edge == RISE) else RISE)
+        path.reverse()
+        return path
+
+    def log_critical_path(self, logger):
+        path = self.get_critical_path()
+        if (len(path) == 0):
+            logger.info("No path from an input to an output")
+            return
+
+        units = self.__model.get_units()
+        logger.info("Critical path: %d gates, arrival %e %s", len(path) - 1, path[-1][3], units)
+        logger.info("  %-16s %-9s %-5s %12s %12s %12s %11s", "node", "gate", "edge", "width",
+                    "arrival", "delay", "slew")
+        last = None
+        for (name, gateName, edge, arrival, slew) in path:
+            node = self.__nodes[name]
+            logger.info("  %-16s %-9s %-5s %12s %12.4e %12s %11.3e", name,
+                        "input" if (gateName == None) else gateName, EDGE_NAMES[edge],
+                        "" if (node.width == None) else "%.3e" % node.width, arrival,
+                        "" if (last == None) else "%.4e" % (arrival - last), slew)
+            last = arrival
@@ -0,0 +1,125 @@
+import math
+import os
+import pickle
+
+import numpy as np
+
+# =============================================================================
+# Modelo sustituto (surrogate) del Tp
+#
+# Una regresión ridge bayesiana con un polinomio de segundo grado en
+# log(anchos) y log(carga). Además de predecir el Tp da una desviación
+# estándar, así podemos calcular la mejora esperada (expected improvement)
+# de un candidato sin simularlo.
+#
+# Las muestras (log(anchos), log(carga), tp) se pueden guardar en un archivo
+# para usarlas en otra ejecución con la misma ruta y una carga parecida
+# (warm start).
+# =============================================================================
+
+# La versión del formato del archivo de muestras
+_FILE_VERSION = 1
+
+# El número máximo de muestras por ruta en el archivo (guardamos las últimas)
+MAX_FILE_SAMPLES = 20000
+
+# Las características: 1, z_i y z_i * z_j (i <= j), con z = (x, log(carga))
+def get_features(X):
+    X = np.atleast_2d(X)
+    (n, d) = X.shape
+    (i, j) = np.triu_indices(d)
+    return np.hstack((np.ones((n, 1)), X, X[:, i] * X[:, j]))
+
+def get_num_features(d):
+    return 1 + d + (d * (d + 1)) // 2
+
+_erf = np.vectorize(math.erf)
+
+# La mejora esperada (para minimizar) de una normal (mean, std) sobre best
+def expected_improvement(mean, std, best):
+    std = np.maximum(std, 1e-30)
+    imp = best - mean
+    z = imp / std
+    cdf = 0.5 * (1.0 + _erf(z / math.sqrt(2.0)))
+    pdf = np.exp(-0.5 * z * z) / math.sqrt(2.0 * math.pi)
+    return imp * cdf + std * pdf
+
+""" RidgeModel:
+        Regresión ridge bayesiana.
+
+        argumentos:
+            alpha   - La regularización
+"""
+
+class RidgeModel:
+
+    def __init__(self, alpha=1e-3):
+        self.__alpha    = alpha
+        self.__coef     = None
+        self.__Ainv     = None
+        self.__sigma2   = None
+
+    def is_fitted(self):
+        return (self.__coef is not None)
+
+    # X   - una matriz con una fila por muestra (los z de get_features)
+    # y   - los valores
+    def fit(self, X, y):
+        phi = get_features(X)
+        y = np.asarray(y, dtype=np.float64)
+        (n, p) = phi.shape
+
+        A = phi.T @ phi + self.__alpha * np.eye(p)
+        self.__Ainv = np.linalg.pinv(A)
+        self.__coef = self.__Ainv @ (phi.T @ y)
+
+        residuals = y - phi @ self.__coef
+        self.__sigma2 = float(residuals @ residuals) / max(1, n - p)
+
+    # Devuelve (mean, std) de cada fila de X
+    def predict(self, X):
+        phi = get_features(X)
+        mean = phi @ self.__coef
+        var = self.__sigma2 * np.einsum('ij,jk,ik->i', phi, self.__Ainv, phi)
+        return (mean, np.sqrt(np.maximum(var, 0.0)))
+
+# =============================================================================
+# El archivo de muestras
+# Un dict de (tech, ruta): lista de (x, log(carga), tp)
+# =============================================================================
+
+def load_samples(filename, key, logLoad, maxLogDistance, logger):
+    if ((filename == None) or (not os.path.exists(filename))):
+        return []
+
+    try:
+        with open(filename, 'rb') as f:
+            data = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        logger.warning("Failed to read surrogate file %s, ignoring it", filename)
+        return []
+
+    if ((not isinstance(data, dict)) or (data.get('version') != _FILE_VERSION)):
+        logger.warning("Surrogate file %s has an unknown format, ignoring it", filename)
+        return []
+
+    return [s for s in data['samples'].get(key, []) if (abs(s[1] - logLoad) <= maxLogDistance)]
+
+def save_samples(filename, key, samples, logger):
+    data = {'version': _FILE_VERSION, 'samples': {}}
+    if (os.path.exists(filename)):
+        try:
+            with open(filename, 'rb') as f:
+                old = pickle.load(f)
+            if (isinstance(old, dict) and (old.get('version') == _FILE_VERSION)):
+                data = old
+        except (OSError, pickle.UnpicklingError, EOFError):
+            pass
+
+    data['samples'][key] = (data['samples'].get(key, []) + samples)[-MAX_FILE_SAMPLES:]
+
+    try:
+        with open(filename, 'wb') as f:
+            pickle.dump(data, f)
+    except OSError:
+        logger.error("Failed to write surrogate file %s", filename)
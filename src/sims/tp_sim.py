@@ -0,0 +1,484 @@
+import random
+import time
+
+from PySpice.Doc.ExampleTools import find_libraries
+from PySpice.Spice.Netlist import Circuit
+from PySpice.Spice.NgSpice.Shared import NgSpiceShared, NgSpiceCommandError, ffi
+
+from sims   import crossings                # Búsqueda de transiciones en las formas de onda
+from sims   import phase_timer              # Los tiempos de cada fase de una simulación
+
+# Hay un solo ngspice por proceso. Guardamos cual TpSim tiene su netlist
+# cargado en el ngspice, si hay más de un TpSim con sesión en el mismo
+# proceso hay que cargar el netlist otra vez cuando cambiamos de TpSim.
+_session_owner = None
+
+# ngspice guarda todos los comandos que recibe. Cada este número de comandos
+# liberamos esa memoria con ngSpice_Command(NULL), así la memoria no crece
+# durante una sesión larga.
+_COMMANDS_TO_RELEASE_MEMORY = 10000
+
+""" TpSim:
+        Contiene el netlist de una ruta (con su fuente de pulsos y su carga)
+        y sabe como simularlo para obtener el Tp con unos anchos dados.
+
+        Cada proceso que hace simulaciones debería tener su propio TpSim,
+        porque los anchos están guardados en las instancias del netlist.
+
+        argumentos:
+            tech        - La tecnologia usar
+            put         - Path Under Test (Ruta bajo prueba)
+            step_time   - El escalon máximo para usar en la simulación
+            logger      - El logger (solo usamos logger.debug aquí, así
+                          puede estar un logging.Logger normal)
+            session     - False: cada simulación carga el netlist otra vez, así
+                          ngspice parsea el netlist y el .lib cada vez.
+                          True: cargamos el netlist una vez en ngspice y para
+                          cada simulación solo cambiamos los anchos de los
+                          transistores (comando alter) y ejecutamos tran.
+            meas        - False: traemos las formas de onda de in y out y
+                          buscamos las transiciones con numpy (ver crossings).
+                          True: ngspice calcula el Tp con .meas tran y solo
+                          traemos el resultado.
+            measures    - Las mediciones que añadimos al netlist cuando
+                          meas = True (ver MEASURES). Por defecto solo 'tp'.
+            early_stop  - True: ngspice termina el tran (stop when) apenas
+                          out cruza VDD/2, no sigue hasta sim_time. Así con
+                          sim_time = get_in_cross_time() + el mejor Tp * margen
+                          un candidato peor que el mejor tampoco simula más
+                          que eso y get_tp devuelve -1.
+            probes      - Los nodos que ngspice guarda (.save). Siempre
+                          guardamos in y out, que necesitamos para el Tp.
+                          Puedes añadir más con put.get_nodes('In', 'Out').
+                          None para guardar todos los nodos y corrientes
+                          (e.g. para plotear con put.plot).
+            copies      - El número de copias de la ruta en el netlist, cada
+                          una con su propia fuente de pulsos, su carga y sus
+                          anchos. get_tps simula copies candidatos con un
+                          solo tran. La copia 0 es put (nodos In y Out), las
+                          demás son rutas nuevas con el prefijo "b<k>_" en
+                          todos sus nodos (e.g. b1_In, b1_Out).
+                          No funciona con early_stop, un stop when para
+                          cuando la primera salida transiciona.
+            spice_options - Un dict de .options de ngspice (e.g. {'reltol': 1e-2}
+                          para una simulación menos precisa pero más rápida).
+                          None para usar los valores por defecto de ngspice.
+"""
+
+class TpSim:
+
+    # Las mediciones que podemos añadir al netlist cuando meas = True
+    #   tp      - flanco ascendente de in hasta la transición de out
+    #             (descendente si la ruta invierte). Es el Tp que usamos.
+    #   tphl    - Tp de la salida de alto a bajo
+    #   tplh    - Tp de la salida de bajo a alto
+    # Uno de tphl / tplh es el mismo que tp, el otro usa el flanco
+    # descendente de in (a 1ns), así solo está disponible si sim_time
+    # es más de ~1.1ns. Si no ngspice reporta un error por la medición que falla.
+    MEASURES = ('tp', 'tphl', 'tplh')
+
+    # Los nodos que guardamos por defecto
+    DEFAULT_PROBES = ('in', 'out')
+
+    # La fuente de pulsos de la entrada
+    IN_DELAY    = 10e-12
+    IN_RISE     = 20e-12
+
+    def __init__(self, tech, put, step_time, logger, session=False, meas=False, measures=('tp',), early_stop=False,
+                 probes=DEFAULT_PROBES, copies=1, spice_options=None):
+        self.__tech         = tech
+        self.__put          = put
+        self.__step_time    = step_time
+        self.__logger       = logger
+        self.__session      = session
+        self.__meas         = meas
+        self.__measures     = tuple(measures)
+        self.__early_stop   = early_stop
+        self.__prefixes     = [''] + ["b%d_" % k for k in range(1, copies)]
+        self.__spice_options = spice_options
+
+        if (early_stop and (copies > 1)):
+            raise ValueError("early_stop doesn't work with more than one copy")
+
+        # Los nodos en ngspice están en minúsculas
+        self.__probes = None
+        if (probes != None):
+            defaults = set(prefix + node for prefix in self.__prefixes for node in self.DEFAULT_PROBES)
+            self.__probes = tuple(sorted(set(p.lower() for p in probes) | defaults))
+
+        if ('tp' not in self.__measures):
+            raise ValueError("measures must include 'tp'")
+        for name in self.__measures:
+            if (name not in self.MEASURES):
+                raise ValueError("Unknown measure %s" % name)
+
+        # ==================
+        # Generar el netlist
+        # ==================
+        libraries_path = find_libraries()
+        self.__circuit = Circuit("Tp_Sim_"+put.name()+"_"+tech.NAME)
+        self.__circuit.include(libraries_path + "/" + tech.LIB_NAME)   #.inclcude "foo.lib"
+
+        self.__circuit.V('dd', 'Vdd', self.__circuit.gnd, tech.VDD)   # Fuente de tensión Vdd
+
+        # Fuente de tensión de pulses que usamos como la entrada de la ruta
+        self.__circuit.PulseVoltageSource("In", "In", self.__circuit.gnd, initial_value=0, pulsed_value=tech.VDD, pulse_width=1e-9, period=2e-9, delay_time=self.IN_DELAY, rise_time=self.IN_RISE, fall_time=self.IN_RISE)
+
+        # La ruta que queremos probar
+        put.add_to_circuit(self.__circuit, 'Vdd', 'In', 'Out')
+
+        # Y las copias, rutas nuevas iguales a put (ver __reduce__ de las rutas)
+        self.__puts = [put]
+        for prefix in self.__prefixes[1:]:
+            (rebuild, args) = put.__reduce__()
+            copy = rebuild(*args)
+            self.__circuit.PulseVoltageSource(prefix + "In", prefix + "In", self.__circuit.gnd, initial_value=0, pulsed_value=tech.VDD, pulse_width=1e-9, period=2e-9, delay_time=self.IN_DELAY, rise_time=self.IN_RISE, fall_time=self.IN_RISE)
+            copy.add_to_circuit(self.__circuit, 'Vdd', prefix + 'In', prefix + 'Out', prefix)
+            self.__puts.append(copy)
+
+        # El simulador y ngspice se crean con la primera simulación, así
+        # un TpSim creado antes de un fork() no comparte su ngspice
+        self.__ngspice          = None
+        self.__simulator        = None
+        self.__sessionWidths    = None      # Los anchos que tiene el netlist en ngspice
+        self.__commands         = 0
+
+        # Los tiempos de cada fase (ver phase_timer.PHASES)
+        self.__timer            = phase_timer.PhaseTimer()
+
+    def get_tech(self):
+        return self.__tech
+
+    def get_put(self):
+        return self.__put
+
+    def get_step_time(self):
+        return self.__step_time
+
+    def uses_session(self):
+        return self.__session
+
+    def uses_meas(self):
+        return self.__meas
+
+    def get_measures(self):
+        return self.__measures
+
+    def uses_early_stop(self):
+        return self.__early_stop
+
+    def get_copies(self):
+        return len(self.__puts)
+
+    # El PhaseTimer con los tiempos de las fases de todas las simulaciones
+    # (los SimPool le añaden los de sus procesos)
+    def get_timer(self):
+        return self.__timer
+
+    # Los argumentos opcionales para crear un TpSim igual (e.g. en otro proceso)
+    def get_options(self):
+        return {'session':      self.__session,
+                'meas':         self.__meas,
+                'measures':     self.__measures,
+                'early_stop':   self.__early_stop,
+                'probes':       self.__probes,
+                'copies':       len(self.__puts),
+                'spice_options': self.__spice_options}
+
+    # El tiempo cuando la entrada cruza VDD/2 (el comienzo del Tp)
+    def get_in_cross_time(self):
+        return self.IN_DELAY + (self.IN_RISE / 2)
+
+    # Ejecuta una simulación transitoria con los anchos actuales de la ruta
+    # y devuelve el analysis de PySpice. Nunca termina temprano, así
+    # podemos plotear toda la simulación.
+    def simulate(self, sim_time):
+        return self.__run(sim_time, early_stop=False).to_analysis()
+
+    # Pone los anchos en la ruta, simula y devuelve el Tp
+    # o -1 si la duración de simulación no estuvo suficiente largo
+    def get_tp(self, widths, sim_time):
+        with self.__timer.phase('set_widths'):
+            self.__put.set_widths(widths)
+        plot = self.__run(sim_time)
+
+        with self.__timer.phase('get_tp'):
+            if (self.__meas):
+                tp = self.__get_measure(plot, 'tp')
+                return -1 if (tp == None) else tp
+
+            return self.__get_tp(plot)
+
+    # Los Tps de una lista de anchos. Simula get_copies() candidatos con cada
+    # tran. Si en el último tran sobran copias, simulan con los anchos que
+    # ya tenían y no miramos sus resultados.
+    def get_tps(self, widthsList, sim_time):
+        tps = []
+        for start in range(0, len(widthsList), len(self.__puts)):
+            chunk = widthsList[start:start + len(self.__puts)]
+            with self.__timer.phase('set_widths'):
+                for (put, widths) in zip(self.__puts, chunk):
+                    put.set_widths(widths)
+
+            plot = self.__run(sim_time)
+            with self.__timer.phase('get_tp'):
+                for k in range(len(chunk)):
+                    if (self.__meas):
+                        tp = self.__get_measure(plot, self.__prefixes[k] + 'tp')
+                        tps.append(-1 if (tp == None) else tp)
+                    else:
+                        tps.append(self.__get_tp(plot, self.__prefixes[k]))
+        return tps
+
+    # Igual que get_tp pero siempre buscando las transiciones en las formas
+    # de onda. Sirve para depurar y comparar con el resultado de .meas
+    def get_tp_waveform(self, widths, sim_time):
+        self.__put.set_widths(widths)
+        return self.__get_tp(self.__run(sim_time))
+
+    # Pone los anchos en la ruta, simula y devuelve las formas de onda de los
+    # probes como un dict de nombre: array de numpy, más 'time'.
+    # Los arrays son los mismos que tiene el plot de PySpice (sin copiar y sin
+    # unidades). Con probes = None devuelve todos los vectores del plot.
+    def get_waveforms(self, widths, sim_time):
+        self.__put.set_widths(widths)
+        plot = self.__run(sim_time)
+
+        if (self.__probes == None):
+            return {name: vector._data.real for (name, vector) in plot.items()}
+
+        waveforms = {'time': self.__get_waveform(plot, 'time')}
+        for node in self.__probes:
+            waveforms[node] = self.__get_waveform(plot, node)
+        return waveforms
+
+    # Pone los anchos en la ruta, simula y devuelve un dict con todas las
+    # mediciones de measures (None para las que no se pudieron medir)
+    # Solo con meas = True
+    def get_measurements(self, widths, sim_time):
+        if (not self.__meas):
+            raise ValueError("TpSim was created without meas")
+
+        self.__put.set_widths(widths)
+        plot = self.__run(sim_time)
+        return {name: self.__get_measure(plot, name) for name in self.__measures}
+
+    # =========================================================================
+    # Simulación
+    # =========================================================================
+
+    def __get_simulator(self):
+        if (self.__simulator == None):
+            with self.__timer.phase('simulator'):
+                self.__create_simulator()
+        return self.__simulator
+
+    def __create_simulator(self):
+        self.__ngspice = NgSpiceShared.new_instance()
+        self.__simulator = self.__circuit.simulator(temperature=27, nominal_temperature=27,
+                                                    simulator='ngspice-shared',
+                                                    ngspice_shared=self.__ngspice)
+        if (self.__spice_options != None):
+            # .options reltol = ...
+            self.__simulator.options(**self.__spice_options)
+        if (self.__probes != None):
+            # .save in out ...
+            self.__simulator.save(list(self.__probes))
+        if (self.__meas):
+            self.__add_measures(self.__simulator)
+
+    # .meas tran TRIG / TARG. Los nodos en ngspice están en minúsculas
+    def __add_measures(self, simulator):
+        half = self.__tech.VDD / 2
+
+        # El flanco de out que sigue al flanco ascendente de in
+        outAfterRise = 'FALL' if self.__put.inverts() else 'RISE'
+
+        # Cada copia tiene sus mediciones con su prefijo (e.g. b1_tp)
+        def meas(name, inEdge, outEdge):
+            for prefix in self.__prefixes:
+                simulator.measure('TRAN', prefix + name,
+                                  'TRIG v(%sin) VAL=%g %s=1' % (prefix, half, inEdge),
+                                  'TARG v(%sout) VAL=%g %s=1' % (prefix, half, outEdge))
+
+        # nombre: (flanco de in, flanco de out)
+        if (self.__put.inverts()):
+            edges = {'tp':      ('RISE', outAfterRise),
+                     'tphl':    ('RISE', 'FALL'),
+                     'tplh':    ('FALL', 'RISE')}
+        else:
+            edges = {'tp':      ('RISE', outAfterRise),
+                     'tplh':    ('RISE', 'RISE'),
+                     'tphl':    ('FALL', 'FALL')}
+
+        for name in self.__measures:
+            meas(name, *edges[name])
+
+    def __get_measure(self, plot, name):
+        vector = plot.get(name)
+        if ((vector is None) or (len(vector._data) == 0)):
+            return None
+        value = float(vector._data[0].real)
+        self.__logger.debug("%s: %e", name, value)
+        return value
+
+    def __exec(self, command):
+        self.__commands += 1
+        if (self.__commands >= _COMMANDS_TO_RELEASE_MEMORY):
+            # ngSpice_Command(NULL) limpia las estructuras de control de ngspice
+            self.__ngspice._ngspice_shared.ngSpice_Command(ffi.NULL)
+            self.__commands = 0
+        return self.__ngspice.exec_command(command)
+
+    # Carga el netlist en ngspice (solo el netlist, sin análisis)
+    def __load(self):
+        global _session_owner
+
+        self.__logger.debug("Loading netlist into ngspice for %s", self.__put.name())
+        if (self.__session and (_session_owner != None)):
+            # Hay otro netlist cargado, quitarlo para no usar más memoria
+            self.__ngspice.remove_circuit()
+        with self.__timer.phase('netlist'):
+            netlist = str(self.__simulator)
+        with self.__timer.phase('load'):
+            self.__ngspice.destroy()
+            self.__ngspice.load_circuit(netlist)
+        self.__sessionWidths = [list(put.get_widths()) for put in self.__puts]
+        _session_owner = self if self.__session else None
+
+    # Ejecuta el tran y devuelve el plot de ngspice (un dict de Vectors)
+    def __run(self, sim_time, early_stop=None):
+        self.__get_simulator()
+
+        if (early_stop == None):
+            early_stop = self.__early_stop
+
+        if (not self.__session):
+            # Netlist nuevo cada vez
+            self.__load()
+        elif (_session_owner is not self):
+            self.__load()
+        else:
+            # Solo cambiamos los anchos de las compuertas que cambiaron
+            with self.__timer.phase('netlist'):
+                for (k, put) in enumerate(self.__puts):
+                    widths = list(put.get_widths())
+                    for (device, params) in put.get_alterations(widths, self.__sessionWidths[k]):
+                        for (param, value) in params.items():
+                            self.__exec("alter %s %s = %e" % (device, param, value))
+                    self.__sessionWidths[k] = widths
+
+        if (early_stop):
+            # Un breakpoint: parar el tran en el primer punto después de que
+            # out cruza VDD/2. out comienza en el otro nivel, así no es
+            # verdad al comienzo.
+            self.__exec("stop when v(out) %s %g" % ('<' if self.__put.inverts() else '>',
+                                                    self.__tech.VDD / 2))
+
+        with self.__timer.phase('transient'):
+            try:
+                self.__exec("tran %e %e" % (self.__step_time, sim_time))
+            except NgSpiceCommandError:
+                # ngspice marca un error cuando una medición falla (e.g. la
+                # salida no transiciona antes de sim_time), pero el plot existe
+                self.__logger.debug("ngspice reported an error, probably a failed measurement")
+
+        if (early_stop):
+            # Borrar el breakpoint para la próxima simulación
+            self.__exec("delete all")
+
+        with self.__timer.phase('transfer'):
+            plot_name = self.__ngspice.last_plot
+            if (plot_name == 'const'):
+                raise NameError('Simulation failed')
+            plot = self.__ngspice.plot(self.__simulator, plot_name)
+
+            # Liberar los resultados, si no la memoria de ngspice crece con cada
+            # simulación. plot tiene su propia copia de los datos.
+            self.__ngspice.destroy()
+
+        return plot
+
+    # Los datos de un vector del plot como array de numpy (sin unidades)
+    # ngspice puede llamar los nodos "out" o "V(out)"
+    def __get_waveform(self, plot, node):
+        for name in (node, 'v(' + node + ')', 'V(' + node + ')'):
+            if (name in plot):
+                return plot[name]._data.real
+        raise KeyError("Vector %s not in plot %s" % (node, plot.plot_name))
+
+    # prefix - el de la copia (ver copies)
+    def __get_tp(self, plot, prefix=''):
+        tech    = self.__tech
+        logger  = self.__logger
+        half    = tech.VDD / 2
+
+        t       = self.__get_waveform(plot, 'time')
+        vIn     = self.__get_waveform(plot, prefix + 'in')
+        vOut    = self.__get_waveform(plot, prefix + 'out')
+
+        # ===============
+        # Encontrar el Tp
+        # ===============
+
+        # Primero encontrar la transición de la entrada
+        in_rises = crossings.find_crossing(t, vIn, half, crossings.RISE)
+        if (in_rises == None):
+            return -1
+        logger.debug("In rises past 50%% at %.2fps", in_rises * 1e12)
+
+        # Después encontrar la trasición de la salida
+        # la salida será un flanco ascendente o descendente?
+        outDirection = crossings.FALL if self.__put.inverts() else crossings.RISE
+        out_transitions = crossings.find_crossing(t, vOut, half, outDirection, t_min=in_rises)
+
+        # =====================
+        # Devolver el resultado
+        # =====================
+        if (out_transitions == None):
+            # La duración de simulación no estuvo suficiente largo
+            return -1
+
+        logger.debug("Out %s past 50%% at %.2fps", "falls" if self.__put.inverts() else "rises", out_transitions * 1e12)
+        return out_transitions - in_rises
+
+# =============================================================================
+# Benchmark de copies: cuantos candidatos por segundo simulamos con cada
+# número de copias de la ruta en el netlist
+#
+#   sizes           - Los números de copias que probamos
+#   num_candidates  - Los candidatos (aleatorios, los mismos para todos)
+#   sim_time        - La duración de cada tran
+#   options         - Los argumentos opcionales de TpSim (e.g. session, meas)
+#
+# Devuelve una lista de (copies, candidatos por segundo)
+# =============================================================================
+def benchmark_copies(tech, put, step_time, logger, sizes=(1, 2, 4, 8, 16), num_candidates=64,
+                     sim_time=500e-12, seed=None, **options):
+    rng = random.Random(seed)
+    candidates = None
+    results = []
+
+    for copies in sizes:
+        # Una ruta nueva para cada TpSim
+        (rebuild, args) = put.__reduce__()
+        sim = TpSim(tech, rebuild(*args), step_time, logger, copies=copies, **options)
+
+        if (candidates == None):
+            numWidths = len(sim.get_put().get_widths())
+            candidates = [[tech.W_MIN] + [rng.uniform(tech.W_MIN, put.get_max_width()) for i in range(numWidths - 1)]
+                          for j in range(num_candidates)]
+
+        ts = time.time()
+        sim.get_tps(candidates, sim_time)
+        te = time.time()
+
+        rate = num_candidates / (te - ts)
+        results.append((copies, rate))
+        logger.info("Copies %3d: %d candidates in %.2fs, %.1f candidates/s",
+                    copies, num_candidates, te - ts, rate)
+
+    (bestCopies, bestRate) = max(results, key=lambda r: r[1])
+    logger.info("Best batch size for %s: %d copies (%.1f candidates/s, %.1fx over 1 copy)",
+                put.name(), bestCopies, bestRate, bestRate / results[0][1] if (sizes[0] == 1) else 1.0)
+    return results
@@ -37,14 +37,63 @@ class Compuerta(SubCircuitFactory):
     __nodes__ = None
 
     __num_inputs = 0
+    __transistors = []
 
     def __init__(self, num_inputs, **kwargs):
         super().__init__(W=W_MIN, L=L_MIN, LD=LD_MIN, **kwargs)
         self.__num_inputs = num_inputs
+        self.__transistors = []     # lista de (nombre, wMult, drainNode, gateNode)
 
     def get_num_inputs(self):
         return self.__num_inputs
 
+    """ get_logical_effort:
+            El esfuerzo lógico g de la primera entrada: la capacitancia de la
+            entrada (la suma de los anchos de los transistores conectados a
+            ella) dividida por la de un inversor con el mismo W.
+            Para el inversor g = 1.
+    """
+    def get_logical_effort(self):
+        inNode = self.__nodes__[1]
+        cIn = sum(wMult for (name, wMult, drainNode, gateNode) in self.__transistors if (gateNode == inNode))
+        return cIn / (1 + WPFACT)
+
+    """ get_parasitic_delay:
+            El retardo parásito p (en unidades de tau): la capacitancia de
+            difusión en la salida dividida por la de un inversor con el
+            mismo W. Para el inversor p = 1.
+    """
+    def get_parasitic_delay(self):
+        cOut = sum(wMult for (name, wMult, drainNode, gateNode) in self.__transistors if (drainNode == 'Out'))
+        return cOut / (1 + WPFACT)
+
+    """ get_alterations:
+            Devuelve los parámetros de cada transistor de una instancia de
+            esta compuerta con el ancho w. Con esto podemos cambiar el ancho
+            de una instancia en un ngspice que ya tiene el netlist cargado
+            (con el comando alter), sin generar y parsear el netlist otra vez.
+
+            Cuando ngspice aplana los subcircuitos el transistor M1 de la
+            instancia XInv0 se llama m.xinv0.m1
+
+            argumentos:
+                instanceName    - el nombre de la instancia en el netlist
+                                  (e.g. "XInv0")
+                w               - el ancho nuevo
+
+            devuelve una lista de (dispositivo, {parámetro: valor})
+            Los valores son los mismos que calcula create_transistor.
+    """
+    def get_alterations(self, instanceName, w):
+        alterations = []
+        for (name, wMult, drainNode, gateNode) in self.__transistors:
+            device = ("m." + instanceName + ".m" + str(name)).lower()
+            width = w * wMult
+            area = width * LD_MIN
+            perim = width + (2 * LD_MIN)
+            alterations.append((device, {'w': width, 'ad': area, 'as': area, 'pd': perim, 'ps': perim}))
+        return alterations
+
     """ create_transistor:
             Todos los llamadas de create_transistor deben ser antes
             de que el subcircuito es añadido al circuito con una llamada a
@@ -89,6 +138,9 @@ class Compuerta(SubCircuitFactory):
         # dos veces el largo de difusión: (W * wMult) + (2 * LD)
         perim = "{(W * " + str(wMult) + ") + (2 * LD)}"
 
+        # Guardamos el transistor para get_alterations
+        self.__transistors.append((name, wMult, drainNode, gateNode))
+
         self.M(name,
                drainNode,
                gateNode,
@@ -1,5 +1,7 @@
 import argparse
+import cProfile
 import logging, verboselogs
+import pstats
 import sys
 
 from tech   import TSMC180              as tech     # Tecnologia que queremos usar
@@ -7,11 +9,21 @@ from tech   import TSMC180              as tech     # Tecnologia que queremos us
 # Rutas
 from paths  import inversor_chain_path  as icp
 from paths  import nand_chain_path      as ncp
+from paths  import path_spec                        # Las descripciones de rutas
+from paths  import spec_path            as sp
 
 # Simulaciones
 from sims   import monte_carlo_sim      as mcs      # El código que hace la simulación Monte Carlo
 from sims   import gate_test            as gt       # El código que hace pruebas de compuertas
 from sims   import path_test            as pt       # El código que hace pruebas de rutas
+from sims   import optimizers                       # Las estrategias de MCS
+from sims   import tp_sim                           # Para el benchmark de batch
+from sims   import benchmark                        # El benchmark de MCS
+from sims   import characterize                     # tau, p y g de la tecnologia
+from sims   import nldm                             # Tablas de retardo / slew de las compuertas
+from sims   import sta                              # Análisis de tiempo estático
+from sims   import sensitivity                      # Sensibilidad del Tp a cada ancho
+from sims   import logic_check                      # Los métodos de GT y PT
 
 def inverter_chain(len, load):
     return icp.InversorChainPath(tech, len, load)
@@ -19,6 +31,9 @@ def inverter_chain(len, load):
 def nand_chain(len, load):
     return ncp.NandChainPath(tech, len, load)
 
+def spec_path(spec, load):
+    return sp.SpecPath(tech, spec, load)
+
 def inverter():
     return tech.Inversor()
 
@@ -36,6 +51,12 @@ PATHS = {
             'nand_chain_5'      : (nand_chain,     5)
         }
 
+# Las rutas de los archivos de paths/specs (ver path_spec), no reemplazan a las de arriba.
+# Los archivos que no sirven no se registran, main avisa con SPEC_ERRORS.
+SPEC_ERRORS = []
+for (name, spec) in path_spec.load_spec_dir(errors=SPEC_ERRORS).items():
+    PATHS.setdefault(name, (spec_path, spec))
+
 GATES = {
             'inverter'          : inverter,
             'NAND'              : nand,
@@ -49,24 +70,251 @@ def do_mcs(args, logger):
     load        = args.load
     plot_result = args.plot_result
     cvs         = args.cvs
+    results     = args.results
+    cache       = args.cache
+    cache_grid  = args.cache_grid
+    cache_size  = args.cache_size
+    cache_file  = args.cache_file
+    optimizer   = args.optimizer
+    surrogate_file = args.surrogate_file
+    batch       = args.batch
+    coarse_step = args.coarse_step
+    fine_margin = args.fine_margin
+    fine_top_k  = args.fine_top_k
+    checkpoint  = args.checkpoint
+    checkpoint_every = args.checkpoint_every
+    resume      = args.resume
+    time_budget = args.time_budget
+    patience    = args.patience
+    patience_epsilon = args.patience_epsilon
+    target_tp   = args.target_tp
+    timing      = args.timing
+    double_sim_time = args.double_sim_time
+    le_margin   = args.le_margin
+    le_audit    = args.le_audit
+    workers     = args.workers
+    seed        = args.seed
+    session     = args.session
+    meas        = args.meas
+    early_stop  = args.early_stop
+    stop_margin = args.stop_margin
+
+    func, len = PATHS[path]
+    put = func(len, load)
+    mcs.do_monte_carlo_sim(tech, put, step_time, num_sims, plot_result, cvs, logger,
+                           workers=workers, seed=seed, session=session, meas=meas,
+                           early_stop=early_stop, stop_margin=stop_margin, results_file=results,
+                           cache=cache, cache_grid=cache_grid, cache_size=cache_size, cache_file=cache_file,
+                           optimizer=optimizer, le_margin=le_margin, le_audit=le_audit,
+                           surrogate_file=surrogate_file, batch=batch,
+                           coarse_step=coarse_step, fine_margin=fine_margin, fine_top_k=fine_top_k,
+                           checkpoint_file=checkpoint, checkpoint_every=checkpoint_every, resume=resume,
+                           time_budget=time_budget, patience=patience, patience_epsilon=patience_epsilon,
+                           target_tp=target_tp, timing_file=timing, double_sim_time=double_sim_time)
+
+def do_opt(args, logger):
+    step_time   = args.step_time
+    num_sims    = args.num_sims
+    paths       = args.paths
+    load        = args.load
+    workers     = args.workers
+    seed        = args.seed
+    names       = args.optimizers
+    curve       = args.curve
+    surrogate_file = args.surrogate_file
+    time_budget = args.time_budget
+    patience    = args.patience
+    patience_epsilon = args.patience_epsilon
+    target_tp   = args.target_tp
+
+    puts = []
+    for path in paths:
+        func, len = PATHS[path]
+        puts.append(func(len, load))
+    mcs.compare_optimizers(tech, puts, step_time, num_sims, names, logger, curve=curve,
+                           workers=workers, seed=seed, surrogate_file=surrogate_file,
+                           time_budget=time_budget, patience=patience, patience_epsilon=patience_epsilon,
+                           target_tp=target_tp)
+
+def do_batch(args, logger):
+    step_time   = args.step_time
+    path        = args.path
+    load        = args.load
+    sizes       = args.sizes
+    num         = args.num
+    sim_time    = args.sim_time
+    session     = args.session
+    meas        = args.meas
+    seed        = args.seed
+
+    func, len = PATHS[path]
+    put = func(len, load)
+    tp_sim.benchmark_copies(tech, put, step_time, logger, sizes=sizes, num_candidates=num,
+                            sim_time=sim_time, seed=seed, session=session, meas=meas)
+
+def do_bench(args, logger):
+    paths       = args.paths
+    step_times  = args.step_times
+    loads       = args.loads
+    num_sims    = args.num_sims
+    repeats     = args.repeats
+    seed        = args.seed
+    workers     = args.workers
+    output      = args.output
+    baseline    = args.baseline
+    tolerance   = args.tolerance
+    tp_tolerance = args.tp_tolerance
+
+    # Leer la referencia antes de simular, para no perder el tiempo si no se puede
+    baselineResults = None
+    if (baseline != None):
+        baselineResults = benchmark.load_results(baseline, logger)
+        if (baselineResults == None):
+            sys.exit(2)
+
+    puts = [lambda load, func=PATHS[path][0], len=PATHS[path][1]: func(len, load) for path in paths]
+    results = benchmark.run_benchmark(tech, puts, step_times, loads, num_sims, repeats, seed, logger,
+                                      output=output, workers=workers)
+
+    if (baselineResults != None):
+        regressions = benchmark.compare_results(results, baselineResults, logger, tolerance, tp_tolerance)
+        if (len(regressions) > 0):
+            sys.exit(1)
+
+# Las cadenas de SCALE, por largo (ver benchmark.run_scaling)
+CHAINS = {
+            'inverter'          : inverter_chain,
+            'nand'              : nand_chain
+         }
+
+def do_scale(args, logger):
+    chain       = args.chain
+    lengths     = args.lengths
+    load        = args.load
+    step_time   = args.step_time
+    num_sims    = args.num_sims
+    names       = args.optimizers
+    seed        = args.seed
+    workers     = args.workers
+    session     = args.session
+    patience    = args.patience
+    output      = args.output
+
+    # Las rutas largas necesitan simulaciones de muchos ns (ver double_sim_time)
+    benchmark.run_scaling(tech, CHAINS[chain], lengths, load, step_time, num_sims, names, seed, logger,
+                          output=output, workers=workers, session=session, patience=patience,
+                          double_sim_time=True)
+
+def do_sens(args, logger):
+    step_time   = args.step_time
+    path        = args.path
+    load        = args.load
+    widths      = args.widths
+    step        = args.step
+    method      = args.method
+    workers     = args.workers
+    batch       = args.batch
+    session     = args.session
+    meas        = args.meas
+
+    func, len = PATHS[path]
+    put = func(len, load)
+    if (widths != None):
+        widths = [w * tech.W_MIN for w in widths]
+    sensitivity.do_sensitivity(tech, put, step_time, logger, widths=widths, step=step, method=method,
+                               workers=workers, session=session, meas=meas, batch=batch)
+
+def do_char(args, logger):
+    workers     = args.workers
+    fanouts     = args.fanouts
+    ring_stages = args.ring_stages
+    step_time   = args.step_time
+    force       = args.force
+
+    results = characterize.characterize(tech, logger, workers=workers, fanouts=fanouts,
+                                        ring_stages=ring_stages, step_time=step_time, force=force)
+    if (results != None):
+        characterize.log_characterization(results, logger)
+
+def do_nldm(args, logger):
+    workers     = args.workers
+    slews       = args.slews
+    loads       = args.loads
+    step_time   = args.step_time
+    force       = args.force
+    path        = args.path
+    load        = args.load
+
+    if ((len(set(slews)) < 2) or (len(set(loads)) < 2)):
+        logger.error("--slews and --loads need at least 2 different values")
+        return
+
+    library = nldm.build_tables(tech, logger, workers=workers, slews=[s * 1e-12 for s in slews],
+                                loads=loads, step_time=step_time, force=force)
+    if (library == None):
+        return
+    nldm.log_tables(library, logger)
+
+    if (path != None):
+        func, len = PATHS[path]
+        nldm.log_path_estimate(library, func(len, load), logger)
+
+def do_sta(args, logger):
+    path        = args.path
+    load        = args.load
+    model       = args.model
 
     func, len = PATHS[path]
     put = func(len, load)
-    mcs.do_monte_carlo_sim(tech, put, step_time, num_sims, plot_result, cvs, logger)
+
+    if (model == 'nldm'):
+        library = nldm.get_library(tech)
+        if (library == None):
+            logger.error("No NLDM tables for %s, run the NLDM command first", tech.NAME)
+            return
+        delayModel = sta.NLDMModel(library)
+    else:
+        delayModel = sta.LogicalEffortModel(tech)
+
+    widths = put.get_logical_effort_optimal_widths()
+    effort = put.get_path_effort()
+    logger.info("%s, load %g: G %.3f, B %.3f, H %.3f, F %.2f, f_opt %.3f, P %.2f", put.name(), load,
+                effort['G'], effort['B'], effort['H'], effort['F'], effort['f_opt'], effort['P'])
+    logger.info("Logical effort optimal widths (W_MIN): %s", " ".join("%.3f" % (w / tech.W_MIN) for w in widths))
+    put.get_timing_graph(widths, delayModel).log_critical_path(logger)
 
 def do_gt(args, logger):
-    gate = args.gate
+    gate    = args.gate
+    method  = args.method
+    period  = args.period
+    workers = args.workers
 
     gut = GATES[gate]()
-    gt.do_gate_test(tech, gut)
+    gt.do_gate_test(tech, gut, method=method, period=period, workers=workers)
 
 def do_pt(args, logger):
-    path = args.path
-    load = args.load
+    path    = args.path
+    load    = args.load
+    method  = args.method
+    period  = args.period
+    workers = args.workers
 
     func, len = PATHS[path]
     put = func(len, load)
-    pt.do_path_test(tech, put)
+    pt.do_path_test(tech, put, method=method, period=period, workers=workers)
+
+# Los argumentos de GT y PT
+def add_logic_test_arguments(parser):
+    parser.add_argument('--method', choices=logic_check.METHODS, default=logic_check.OP,
+                        help='op: one operating point simulation per input combination, dc: one DC '
+                             'sweep per 4 combinations, tran: every combination in one PWL-driven '
+                             'transient, auto: dc with up to 2 inputs, tran otherwise (default: op)')
+    parser.add_argument('--period', metavar='TIME', type=float, default=logic_check.DEFAULT_PERIOD,
+                        help='Time each input combination is applied with --method tran; the output '
+                             'is sampled at %d%%%% of it (default: %.0e)' %
+                             (100 * logic_check.SAMPLE_AT, logic_check.DEFAULT_PERIOD))
+    parser.add_argument('--workers', metavar='N', type=workers_type, default=1,
+                        help='Split the input combinations across N worker processes (default: 1)')
 
 # ====================
 # Parseo de argumentos
@@ -78,11 +326,38 @@ def load_type(load):
         raise argparse.ArgumentTypeError("Minimum load is 1.0")
     return load
 
+def workers_type(workers):
+    workers = int(workers)
+    if workers < 1:
+        raise argparse.ArgumentTypeError("Minimum workers is 1")
+    return workers
+
+# Un entero con un mínimo, name es el argumento para el mensaje de error
+def min_int_type(name, minimum=1):
+    def int_type(value):
+        value = int(value)
+        if value < minimum:
+            raise argparse.ArgumentTypeError("Minimum %s is %d" % (name, minimum))
+        return value
+    int_type.__name__ = name
+    return int_type
+
+# Un anillo oscilador necesita un número impar de compuertas, al menos 3
+def ring_stages_type(stages):
+    stages = int(stages)
+    if (stages < 3) or (stages % 2 == 0):
+        raise argparse.ArgumentTypeError("Ring stages must be odd and at least 3")
+    return stages
+
 
 def main():
     parser = argparse.ArgumentParser(description='Run tests / simulation using TSMC180 tech')
     subparsers = parser.add_subparsers(title='Commands', metavar='CMD', required=True)
 
+    parser.add_argument('--profile', metavar='FILE', default=None,
+                        help='Run the command under cProfile and dump the stats to FILE '
+                             '(open with python -m pstats FILE)')
+
     verbosityGroup = parser.add_mutually_exclusive_group()
     verbosityGroup.add_argument('-v', dest='verbose', action='store_true', default=False,
                                 help='Output debug information')
@@ -96,27 +371,304 @@ def main():
                            help='Max time step for transient simulation (default: 1e-13)')
     parserMCS.add_argument('--num_sims', type=int, default=10000,
                            help='Number of simulation to run (default: 10000)')
+    parserMCS.add_argument('--time_budget', metavar='SECONDS', type=float, default=None,
+                           help='Stop after SECONDS of wall-clock time, checked after each round '
+                                '(default: no limit)')
+    parserMCS.add_argument('--patience', metavar='N', type=min_int_type('patience'), default=None,
+                           help='Stop after N simulations without improving the best Tp by more than '
+                                '--patience_epsilon (default: never)')
+    parserMCS.add_argument('--patience_epsilon', metavar='EPS', type=float, default=0.001,
+                           help='Relative improvement that resets --patience (default: 0.001)')
+    parserMCS.add_argument('--target_tp', metavar='TIME', type=float, default=None,
+                           help='Stop as soon as the best Tp is <= TIME (default: never)')
+    parserMCS.add_argument('--timing', metavar='FILE', default=None,
+                           help='Stream the per-phase simulation times of each round to FILE as '
+                                'JSON lines (the per-phase report at the end is always shown)')
+    parserMCS.add_argument('--double_sim_time', action='store_true', default=False,
+                           help='While the output never transitions, double the simulation time increase '
+                                'every time instead of adding 100ps. Useful for long paths')
     parserMCS.add_argument('--load', metavar='LOAD', type=load_type, required=True,
                            help='The load is an inversor of width LOAD * W_MIN')
     parserMCS.add_argument('-p', '--plot', dest='plot_result', action='store_true', default=False,
                            help='Plot the results of the transient sim of the best case')
     parserMCS.add_argument('--cvs', metavar='FILE',
                            help='Write results to a .cvs file on completion')
+    parserMCS.add_argument('--results', metavar='FILE',
+                           help='Write results to a binary .npy file on completion (tp, widths, '
+                                'total width and ratios as typed columns, see '
+                                'sims.result_store.load_results)')
+    parserMCS.add_argument('--workers', metavar='N', type=workers_type, default=1,
+                           help='Number of worker processes to run simulations in parallel (default: 1)')
+    parserMCS.add_argument('--seed', type=int, default=None,
+                           help='Seed for the random number generator. A run is reproducible '
+                                'for a given seed and number of workers (default: system time)')
+    parserMCS.add_argument('--session', action='store_true', default=False,
+                           help='Load the netlist into ngspice once and only alter the transistor '
+                                'widths for each simulation, instead of creating a new simulator '
+                                'every time')
+    parserMCS.add_argument('--meas', action='store_true', default=False,
+                           help='Let ngspice calculate Tp with .meas statements instead of '
+                                'fetching the waveforms and searching them in python')
+    parserMCS.add_argument('--early_stop', action='store_true', default=False,
+                           help='Stop each transient as soon as the output crosses VDD/2, and '
+                                'never simulate past the best Tp * MARGIN')
+    parserMCS.add_argument('--stop_margin', metavar='MARGIN', type=float, default=1.1,
+                           help='Margin over the best Tp used with --early_stop (default: 1.1)')
+    parserMCS.add_argument('--cache', action='store_true', default=False,
+                           help='Don\'t simulate candidates whose widths (snapped to the cache '
+                                'grid) were already simulated')
+    parserMCS.add_argument('--cache_grid', metavar='GRID', type=float, default=1e-9,
+                           help='Grid the widths are snapped to for the cache (default: 1e-9)')
+    parserMCS.add_argument('--cache_size', metavar='N', type=int, default=100000,
+                           help='Max number of entries kept in the cache (default: 100000)')
+    parserMCS.add_argument('--cache_file', metavar='FILE',
+                           help='Load the cache from FILE and save it back at the end, to share '
+                                'it between runs (implies --cache)')
+    parserMCS.add_argument('--optimizer', metavar='NAME', choices=optimizers.OPTIMIZERS, default='random',
+                           help='Strategy used to generate the candidates: (%(choices)s). '
+                                'random is the original random perturbation of the best widths, '
+                                'gradient is meant for long paths (default: random)')
+    parserMCS.add_argument('--batch', metavar='N', type=min_int_type('batch'), default=1,
+                           help='Put N copies of the path in the netlist and simulate N candidates '
+                                'with every transient. Doesn\'t work with --early_stop (default: 1)')
+    parserMCS.add_argument('--coarse_step', metavar='TIME', type=float, default=None,
+                           help='Simulate every candidate first with this max time step and relaxed '
+                                'tolerances, and only the promising ones again with --step_time. '
+                                'The best result and the logical effort run always use --step_time '
+                                '(default: only use --step_time)')
+    parserMCS.add_argument('--fine_margin', metavar='MARGIN', type=float, default=0.02,
+                           help='With --coarse_step, re-simulate the candidates within MARGIN of the '
+                                'best Tp (default: 0.02)')
+    parserMCS.add_argument('--fine_top_k', metavar='K', type=min_int_type('fine_top_k'), default=None,
+                           help='With --coarse_step, re-simulate at most the K best candidates of '
+                                'each round (default: all within --fine_margin)')
+    parserMCS.add_argument('--surrogate_file', metavar='FILE',
+                           help='Samples file for the surrogate optimizer: samples of the same path '
+                                'with a nearby load warm-start the model, and the new samples are '
+                                'added at the end')
+    parserMCS.add_argument('--checkpoint', metavar='FILE', default=None,
+                           help='Save the run state to FILE every --checkpoint_every simulations and '
+                                'at the end, so it can be continued with --resume')
+    parserMCS.add_argument('--checkpoint_every', metavar='N', type=min_int_type('checkpoint_every'), default=1000,
+                           help='Simulations between checkpoints (default: 1000)')
+    parserMCS.add_argument('--resume', metavar='FILE', default=None,
+                           help='Continue the run saved in checkpoint FILE. The other options must '
+                                'be the same except --num_sims, which can be larger. The result is '
+                                'the same as an uninterrupted run. Keeps checkpointing to FILE '
+                                'unless --checkpoint is given')
+    parserMCS.add_argument('--le_margin', metavar='MARGIN', type=float, default=None,
+                           help='Don\'t simulate candidates whose logical effort delay estimate is '
+                                'more than MARGIN (e.g. 0.05) worse than the best\'s. Pruned '
+                                'candidates count towards --num_sims (default: simulate all)')
+    parserMCS.add_argument('--le_audit', metavar='FRACTION', type=float, default=0.0,
+                           help='Fraction of the pruned candidates that are simulated anyway to '
+                                'measure how often the prefilter discards an improvement (default: 0)')
     parserMCS.add_argument('path', metavar='PATH', choices=PATHS,
                            help='Path to simulate: (%(choices)s)')
     parserMCS.set_defaults(func=do_mcs)
 
+    parserOPT = subparsers.add_parser('OPT', help='Compare the MCS optimizers')
+    parserOPT.add_argument('--step_time', metavar='TIME', type=float, default=1e-13,
+                           help='Max time step for transient simulation (default: 1e-13)')
+    parserOPT.add_argument('--num_sims', type=int, default=10000,
+                           help='Max number of simulation to run with each optimizer (default: 10000)')
+    parserOPT.add_argument('--time_budget', metavar='SECONDS', type=float, default=None,
+                           help='Wall-clock budget of each optimizer run (default: no limit)')
+    parserOPT.add_argument('--patience', metavar='N', type=min_int_type('patience'), default=None,
+                           help='Stop each run after N simulations without improvement (see MCS) '
+                                '(default: never)')
+    parserOPT.add_argument('--patience_epsilon', metavar='EPS', type=float, default=0.001,
+                           help='Relative improvement that resets --patience (default: 0.001)')
+    parserOPT.add_argument('--target_tp', metavar='TIME', type=float, default=None,
+                           help='Stop each run as soon as the best Tp is <= TIME (default: never)')
+    parserOPT.add_argument('--load', metavar='LOAD', type=load_type, required=True,
+                           help='The load is an inversor of width LOAD * W_MIN')
+    parserOPT.add_argument('--workers', metavar='N', type=workers_type, default=1,
+                           help='Number of worker processes to run simulations in parallel (default: 1)')
+    parserOPT.add_argument('--seed', type=int, default=None,
+                           help='Seed for the random number generator, the same for every optimizer '
+                                '(default: system time)')
+    parserOPT.add_argument('--optimizers', metavar='NAME', nargs='+', choices=optimizers.OPTIMIZERS,
+                           default=list(optimizers.OPTIMIZERS),
+                           help='Optimizers to compare: (%(choices)s) (default: all)')
+    parserOPT.add_argument('--curve', metavar='FILE',
+                           help='Write the best Tp versus simulation count curve of every run '
+                                'to a .cvs file')
+    parserOPT.add_argument('--surrogate_file', metavar='FILE',
+                           help='Samples file for the surrogate optimizer (see MCS)')
+    parserOPT.add_argument('paths', metavar='PATH', nargs='+', choices=PATHS,
+                           help='Paths to simulate: (%(choices)s)')
+    parserOPT.set_defaults(func=do_opt)
+
+    parserBATCH = subparsers.add_parser('BATCH', help='Benchmark the number of path copies per netlist')
+    parserBATCH.add_argument('--step_time', metavar='TIME', type=float, default=1e-13,
+                             help='Max time step for transient simulation (default: 1e-13)')
+    parserBATCH.add_argument('--load', metavar='LOAD', type=load_type, required=True,
+                             help='The load is an inversor of width LOAD * W_MIN')
+    parserBATCH.add_argument('--sizes', metavar='N', type=min_int_type('sizes'), nargs='+', default=[1, 2, 4, 8, 16],
+                             help='Numbers of copies to try (default: 1 2 4 8 16)')
+    parserBATCH.add_argument('--num', metavar='N', type=min_int_type('num'), default=64,
+                             help='Number of random candidates simulated with each size (default: 64)')
+    parserBATCH.add_argument('--sim_time', metavar='TIME', type=float, default=500e-12,
+                             help='Duration of each transient (default: 500e-12)')
+    parserBATCH.add_argument('--session', action='store_true', default=False,
+                             help='Alter the widths in a loaded netlist (see MCS)')
+    parserBATCH.add_argument('--meas', action='store_true', default=False,
+                             help='Measure Tp with .meas statements (see MCS)')
+    parserBATCH.add_argument('--seed', type=int, default=None,
+                             help='Seed for the random candidates (default: system time)')
+    parserBATCH.add_argument('path', metavar='PATH', choices=PATHS,
+                             help='Path to simulate: (%(choices)s)')
+    parserBATCH.set_defaults(func=do_batch)
+
     parserGT = subparsers.add_parser('GT', help='Gate Test')
     parserGT.add_argument('gate', metavar='GATE', choices=GATES,
                           help='Gate to test: (%(choices)s)')
+    add_logic_test_arguments(parserGT)
     parserGT.set_defaults(func=do_gt)
 
+    parserBENCH = subparsers.add_parser('BENCH', help='Benchmark MCS throughput and memory, optionally '
+                                                      'against a baseline')
+    parserBENCH.add_argument('--paths', metavar='PATH', nargs='+', choices=PATHS, default=list(PATHS),
+                             help='Paths to run: (%(choices)s) (default: all)')
+    parserBENCH.add_argument('--step_times', metavar='TIME', type=float, nargs='+', default=[1e-13, 2e-13],
+                             help='Max time steps to try (default: 1e-13 2e-13)')
+    parserBENCH.add_argument('--loads', metavar='LOAD', type=load_type, nargs='+', default=[16.0, 64.0],
+                             help='Loads to try (default: 16 64)')
+    parserBENCH.add_argument('--num_sims', metavar='N', type=min_int_type('num_sims'), default=500,
+                             help='Simulations of each MCS run (default: 500)')
+    parserBENCH.add_argument('--repeats', metavar='N', type=min_int_type('repeats'), default=3,
+                             help='MCS runs of each case, with seeds SEED, SEED+1, ... (default: 3)')
+    parserBENCH.add_argument('--seed', type=int, default=1,
+                             help='Seed of the first run of each case (default: 1)')
+    parserBENCH.add_argument('--workers', metavar='N', type=workers_type, default=1,
+                             help='Worker processes of each MCS run. RSS only counts this process '
+                                  '(default: 1)')
+    parserBENCH.add_argument('--output', metavar='FILE',
+                             help='Write the results to a JSON file, which can be used as a baseline')
+    parserBENCH.add_argument('--baseline', metavar='FILE',
+                             help='Compare with the results of a previous run (see --output). Exits '
+                                  'with status 1 if there are regressions')
+    parserBENCH.add_argument('--tolerance', metavar='FRACTION', type=float, default=0.1,
+                             help='Allowed relative change of sims/s and RSS (default: 0.1)')
+    parserBENCH.add_argument('--tp_tolerance', metavar='FRACTION', type=float, default=0.01,
+                             help='Allowed relative increase of the mean best Tp (default: 0.01)')
+    parserBENCH.set_defaults(func=do_bench)
+
+    parserSENS = subparsers.add_parser('SENS', help='Sensitivity of Tp to each width (finite differences '
+                                                    'simulated in parallel)')
+    parserSENS.add_argument('--step_time', metavar='TIME', type=float, default=1e-13,
+                            help='Max time step for transient simulation (default: 1e-13)')
+    parserSENS.add_argument('--load', metavar='LOAD', type=load_type, required=True,
+                            help='The load is an inversor of width LOAD * W_MIN')
+    parserSENS.add_argument('--widths', metavar='W', type=float, nargs='+', default=None,
+                            help='Widths in units of W_MIN, one per sizable stage (default: the logical '
+                                 'effort optimal widths)')
+    parserSENS.add_argument('--step', metavar='FRACTION', type=float, default=sensitivity.DEFAULT_STEP,
+                            help='Relative change of each width (default: %.2f)' % sensitivity.DEFAULT_STEP)
+    parserSENS.add_argument('--method', choices=sensitivity.METHODS, default=sensitivity.FORWARD,
+                            help='forward: N+1 simulations, central: 2N+1 simulations and more accurate '
+                                 '(default: forward)')
+    parserSENS.add_argument('--workers', metavar='N', type=workers_type, default=1,
+                            help='Number of worker processes to run simulations in parallel (default: 1)')
+    parserSENS.add_argument('--batch', metavar='N', type=min_int_type('batch'), default=1,
+                            help='Put N copies of the path in the netlist (see MCS) (default: 1)')
+    parserSENS.add_argument('--session', action='store_true', default=False,
+                            help='Alter the widths in a loaded netlist (see MCS)')
+    parserSENS.add_argument('--meas', action='store_true', default=False,
+                            help='Measure Tp with .meas statements (see MCS)')
+    parserSENS.add_argument('path', metavar='PATH', choices=PATHS,
+                            help='Path to analyze: (%(choices)s)')
+    parserSENS.set_defaults(func=do_sens)
+
+    parserSCALE = subparsers.add_parser('SCALE', help='Measure how the MCS optimizers scale with the path '
+                                                      'length (simulations and time to converge)')
+    parserSCALE.add_argument('--chain', choices=CHAINS, default='inverter',
+                             help='Chain to size: (%(choices)s) (default: inverter)')
+    parserSCALE.add_argument('--lengths', metavar='N', type=min_int_type('lengths'), nargs='+',
+                             default=[4, 8, 16, 32, 64, 128, 256],
+                             help='Chain lengths to try (default: 4 8 16 32 64 128 256)')
+    parserSCALE.add_argument('--load', metavar='LOAD', type=load_type, default=64.0,
+                             help='The load is an inversor of width LOAD * W_MIN (default: 64)')
+    parserSCALE.add_argument('--step_time', metavar='TIME', type=float, default=1e-13,
+                             help='Max time step for transient simulation (default: 1e-13)')
+    parserSCALE.add_argument('--num_sims', metavar='N', type=min_int_type('num_sims'), default=20000,
+                             help='Max number of simulations of each run (default: 20000)')
+    parserSCALE.add_argument('--optimizers', metavar='NAME', nargs='+', choices=optimizers.OPTIMIZERS,
+                             default=['gradient', 'coordinate'],
+                             help='Optimizers to measure: (%(choices)s) (default: gradient coordinate)')
+    parserSCALE.add_argument('--seed', type=int, default=1,
+                             help='Seed of every run (default: 1)')
+    parserSCALE.add_argument('--workers', metavar='N', type=workers_type, default=1,
+                             help='Worker processes of each MCS run (default: 1)')
+    parserSCALE.add_argument('--session', action='store_true', default=False,
+                             help='Alter the widths in a loaded netlist (see MCS)')
+    parserSCALE.add_argument('--patience', metavar='N', type=min_int_type('patience'), default=None,
+                             help='Stop each run after N simulations without improvement (see MCS) '
+                                  '(default: never)')
+    parserSCALE.add_argument('--output', metavar='FILE',
+                             help='Write the results to a JSON file')
+    parserSCALE.set_defaults(func=do_scale)
+
+    parserCHAR = subparsers.add_parser('CHAR', help='Characterize tau, p and g of the tech\'s gates '
+                                                    '(logical effort)')
+    parserCHAR.add_argument('--workers', metavar='N', type=workers_type, default=None,
+                            help='Number of worker processes (default: one per CPU)')
+    parserCHAR.add_argument('--fanouts', metavar='H', type=min_int_type('fanouts'), nargs='+',
+                            default=list(characterize.DEFAULT_FANOUTS),
+                            help='Fanouts of the delay versus fanout sweeps (default: %s)' %
+                                 " ".join(str(h) for h in characterize.DEFAULT_FANOUTS))
+    parserCHAR.add_argument('--ring_stages', metavar='N', type=ring_stages_type,
+                            default=characterize.DEFAULT_RING_STAGES,
+                            help='Stages of the ring oscillators, odd (default: %d)' %
+                                 characterize.DEFAULT_RING_STAGES)
+    parserCHAR.add_argument('--step_time', metavar='TIME', type=float, default=characterize.DEFAULT_STEP_TIME,
+                            help='Max time step for transient simulation (default: %g)' %
+                                 characterize.DEFAULT_STEP_TIME)
+    parserCHAR.add_argument('--force', action='store_true', default=False,
+                            help='Simulate even if there are cached results for this .lib and WPFACT')
+    parserCHAR.set_defaults(func=do_char)
+
+    parserNLDM = subparsers.add_parser('NLDM', help='Build delay / slew lookup tables (input slew x load) '
+                                                    'for the tech\'s gates')
+    parserNLDM.add_argument('--workers', metavar='N', type=workers_type, default=None,
+                            help='Number of worker processes (default: one per CPU)')
+    parserNLDM.add_argument('--slews', metavar='PS', type=float, nargs='+',
+                            default=[s * 1e12 for s in nldm.DEFAULT_SLEWS],
+                            help='Input slews (10-90%%%%) of the grid in ps (default: %s)' %
+                                 " ".join("%g" % (s * 1e12) for s in nldm.DEFAULT_SLEWS))
+    parserNLDM.add_argument('--loads', metavar='LOAD', type=load_type, nargs='+',
+                            default=list(nldm.DEFAULT_LOADS),
+                            help='Loads of the grid, in minimum inverters (default: %s)' %
+                                 " ".join("%g" % l for l in nldm.DEFAULT_LOADS))
+    parserNLDM.add_argument('--step_time', metavar='TIME', type=float, default=nldm.DEFAULT_STEP_TIME,
+                            help='Max time step for transient simulation (default: %g)' % nldm.DEFAULT_STEP_TIME)
+    parserNLDM.add_argument('--force', action='store_true', default=False,
+                            help='Simulate even if there are cached tables for this .lib and grid')
+    parserNLDM.add_argument('--path', metavar='PATH', choices=PATHS, default=None,
+                            help='Also estimate the Tp of this path with the tables: (%(choices)s)')
+    parserNLDM.add_argument('--load', metavar='LOAD', type=load_type, default=32.0,
+                            help='Load of --path (default: 32.0)')
+    parserNLDM.set_defaults(func=do_nldm)
+
+    parserSTA = subparsers.add_parser('STA', help='Static timing analysis of a path with the logical effort '
+                                                  'optimal widths')
+    parserSTA.add_argument('path', metavar='PATH', choices=PATHS,
+                           help='Path to analyze: (%(choices)s)')
+    parserSTA.add_argument('--load', metavar='LOAD', type=load_type, default=32.0,
+                           help='Load of the path (default: 32.0)')
+    parserSTA.add_argument('--model', choices=['le', 'nldm'], default='le',
+                           help='Gate delay model: logical effort (CHAR results if any) or the NLDM tables '
+                                '(default: le)')
+    parserSTA.set_defaults(func=do_sta)
+
     parserPT = subparsers.add_parser('PT', help='Path Test')
     parserPT.add_argument('path', metavar='PATH', choices=PATHS,
                           help='Gate to test: (%(choices)s)')
     # load doesn't matter, but do need a value to instantiate the path
     parserPT.add_argument('--load', metavar='LOAD', type=load_type, required=False,
                            default=1.0, help=argparse.SUPPRESS)
+    add_logic_test_arguments(parserPT)
     parserPT.set_defaults(func=do_pt)
 
     args = parser.parse_args()
@@ -134,7 +686,24 @@ def main():
     else:
         logger.setLevel(logging.INFO);
 
-    args.func(args, logger)
+    for error in SPEC_ERRORS:
+        logger.warning("Skipping path description %s", error)
+
+    if (args.profile == None):
+        args.func(args, logger)
+        return
+
+    # Solo el proceso principal, los workers del SimPool no están en el perfil
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        args.func(args, logger)
+    finally:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        logger.info("Wrote profile to %s", args.profile)
+        if (logger.isEnabledFor(logging.VERBOSE)):
+            pstats.Stats(profiler, stream=sys.stdout).sort_stats('cumulative').print_stats(20)
 
 if __name__ == '__main__':
     main()